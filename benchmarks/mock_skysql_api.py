@@ -0,0 +1,197 @@
+"""
+Local fake of the SkySQL provisioning and copilot REST API for benchmarks.
+
+Every service points at the same database endpoint (by default the MySQL
+stand-in from mysql_standin.py), so execute_sql can be driven end to end
+without a SkySQL account. Launched services move from "pending_create" to
+"ready" after --provision-delay seconds. With --stream, chat answers are sent
+as server-sent events when the client accepts them; --chat-failures makes
+the first N chat requests fail with 503. --payload-bytes pads every service
+record, to benchmark large service lists. With --rate-limit, requests beyond
+that many per second are answered with 429 and a Retry-After header.
+"""
+import sys
+import time
+import uuid
+import asyncio
+import json
+import argparse
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+
+class FakeSkySQL:
+    def __init__(self, services: int, agents: int, latency: float, db_host: str, db_port: int,
+                 provision_delay: float, region: str = "eastus", chat_delay: float = 0.0,
+                 stream: bool = False, chat_failures: int = 0, payload_bytes: int = 0, rate_limit: int = 0):
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.window = (0, 0)
+        self.throttled = 0
+        self.padding = "x" * payload_bytes
+        self.chat_delay = chat_delay
+        self.stream = stream
+        self.chat_failures = chat_failures
+        self.chat_requests = 0
+        self.db_host = db_host
+        self.db_port = db_port
+        self.provision_delay = provision_delay
+        self.requests = 0
+        self.services = {}
+        for i in range(services):
+            self.add_service(f"bench-{i:05d}", "aws" if i % 3 else "azure", region if i % 2 else "us-east-1", ready_at=0)
+        self.agents = [
+            {"id": f"agent-{i}", "name": f"Bench agent {i}", "type": "dba" if i % 2 == 0 else "imdb",
+             "status": "ready", "datasource_id": f"ds-{i}", "description": "Benchmark agent"}
+            for i in range(agents)
+        ]
+
+    def add_service(self, name: str, provider: str, region: str, ready_at: float) -> dict:
+        service_id = f"dbpgf{uuid.uuid4().hex[:8]}"
+        service = {
+            "id": service_id,
+            "name": name,
+            "status": "ready",
+            "service_type": "transactional",
+            "provider": provider,
+            "region": region,
+            "version": "10.11.6-4",
+            "fqdn": self.db_host,
+            "endpoints": [{"ports": [{"name": "readwrite", "port": self.db_port}]}],
+            "created_on": 1700000000,
+            "description": self.padding,
+            "_ready_at": ready_at,
+        }
+        self.services[service_id] = service
+        return service
+
+    def public(self, service: dict) -> dict:
+        service = dict(service)
+        if service.pop("_ready_at") > time.monotonic():
+            service["status"] = "pending_create"
+        return service
+
+    async def delay(self):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def list_services(self, request: Request):
+        await self.delay()
+        return JSONResponse([self.public(s) for s in self.services.values()])
+
+    async def get_service(self, request: Request):
+        await self.delay()
+        service = self.services.get(request.path_params["service_id"])
+        if service is None:
+            return JSONResponse({"errors": [{"message": "not found"}]}, status_code=404)
+        return JSONResponse(self.public(service))
+
+    async def create_service(self, request: Request):
+        await self.delay()
+        body = await request.json()
+        service = self.add_service(body["name"], body.get("provider", "azure"), body.get("region", "eastus"),
+                                   ready_at=time.monotonic() + self.provision_delay)
+        return JSONResponse(self.public(service))
+
+    async def delete_service(self, request: Request):
+        await self.delay()
+        if self.services.pop(request.path_params["service_id"], None) is None:
+            return JSONResponse({"errors": [{"message": "not found"}]}, status_code=404)
+        return Response(status_code=202)
+
+    async def credentials(self, request: Request):
+        await self.delay()
+        if request.path_params["service_id"] not in self.services:
+            return JSONResponse({"errors": [{"message": "not found"}]}, status_code=404)
+        return JSONResponse({"username": "bench", "password": "bench: pass"})
+
+    async def allowlist(self, request: Request):
+        await self.delay()
+        return JSONResponse(await request.json())
+
+    async def list_agents(self, request: Request):
+        await self.delay()
+        return JSONResponse(self.agents)
+
+    async def chat(self, request: Request):
+        await self.delay()
+        body = await request.json()
+        self.chat_requests += 1
+        if self.chat_requests <= self.chat_failures:
+            return JSONResponse({"errors": [{"message": "unavailable"}]}, status_code=503)
+        answer = {"response": {
+            "content": f"Answer to: {body['prompt']}",
+            "sql_text": "SELECT 1",
+            "error_text": "",
+            "col_keys": [],
+        }}
+        if self.stream and "text/event-stream" in request.headers.get("accept", ""):
+            async def events():
+                words = answer["response"]["content"].split(" ")
+                for i, word in enumerate(words):
+                    await asyncio.sleep(self.chat_delay / len(words))
+                    yield f"data: {json.dumps({'content': word if i == 0 else ' ' + word})}\n\n"
+                yield f"data: {json.dumps(answer)}\n\n"
+            return StreamingResponse(events(), media_type="text/event-stream")
+        await asyncio.sleep(self.chat_delay)
+        return JSONResponse(answer)
+
+    async def limit_rate(self, request: Request, call_next):
+        """Answer 429 once more than rate_limit requests arrive in one second"""
+        if self.rate_limit:
+            second, count = self.window
+            now = int(time.monotonic())
+            count = count + 1 if now == second else 1
+            self.window = (now, count)
+            if count > self.rate_limit:
+                self.throttled += 1
+                return JSONResponse({"errors": [{"message": "rate limited"}]}, status_code=429,
+                                    headers={"Retry-After": "1"})
+        return await call_next(request)
+
+    async def checkip(self, request: Request):
+        return Response("127.0.0.1\n")
+
+    def app(self) -> Starlette:
+        app = Starlette(routes=[
+            Route("/provisioning/v1/services", self.list_services, methods=["GET"]),
+            Route("/provisioning/v1/services", self.create_service, methods=["POST"]),
+            Route("/provisioning/v1/services/{service_id}", self.get_service, methods=["GET"]),
+            Route("/provisioning/v1/services/{service_id}", self.delete_service, methods=["DELETE"]),
+            Route("/provisioning/v1/services/{service_id}/security/credentials", self.credentials, methods=["GET"]),
+            Route("/provisioning/v1/services/{service_id}/security/allowlist", self.allowlist, methods=["POST"]),
+            Route("/copilot/v1/agent/", self.list_agents, methods=["GET"]),
+            Route("/copilot/v1/chat/", self.chat, methods=["POST"]),
+            Route("/checkip", self.checkip, methods=["GET"]),
+        ])
+        app.add_middleware(BaseHTTPMiddleware, dispatch=self.limit_rate)
+        return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--services", type=int, default=20, help="number of services in the account")
+    parser.add_argument("--agents", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--db-host", default="127.0.0.1")
+    parser.add_argument("--db-port", type=int, default=3307)
+    parser.add_argument("--provision-delay", type=float, default=5.0)
+    parser.add_argument("--chat-delay", type=float, default=0.0, help="seconds each chat answer takes")
+    parser.add_argument("--stream", action="store_true", help="stream chat answers as server-sent events")
+    parser.add_argument("--chat-failures", type=int, default=0, help="fail the first N chat requests with 503")
+    parser.add_argument("--payload-bytes", type=int, default=0, help="extra bytes of padding in every service record")
+    parser.add_argument("--rate-limit", type=int, default=0, help="answer 429 beyond this many requests per second")
+    args = parser.parse_args()
+    fake = FakeSkySQL(args.services, args.agents, args.latency, args.db_host, args.db_port, args.provision_delay,
+                      chat_delay=args.chat_delay, stream=args.stream, chat_failures=args.chat_failures,
+                      payload_bytes=args.payload_bytes, rate_limit=args.rate_limit)
+    print(f"Fake SkySQL API on http://{args.host}:{args.port}", file=sys.stderr, flush=True)
+    uvicorn.run(fake.app(), host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,354 @@
+"""
+Minimal MySQL/MariaDB wire-protocol stand-in for benchmarks.
+
+Speaks just enough of the client/server protocol for pymysql: handshake
+(any credentials accepted, no TLS), COM_QUERY with text result sets and
+multi-statements, COM_PING, COM_INIT_DB, COM_RESET_CONNECTION, COM_QUIT and
+LOAD DATA LOCAL INFILE.
+
+Queries are answered from a handful of patterns:
+
+    SELECT ... FROM bench_rows_<N>      N generated rows (id, name, amount, created, note);
+                                        every 11th has the zero date in created
+    SELECT SLEEP(<seconds>)             sleeps, then returns 0; stopped early by KILL QUERY
+                                        or SET SESSION max_statement_time
+    KILL [QUERY] <thread id>            interrupts a SLEEP running on another connection
+    USE <db> / SELECT DATABASE()        the session's default database
+    EXPLAIN ...                         one plan row estimating bench_rows_<N> rows
+    SHOW TABLES / SHOW DATABASES        a fixed list
+    information_schema SCHEMATA/TABLES/COLUMNS/STATISTICS/KEY_COLUMN_USAGE
+                                        a synthetic catalog of --schema-tables tables;
+                                        CREATE/ALTER TABLE update it
+    LOAD DATA LOCAL INFILE ...          reads the file from the client, counts lines
+    INSERT/UPDATE/DELETE/DDL/SET/...    OK packet (INSERT counts its VALUES tuples)
+    anything else                       a single row with the value 1
+"""
+import re
+import sys
+import struct
+import asyncio
+import argparse
+import datetime
+
+# Column types
+T_LONGLONG = 0x08
+T_DOUBLE = 0x05
+T_DATETIME = 0x0c
+T_VAR_STRING = 0xfd
+
+CLIENT_LONG_PASSWORD = 1
+CLIENT_LONG_FLAG = 4
+CLIENT_CONNECT_WITH_DB = 8
+CLIENT_LOCAL_FILES = 128
+CLIENT_PROTOCOL_41 = 512
+CLIENT_TRANSACTIONS = 8192
+CLIENT_SECURE_CONNECTION = 32768
+CLIENT_MULTI_STATEMENTS = 1 << 16
+CLIENT_MULTI_RESULTS = 1 << 17
+CLIENT_PLUGIN_AUTH = 1 << 19
+
+CAPABILITIES = (CLIENT_LONG_PASSWORD | CLIENT_LONG_FLAG | CLIENT_CONNECT_WITH_DB | CLIENT_LOCAL_FILES
+                | CLIENT_PROTOCOL_41 | CLIENT_TRANSACTIONS | CLIENT_SECURE_CONNECTION
+                | CLIENT_MULTI_STATEMENTS | CLIENT_MULTI_RESULTS | CLIENT_PLUGIN_AUTH)
+
+STATUS_AUTOCOMMIT = 0x0002
+STATUS_MORE_RESULTS = 0x0008
+
+BENCH_COLUMNS = [("id", T_LONGLONG), ("name", T_VAR_STRING), ("amount", T_DOUBLE),
+                 ("created", T_DATETIME), ("note", T_VAR_STRING)]
+
+
+def lenenc_int(n: int) -> bytes:
+    if n < 251:
+        return bytes([n])
+    if n < 1 << 16:
+        return b"\xfc" + struct.pack("<H", n)
+    if n < 1 << 24:
+        return b"\xfd" + struct.pack("<I", n)[:3]
+    return b"\xfe" + struct.pack("<Q", n)
+
+
+def lenenc_str(value) -> bytes:
+    if value is None:
+        return b"\xfb"
+    if not isinstance(value, bytes):
+        value = str(value).encode()
+    return lenenc_int(len(value)) + value
+
+
+class Catalog:
+    """Synthetic information_schema contents shared by all sessions"""
+
+    def __init__(self, tables: int):
+        self.tables = {}
+        for name in ["bench_rows_10", "bench_rows_1000"] + [f"t_{i:05d}" for i in range(tables)]:
+            self.touch(name)
+
+    def touch(self, name: str):
+        self.tables[name] = datetime.datetime.now().replace(microsecond=0)
+
+    def selected(self, sql: str):
+        pairs = re.findall(r"\(\s*'([^']*)'\s*,\s*'([^']*)'\s*\)", sql)
+        names = sorted(self.tables)
+        if pairs:
+            names = [name for db, name in pairs if db == "bench" and name in self.tables]
+        return names
+
+    def answer(self, sql: str):
+        lowered = sql.lower()
+        if "information_schema.schemata" in lowered:
+            return [("SCHEMA_NAME", T_VAR_STRING)], [["bench"]]
+        if "information_schema.tables" in lowered:
+            cols = [(n, T_VAR_STRING) for n in ("TABLE_SCHEMA", "TABLE_NAME", "TABLE_TYPE", "ENGINE")]
+            cols += [("TABLE_ROWS", T_LONGLONG), ("CREATE_TIME", T_DATETIME), ("UPDATE_TIME", T_DATETIME),
+                     ("TABLE_COMMENT", T_VAR_STRING)]
+            return cols, [["bench", name, "BASE TABLE", "InnoDB", 1000, created.strftime("%Y-%m-%d %H:%M:%S"),
+                           None, ""] for name, created in sorted(self.tables.items())]
+        names = self.selected(sql)
+        if "information_schema.columns" in lowered:
+            cols = [(n, T_VAR_STRING) for n in ("TABLE_SCHEMA", "TABLE_NAME", "COLUMN_NAME", "COLUMN_TYPE",
+                                                 "IS_NULLABLE", "COLUMN_DEFAULT", "COLUMN_KEY", "EXTRA",
+                                                 "COLUMN_COMMENT")]
+            types = {"id": "bigint(20)", "name": "varchar(64)", "amount": "double", "created": "datetime",
+                     "note": "text"}
+            return cols, [["bench", name, col, types[col], "NO" if col == "id" else "YES", None,
+                           "PRI" if col == "id" else "", "", ""] for name in names for col, _ in BENCH_COLUMNS]
+        if "information_schema.statistics" in lowered:
+            cols = [(n, T_VAR_STRING) for n in ("TABLE_SCHEMA", "TABLE_NAME", "INDEX_NAME")]
+            cols += [("NON_UNIQUE", T_LONGLONG), ("COLUMN_NAME", T_VAR_STRING), ("INDEX_TYPE", T_VAR_STRING)]
+            return cols, [["bench", name, "PRIMARY", 0, "id", "BTREE"] for name in names]
+        if "information_schema.key_column_usage" in lowered:
+            cols = [(n, T_VAR_STRING) for n in ("TABLE_SCHEMA", "TABLE_NAME", "CONSTRAINT_NAME", "COLUMN_NAME",
+                                                 "REFERENCED_TABLE_SCHEMA", "REFERENCED_TABLE_NAME",
+                                                 "REFERENCED_COLUMN_NAME")]
+            return cols, [["bench", name, f"fk_{name}", "id", "bench", "bench_rows_10", "id"]
+                          for name in names if name.startswith("t_")]
+        return [("value", T_VAR_STRING)], []
+
+
+CATALOG = Catalog(0)
+
+
+def split_statements(sql: str):
+    return [s.strip() for s in sql.split(";") if s.strip()]
+
+
+class Session:
+    thread_ids = iter(range(1, 1 << 31))
+    # Open sessions by thread ID, for KILL
+    sessions = {}
+
+    def __init__(self, reader, writer, latency: float):
+        self.reader = reader
+        self.writer = writer
+        self.latency = latency
+        self.seq = 0
+        self.thread_id = next(self.thread_ids)
+        self.max_statement_time = 0.0
+        self.database = None
+        self.interrupted = asyncio.Event()
+        self.sessions[self.thread_id] = self
+
+    async def read_packet(self) -> bytes:
+        header = await self.reader.readexactly(4)
+        length = header[0] | header[1] << 8 | header[2] << 16
+        self.seq = (header[3] + 1) & 0xff
+        return await self.reader.readexactly(length)
+
+    def write_packet(self, payload: bytes):
+        self.writer.write(struct.pack("<I", len(payload))[:3] + bytes([self.seq]) + payload)
+        self.seq = (self.seq + 1) & 0xff
+
+    def ok(self, affected: int = 0, status: int = STATUS_AUTOCOMMIT):
+        self.write_packet(b"\x00" + lenenc_int(affected) + lenenc_int(0) + struct.pack("<HH", status, 0))
+
+    def eof(self, status: int = STATUS_AUTOCOMMIT):
+        self.write_packet(b"\xfe" + struct.pack("<HH", 0, status))
+
+    def error(self, code: int, message: str):
+        self.write_packet(b"\xff" + struct.pack("<H", code) + b"#HY000" + message.encode())
+
+    def result_set(self, columns, rows, status: int = STATUS_AUTOCOMMIT):
+        self.write_packet(lenenc_int(len(columns)))
+        for name, col_type in columns:
+            self.write_packet(b"".join([
+                lenenc_str("def"), lenenc_str("bench"), lenenc_str("t"), lenenc_str("t"),
+                lenenc_str(name), lenenc_str(name), b"\x0c",
+                struct.pack("<HIBHB", 33, 255, col_type, 0, 0), b"\x00\x00",
+            ]))
+        self.eof(status)
+        for row in rows:
+            self.write_packet(b"".join(lenenc_str(v) for v in row))
+        self.eof(status)
+
+    async def handshake(self):
+        salt = b"abcdefgh" + b"ijklmnopqrst"
+        payload = b"".join([
+            b"\x0a", b"10.11.0-MariaDB-standin\x00", struct.pack("<I", self.thread_id),
+            salt[:8], b"\x00", struct.pack("<H", CAPABILITIES & 0xffff), bytes([33]),
+            struct.pack("<H", STATUS_AUTOCOMMIT), struct.pack("<H", CAPABILITIES >> 16),
+            bytes([21]), b"\x00" * 10, salt[8:], b"\x00", b"mysql_native_password\x00",
+        ])
+        self.write_packet(payload)
+        await self.read_packet()
+        self.ok()
+        await self.writer.drain()
+
+    async def serve(self):
+        try:
+            await self.handshake()
+            while True:
+                packet = await self.read_packet()
+                command, body = packet[0], packet[1:]
+                if command == 0x01:  # COM_QUIT
+                    break
+                if command == 0x0e:  # COM_PING
+                    self.ok()
+                elif command == 0x02:  # COM_INIT_DB
+                    self.database = body.decode(errors="replace")
+                    self.ok()
+                elif command == 0x1f:  # COM_RESET_CONNECTION; keeps the database, like MySQL
+                    self.max_statement_time = 0.0
+                    self.ok()
+                elif command == 0x03:  # COM_QUERY
+                    await self.query(body.decode(errors="replace"))
+                else:
+                    self.error(1047, "Unknown command")
+                await self.writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.sessions.pop(self.thread_id, None)
+            self.writer.close()
+
+    async def query(self, sql: str):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        statements = split_statements(sql) or [""]
+        for i, statement in enumerate(statements):
+            status = STATUS_AUTOCOMMIT | (STATUS_MORE_RESULTS if i < len(statements) - 1 else 0)
+            failed = await self.statement(statement, status)
+            await self.writer.drain()
+            if failed:
+                break
+
+    async def sleep(self, seconds: float) -> bool:
+        """Sleep like SLEEP(); False if interrupted, after writing the error"""
+        limit = self.max_statement_time
+        self.interrupted.clear()
+        try:
+            await asyncio.wait_for(self.interrupted.wait(), min(seconds, limit) if limit else seconds)
+            self.error(1317, "Query execution was interrupted")
+            return False
+        except asyncio.TimeoutError:
+            if limit and limit < seconds:
+                self.error(1969, "Query execution was interrupted (max_statement_time exceeded)")
+                return False
+        return True
+
+    async def statement(self, sql: str, status: int) -> bool:
+        """Answer one statement; True if it failed"""
+        lowered = sql.lower()
+        verb = lowered.split(None, 1)[0] if lowered else ""
+        if verb == "load":
+            match = re.search(r"infile\s+'([^']*)'", sql, re.I)
+            self.write_packet(b"\xfb" + (match.group(1) if match else "").encode())
+            await self.writer.drain()
+            data = bytearray()
+            while True:
+                chunk = await self.read_packet()
+                if not chunk:
+                    break
+                data += chunk
+            lines = data.count(b"\n") + (1 if data and not data.endswith(b"\n") else 0)
+            self.ok(lines, status)
+            return False
+        if verb == "kill":
+            match = re.match(r"kill\s+(?:query\s+|connection\s+)?(\d+)", lowered)
+            target = self.sessions.get(int(match.group(1))) if match else None
+            if target is None:
+                self.error(1094, f"Unknown thread id: {match.group(1) if match else '?'}")
+                return True
+            target.interrupted.set()
+            self.ok(0, status)
+            return False
+        if verb == "use":
+            self.database = sql.split(None, 1)[1].strip("` ") if " " in sql else None
+            self.ok(0, status)
+            return False
+        if lowered.startswith("select database()"):
+            self.result_set([("DATABASE()", T_VAR_STRING)], [[self.database]], status)
+            return False
+        match = re.search(r"max_statement_time\s*=\s*([\d.]+)", lowered)
+        if verb == "set" and match:
+            self.max_statement_time = float(match.group(1))
+            self.ok(0, status)
+            return False
+        match = re.search(r"sleep\(\s*([\d.]+)\s*\)", lowered)
+        if match and verb != "explain":
+            if not await self.sleep(float(match.group(1))):
+                return True
+            self.result_set([("sleep", T_LONGLONG)], [[0]], status)
+            return False
+        match = re.search(r"bench_rows_(\d+)", lowered)
+        if verb == "explain":
+            estimate = int(match.group(1)) if match else 1
+            self.result_set([("id", T_LONGLONG), ("select_type", T_VAR_STRING), ("table", T_VAR_STRING),
+                             ("rows", T_LONGLONG)], [[1, "SIMPLE", "t", estimate]], status)
+            return False
+        if verb in ("select", "with") and match:
+            self.result_set(BENCH_COLUMNS, generate_rows(int(match.group(1))), status)
+            return False
+        if lowered.startswith("show tables"):
+            self.result_set([("Tables_in_bench", T_VAR_STRING)], [["bench_rows_10"], ["bench_rows_1000"]], status)
+            return False
+        if lowered.startswith("show databases"):
+            self.result_set([("Database", T_VAR_STRING)], [["bench"], ["information_schema"]], status)
+            return False
+        if verb == "insert":
+            self.ok(max(1, lowered.count("),") + 1), status)
+            return False
+        if verb in ("update", "delete", "replace"):
+            self.ok(1, status)
+            return False
+        if verb in ("select", "show", "describe", "desc", "with", "values"):
+            if "information_schema" in lowered:
+                self.result_set(*CATALOG.answer(sql), status)
+            else:
+                self.result_set([("1", T_LONGLONG)], [[1]], status)
+            return False
+        match = re.match(r"(create|alter)\s+table\s+(?:if\s+not\s+exists\s+)?`?(\w+)", lowered)
+        if match:
+            CATALOG.touch(match.group(2))
+        self.ok(0, status)
+        return False
+
+
+def generate_rows(count: int):
+    base = datetime.datetime(2024, 1, 1)
+    for i in range(1, count + 1):
+        # Every 11th row has a zero date, which pymysql returns as a str
+        created = "0000-00-00 00:00:00" if i % 11 == 0 else (base + datetime.timedelta(seconds=i)).strftime(
+            "%Y-%m-%d %H:%M:%S")
+        yield [i, f"row-{i}", f"{i * 1.25:.2f}", created, None if i % 7 == 0 else f"note | {i}"]
+
+
+async def main(host: str, port: int, latency: float):
+    async def handle(reader, writer):
+        await Session(reader, writer, latency).serve()
+
+    server = await asyncio.start_server(handle, host, port)
+    print(f"MySQL stand-in listening on {host}:{server.sockets[0].getsockname()[1]}", file=sys.stderr, flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3307)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every query")
+    parser.add_argument("--schema-tables", type=int, default=50, help="extra tables in the synthetic catalog")
+    args = parser.parse_args()
+    CATALOG = Catalog(args.schema_tables)
+    asyncio.run(main(args.host, args.port, args.latency))
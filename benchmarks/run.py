@@ -0,0 +1,287 @@
+"""
+Benchmarks for the SkySQL MCP Server.
+
+Starts the fake SkySQL API (mock_skysql_api.py) and the MySQL stand-in
+(mysql_standin.py) on free local ports. Then, for every transport and
+scenario, it starts a fresh server and drives its tools with a FastMCP
+client. The server runs as server_stdio.py over stdio, or as server_http.py
+over streamable HTTP. For each run it reports throughput, p50/p99 latency and
+the server's peak RSS (read from /proc, so Linux only).
+
+    python benchmarks/run.py
+    python benchmarks/run.py --transport http --scenario concurrent_sql --concurrency 32
+    python benchmarks/run.py --api-latency 0.05 --services 5000 --payload-bytes 2000 --json results.json
+
+Scenarios:
+
+    large_result          execute_sql returning --rows rows in one page
+    concurrent_sql        small execute_sql queries from --concurrency callers at once
+    list_services         list_services with refresh, over --services services
+    list_services_cached  list_services served from the service inventory
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import statistics
+import subprocess
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+from fastmcp import Client
+from fastmcp.client.transports import PythonStdioTransport, StreamableHttpTransport
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SERVER_DIR = os.path.join(os.path.dirname(HERE), "src", "mcp-server")
+
+# Tool results starting with one of these count as failed calls
+ERROR_PREFIXES = ("Failed to", "SQL Error", "Database connection error", "Unsupported format", "Service with ID",
+                  "Missing connection details")
+
+
+class Scenario:
+    def __init__(self, tool: str, arguments: Callable[[argparse.Namespace, str], Dict[str, Any]],
+                 concurrent: bool = False):
+        self.tool = tool
+        self.arguments = arguments
+        # Run with --concurrency callers instead of one
+        self.concurrent = concurrent
+
+
+SCENARIOS = {
+    "large_result": Scenario("execute_sql", lambda args, service_id: {
+        "service_id": service_id, "sql_query": f"SELECT * FROM bench_rows_{args.rows}",
+        "max_rows": args.rows, "max_bytes": 1 << 30, "format": args.format, "use_cache": False,
+    }),
+    "concurrent_sql": Scenario("execute_sql", lambda args, service_id: {
+        "service_id": service_id, "sql_query": "SELECT * FROM bench_rows_10", "use_cache": False,
+    }, concurrent=True),
+    "list_services": Scenario("list_services", lambda args, service_id: {
+        "limit": args.services, "refresh": True,
+    }),
+    "list_services_cached": Scenario("list_services", lambda args, service_id: {
+        "limit": 50,
+    }, concurrent=True),
+}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 20.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Nothing listening on port {port} after {timeout:g} s")
+
+
+def start(args: List[str], cwd: str, env: Optional[Dict[str, str]] = None) -> subprocess.Popen:
+    log = open(os.path.join(cwd, os.path.basename(args[0]) + ".log"), "ab")
+    return subprocess.Popen([sys.executable] + args, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def stop(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def child_pid(script: str) -> Optional[int]:
+    """PID of the child process of this one running script, if /proc is available"""
+    if not os.path.isdir("/proc"):
+        return None
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            with open(f"/proc/{entry}/cmdline", "rb") as f:
+                cmdline = f.read()
+        except (OSError, ValueError, IndexError):
+            continue
+        if ppid == os.getpid() and script.encode() in cmdline:
+            return int(entry)
+    return None
+
+
+def peak_rss(pid: Optional[int]) -> Optional[int]:
+    """Peak resident set size of a process in bytes, or None where /proc is unavailable"""
+    if pid is None:
+        return None
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def server_env(args: argparse.Namespace, api_url: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "SKYSQL_API_KEY": "bench",
+        "SKYSQL_API_URL": api_url,
+        "PYTHONUNBUFFERED": "1",
+    })
+    if args.result_cache:
+        env["SKYSQL_RESULT_CACHE"] = "true"
+    return env
+
+
+async def drive(client: Client, scenario: Scenario, arguments: Dict[str, Any], iterations: int,
+                concurrency: int, warmup: int) -> Dict[str, Any]:
+    """Call the scenario's tool iterations times from concurrency callers and time every call"""
+    for _ in range(warmup):
+        await client.call_tool(scenario.tool, arguments, raise_on_error=False)
+
+    latencies: List[float] = []
+    errors: List[str] = []
+    remaining = iterations
+
+    async def caller():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            result = await client.call_tool(scenario.tool, arguments, raise_on_error=False)
+            latencies.append(time.perf_counter() - started)
+            text = "".join(getattr(block, "text", "") for block in result.content)
+            if result.is_error or text.startswith(ERROR_PREFIXES):
+                errors.append(text[:200])
+
+    started = time.perf_counter()
+    await asyncio.gather(*(caller() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "calls": len(latencies),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "elapsed_s": round(elapsed, 3),
+        "throughput": round(len(latencies) / elapsed, 1),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 2),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+async def run_stdio(scenario: Scenario, arguments: Dict[str, Any], args: argparse.Namespace,
+                    env: Dict[str, str], workdir: str) -> Dict[str, Any]:
+    script = os.path.join(SERVER_DIR, "server_stdio.py")
+    with open(os.path.join(workdir, "server-stdio.log"), "a") as log:
+        transport = PythonStdioTransport(script, env=env, cwd=workdir, keep_alive=False, log_file=log)
+        async with Client(transport) as client:
+            result = await drive(client, scenario, arguments, args.iterations,
+                                 args.concurrency if scenario.concurrent else 1, args.warmup)
+            result["peak_rss_mb"] = _megabytes(peak_rss(child_pid(script)))
+    return result
+
+
+async def run_http(scenario: Scenario, arguments: Dict[str, Any], args: argparse.Namespace,
+                   env: Dict[str, str], workdir: str) -> Dict[str, Any]:
+    port = free_port()
+    server = start([os.path.join(SERVER_DIR, "server_http.py")], workdir,
+                   dict(env, PORT=str(port), MCP_HOST="127.0.0.1"))
+    try:
+        wait_for_port(port)
+        async with Client(StreamableHttpTransport(f"http://127.0.0.1:{port}/mcp")) as client:
+            result = await drive(client, scenario, arguments, args.iterations,
+                                 args.concurrency if scenario.concurrent else 1, args.warmup)
+            result["peak_rss_mb"] = _megabytes(peak_rss(server.pid))
+    finally:
+        stop(server)
+    return result
+
+
+def _megabytes(size: Optional[int]) -> Optional[float]:
+    return None if size is None else round(size / (1 << 20), 1)
+
+
+def print_table(results: List[Dict[str, Any]]):
+    columns = ["transport", "scenario", "calls", "errors", "throughput", "p50_ms", "p99_ms", "peak_rss_mb"]
+    rows = [[str(r.get(c, "")) if r.get(c) is not None else "n/a" for c in columns] for r in results]
+    widths = [max(len(c), *(len(row[i]) for row in rows)) for i, c in enumerate(columns)]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(v.ljust(w) for v, w in zip(row, widths)))
+    for r in results:
+        if r.get("first_error"):
+            print(f"{r['transport']}/{r['scenario']}: first error: {r['first_error']}", file=sys.stderr)
+
+
+async def main(args: argparse.Namespace) -> int:
+    workdir = tempfile.mkdtemp(prefix="skysql-bench-")
+    db_port, api_port = free_port(), free_port()
+    stand_ins = [
+        start([os.path.join(HERE, "mysql_standin.py"), "--port", str(db_port), "--latency", str(args.db_latency)],
+              workdir),
+        start([os.path.join(HERE, "mock_skysql_api.py"), "--port", str(api_port), "--db-port", str(db_port),
+               "--services", str(args.services), "--latency", str(args.api_latency),
+               "--payload-bytes", str(args.payload_bytes)], workdir),
+    ]
+    results = []
+    try:
+        wait_for_port(db_port)
+        wait_for_port(api_port)
+        api_url = f"http://127.0.0.1:{api_port}"
+        async with httpx.AsyncClient(base_url=api_url) as api:
+            service_id = (await api.get("/provisioning/v1/services")).json()[0]["id"]
+        env = server_env(args, api_url)
+
+        transports = ["stdio", "http"] if args.transport == "both" else [args.transport]
+        for transport in transports:
+            for name in args.scenario or list(SCENARIOS):
+                scenario = SCENARIOS[name]
+                run = run_stdio if transport == "stdio" else run_http
+                print(f"Running {name} over {transport}...", file=sys.stderr, flush=True)
+                result = await run(scenario, scenario.arguments(args, service_id), args, env, workdir)
+                results.append(dict(transport=transport, scenario=name, **result))
+    finally:
+        for process in stand_ins:
+            stop(process)
+
+    print_table(results)
+    print(f"Logs in {workdir}", file=sys.stderr)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"settings": vars(args), "results": results}, f, indent=2)
+    return 1 if any(r["errors"] for r in results) else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--transport", choices=["stdio", "http", "both"], default="both")
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS),
+                        help="scenario to run; repeat for several (default: all)")
+    parser.add_argument("--iterations", type=int, default=200, help="timed calls per scenario")
+    parser.add_argument("--warmup", type=int, default=3, help="untimed calls before each scenario")
+    parser.add_argument("--concurrency", type=int, default=16, help="callers at once in concurrent scenarios")
+    parser.add_argument("--rows", type=int, default=20000, help="rows returned by large_result")
+    parser.add_argument("--format", default="json", help="result format for large_result")
+    parser.add_argument("--services", type=int, default=1000, help="services in the fake account")
+    parser.add_argument("--payload-bytes", type=int, default=500, help="padding added to every service record")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="seconds added to every API request")
+    parser.add_argument("--db-latency", type=float, default=0.0, help="seconds added to every query")
+    parser.add_argument("--result-cache", action="store_true", help="run the server with SKYSQL_RESULT_CACHE on")
+    parser.add_argument("--json", help="also write the results to this file")
+    sys.exit(asyncio.run(main(parser.parse_args())))
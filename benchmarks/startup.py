@@ -0,0 +1,162 @@
+"""
+Startup benchmark for the SkySQL MCP Server.
+
+Measures what a user waits for when an MCP client launches server_stdio.py:
+the time from spawning the process to the answer to the first tools/list
+request, over stdio. It also imports server.py under `python -X importtime`
+and lists the slowest modules it pulls in. The best of --runs runs counts,
+since startup time only ever gets worse through noise.
+
+Exits with status 1 if startup or import time is over its limit, so it can
+run as a check after changes:
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --runs 10 --max-startup-ms 2000 --max-import-ms 1500
+    python benchmarks/startup.py --prewarm --json startup.json
+
+With --prewarm, the server runs against the fake SkySQL API
+(mock_skysql_api.py) with SKYSQL_PREWARM on, and pre-warms the credentials
+of one service. This checks that pre-warming stays off the handshake's
+path.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+from fastmcp import Client
+from fastmcp.client.transports import PythonStdioTransport
+
+from run import HERE, SERVER_DIR, free_port, start, stop, wait_for_port
+
+
+def server_env(api_url: str, prewarm_service: Optional[str]) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "SKYSQL_API_KEY": "bench",
+        "SKYSQL_API_URL": api_url,
+        "SKYSQL_PREWARM": "true" if prewarm_service else "false",
+        "SKYSQL_PREWARM_SERVICES": prewarm_service or "",
+        "PYTHONUNBUFFERED": "1",
+    })
+    return env
+
+
+async def time_startup(env: Dict[str, str], workdir: str) -> Tuple[float, float, int]:
+    """Seconds from spawn to initialize done and to the tools/list answer, and the number of tools"""
+    script = os.path.join(SERVER_DIR, "server_stdio.py")
+    with open(os.path.join(workdir, "server-stdio.log"), "a") as log:
+        transport = PythonStdioTransport(script, env=env, cwd=workdir, keep_alive=False, log_file=log)
+        started = time.perf_counter()
+        async with Client(transport) as client:
+            initialized = time.perf_counter() - started
+            tools = await client.list_tools()
+            listed = time.perf_counter() - started
+    return initialized, listed, len(tools)
+
+
+def import_times(env: Dict[str, str], workdir: str, top: int) -> Tuple[float, List[Tuple[str, float]]]:
+    """Seconds to import server.py, and the modules with the largest cumulative import times"""
+    code = f"import sys; sys.path.insert(0, {SERVER_DIR!r}); import server"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=workdir, env=env,
+                            capture_output=True, text=True, timeout=120)
+    if result.returncode:
+        raise RuntimeError(f"Importing server.py failed:\n{result.stderr[-2000:]}")
+    modules: List[Tuple[str, float]] = []
+    total = 0.0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        try:
+            seconds = int(cumulative) / 1e6
+        except ValueError:
+            # The header line
+            continue
+        if name.strip() == "server":
+            total = seconds
+        # Imported by server.py itself, not by one of its dependencies
+        elif name.startswith("   ") and not name.startswith("    "):
+            modules.append((name.strip(), seconds))
+    modules.sort(key=lambda m: m[1], reverse=True)
+    return total, modules[:top]
+
+
+async def main(args: argparse.Namespace) -> int:
+    workdir = tempfile.mkdtemp(prefix="skysql-startup-")
+    processes: List[subprocess.Popen] = []
+    # Nothing listens here unless --prewarm starts the fake API
+    api_url = f"http://127.0.0.1:{free_port()}"
+    prewarm_service = None
+    try:
+        if args.prewarm:
+            db_port, api_port = free_port(), free_port()
+            processes.append(start([os.path.join(HERE, "mysql_standin.py"), "--port", str(db_port)], workdir))
+            processes.append(start([os.path.join(HERE, "mock_skysql_api.py"), "--port", str(api_port),
+                                    "--db-port", str(db_port)], workdir))
+            wait_for_port(db_port)
+            wait_for_port(api_port)
+            api_url = f"http://127.0.0.1:{api_port}"
+            async with httpx.AsyncClient(base_url=api_url) as api:
+                prewarm_service = (await api.get("/provisioning/v1/services")).json()[0]["id"]
+        env = server_env(api_url, prewarm_service)
+
+        # Untimed: writes the bytecode caches, as an installed server would have them
+        await time_startup(env, workdir)
+        runs = []
+        for _ in range(args.runs):
+            runs.append(await time_startup(env, workdir))
+        import_total, slowest = import_times(env, workdir, args.top)
+    finally:
+        for process in processes:
+            stop(process)
+
+    initialized = min(r[0] for r in runs)
+    listed = min(r[1] for r in runs)
+    result: Dict[str, Any] = {
+        "runs": args.runs,
+        "tools": runs[0][2],
+        "initialize_ms": round(initialized * 1000, 1),
+        "tools_list_ms": round(listed * 1000, 1),
+        "tools_list_worst_ms": round(max(r[1] for r in runs) * 1000, 1),
+        "import_ms": round(import_total * 1000, 1),
+        "slowest_imports_ms": {name: round(seconds * 1000, 1) for name, seconds in slowest},
+    }
+    print(f"spawn to initialize:  {result['initialize_ms']} ms")
+    print(f"spawn to tools/list:  {result['tools_list_ms']} ms (worst {result['tools_list_worst_ms']} ms, "
+          f"{result['tools']} tools)")
+    print(f"import server.py:     {result['import_ms']} ms")
+    for name, ms in result["slowest_imports_ms"].items():
+        print(f"  {name:<20}  {ms} ms")
+    print(f"Logs in {workdir}", file=sys.stderr)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"settings": vars(args), "result": result}, f, indent=2)
+
+    failed: List[str] = []
+    if result["tools_list_ms"] > args.max_startup_ms:
+        failed.append(f"spawn to tools/list took {result['tools_list_ms']} ms, over {args.max_startup_ms:g} ms")
+    if result["import_ms"] > args.max_import_ms:
+        failed.append(f"importing server.py took {result['import_ms']} ms, over {args.max_import_ms:g} ms")
+    for message in failed:
+        print(message, file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--runs", type=int, default=5, help="timed server launches")
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to list")
+    parser.add_argument("--max-startup-ms", type=float, default=3000,
+                        help="fail if spawn to tools/list takes longer (best run)")
+    parser.add_argument("--max-import-ms", type=float, default=2500, help="fail if importing server.py takes longer")
+    parser.add_argument("--prewarm", action="store_true",
+                        help="start the server with SKYSQL_PREWARM on, against the fake SkySQL API")
+    parser.add_argument("--json", help="also write the result to this file")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -29,6 +29,6 @@ if not exist "uv.lock" (
 
 :: Start the MCP server
 echo Starting MCP server...
-uv run python src/mcp-server/server.py
+uv run python src/mcp-server/server_stdio.py
 
 endlocal
@@ -29,4 +29,4 @@ fi
 
 # Start the MCP server
 echo "Starting MCP server..."
-uv run python src/mcp-server/server.py
+uv run python src/mcp-server/server_stdio.py
@@ -0,0 +1,63 @@
+"""
+Registry of SkySQL copilot agents.
+
+The agent list is fetched once per TTL, and concurrent refreshes collapse
+into one request. An unknown agent ID only triggers a refresh if the list is
+older than negative_ttl; otherwise the ID is remembered as unknown for
+negative_ttl seconds, so a burst of bad IDs cannot cause a burst of refreshes.
+"""
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from cache import SingleFlight, TTLCache
+
+
+class AgentRegistry:
+    """Agents indexed by id"""
+
+    def __init__(self, fetch_all: Callable[[], Awaitable[List[Dict[str, Any]]]], ttl: float = 300.0,
+                 negative_ttl: float = 60.0):
+        self.fetch_all = fetch_all
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.refreshes = 0
+        self._agents: Dict[str, Dict[str, Any]] = {}
+        self._fetched_at: Optional[float] = None
+        self._unknown = TTLCache(max_size=1024, ttl=negative_ttl)
+        self._flight = SingleFlight()
+
+    def __len__(self) -> int:
+        return len(self._agents)
+
+    @property
+    def age(self) -> float:
+        return float("inf") if self._fetched_at is None else time.monotonic() - self._fetched_at
+
+    async def _refresh(self):
+        agents = await self.fetch_all()
+        self._agents = {agent['id']: agent for agent in agents}
+        self._fetched_at = time.monotonic()
+        self.refreshes += 1
+
+    async def refresh(self):
+        await self._flight.do("agents", self._refresh)
+
+    async def agents(self, refresh: bool = False) -> List[Dict[str, Any]]:
+        if refresh or self.age > self.ttl:
+            await self.refresh()
+        return list(self._agents.values())
+
+    async def get(self, agent_id: str) -> Optional[Dict[str, Any]]:
+        """Look up one agent, refreshing the list only when it is stale or may be missing a new agent"""
+        if self.age <= self.ttl:
+            agent = self._agents.get(agent_id)
+            if agent is not None:
+                return agent
+            if agent_id in self._unknown or self.age <= self.negative_ttl:
+                self._unknown.set(agent_id, True)
+                return None
+        await self.refresh()
+        agent = self._agents.get(agent_id)
+        if agent is None:
+            self._unknown.set(agent_id, True)
+        return agent
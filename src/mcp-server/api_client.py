@@ -0,0 +1,160 @@
+"""
+Shared HTTP clients for the SkySQL API.
+
+One long-lived httpx.AsyncClient is kept per API key so that tool calls reuse
+pooled keep-alive (and, when available, HTTP/2) connections to the API instead
+of paying DNS, TCP and TLS setup on every call. Clients are closed from the
+server lifespan on shutdown.
+
+Every request goes through ThrottledTransport (see throttle.py), which
+applies the rate and concurrency limits and retries throttled requests, and
+then through MeteredTransport, which records the latency of each attempt (up
+to the end of the body), its body size and failures per endpoint.
+"""
+import os
+import time
+import logging
+from typing import Dict
+
+import httpx
+
+import metrics
+from throttle import ThrottledTransport
+
+logger = logging.getLogger(__name__)
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def endpoint_label(request: httpx.Request, api_host: str) -> str:
+    """The request path with service IDs replaced, so every service shares one label"""
+    parts = request.url.path.split("/")
+    for i in range(1, len(parts)):
+        if parts[i - 1] == "services" and parts[i]:
+            parts[i] = "{service_id}"
+    path = "/".join(parts)
+    return path if request.url.host == api_host else f"{request.url.host}{path}"
+
+
+class _MeteredStream(httpx.AsyncByteStream):
+    """Response body that records the request once it has been read and closed"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, method: str, endpoint: str, status: int, started: float):
+        self._stream = stream
+        self._method = method
+        self._endpoint = endpoint
+        self._status = status
+        self._started = started
+        self._bytes = 0
+        self._recorded = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            self._bytes += len(chunk)
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._recorded:
+                self._recorded = True
+                metrics.api_seconds.observe(time.perf_counter() - self._started, method=self._method,
+                                            endpoint=self._endpoint, status=self._status)
+                metrics.api_response_bytes.observe(self._bytes, method=self._method, endpoint=self._endpoint)
+
+
+class MeteredTransport(httpx.AsyncBaseTransport):
+    """Wraps a transport to record request metrics"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, api_host: str):
+        self._transport = transport
+        # Requests to other hosts are labelled with the host as well
+        self._api_host = api_host
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        endpoint = endpoint_label(request, self._api_host)
+        started = time.perf_counter()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except Exception as e:
+            metrics.api_errors.inc(method=request.method, endpoint=endpoint, error=type(e).__name__)
+            raise
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_MeteredStream(response.stream, request.method, endpoint, response.status_code, started),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+class ClientManager:
+    """Keeps one httpx.AsyncClient per API key"""
+
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._throttles: Dict[str, ThrottledTransport] = {}
+
+    def _create(self, api_key: str) -> httpx.AsyncClient:
+        http2 = os.getenv("SKYSQL_HTTP2", "true").lower() in ("1", "true", "yes")
+        if http2 and not _http2_available():
+            logger.warning("HTTP/2 requested but the h2 package is not installed, using HTTP/1.1")
+            http2 = False
+
+        limits = httpx.Limits(
+            max_connections=int(os.getenv("SKYSQL_HTTP_MAX_CONNECTIONS", "100")),
+            max_keepalive_connections=int(os.getenv("SKYSQL_HTTP_MAX_KEEPALIVE", "20")),
+            keepalive_expiry=float(os.getenv("SKYSQL_HTTP_KEEPALIVE_EXPIRY", "30")),
+        )
+        base_url = httpx.URL(os.getenv("SKYSQL_API_URL", "https://api.skysql.com"))
+        logger.info(f"Creating SkySQL API client (http2={http2}, max_connections={limits.max_connections})")
+        transport = ThrottledTransport(
+            MeteredTransport(httpx.AsyncHTTPTransport(http2=http2, limits=limits), base_url.host),
+            lambda request: endpoint_label(request, base_url.host),
+        )
+        self._throttles[api_key] = transport
+        return httpx.AsyncClient(
+            base_url=base_url,
+            headers={"X-API-Key": api_key, "Content-Type": "application/json"},
+            timeout=float(os.getenv("SKYSQL_HTTP_TIMEOUT", "30")),
+            transport=transport,
+        )
+
+    def get(self, api_key: str) -> httpx.AsyncClient:
+        client = self._clients.get(api_key)
+        if client is None or client.is_closed:
+            client = self._create(api_key)
+            self._clients[api_key] = client
+        return client
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Throttling state per endpoint class: requests summed over API keys, and the lowest limit"""
+        totals: Dict[str, Dict[str, float]] = {}
+        for transport in self._throttles.values():
+            for name, stats in transport.stats().items():
+                total = totals.get(name)
+                if total is None:
+                    totals[name] = dict(stats)
+                    continue
+                total["queued"] += stats["queued"]
+                total["in_flight"] += stats["in_flight"]
+                total["concurrency_limit"] = min(total["concurrency_limit"], stats["concurrency_limit"])
+        return totals
+
+    async def close_all(self):
+        self._throttles = {}
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+
+api_clients = ClientManager()
@@ -0,0 +1,133 @@
+"""
+Batch and multi-statement execution on a single pooled connection.
+
+Three modes, all run on the DB executor and optionally wrapped in one
+transaction:
+
+    statements   a list of statements executed one at a time
+    script       a multi-statement script sent in one round trip, with every
+                 result set read through nextset()
+    bulk         one parameterized statement run with executemany(), which
+                 pymysql rewrites into multi-row INSERTs
+"""
+import time
+import functools
+from typing import Any, Callable, List, Optional, Sequence
+
+from db_pool import mysql_connector
+from results import FETCH_BATCH, QueryPage, fetch_page
+
+
+class StatementResult:
+    """Outcome of one statement (or one result set of a script)"""
+
+    def __init__(self, label: str, page: Optional[QueryPage] = None, error: Optional[str] = None,
+                 elapsed: float = 0.0):
+        self.label = label
+        self.page = page
+        self.error = error
+        self.elapsed = elapsed
+
+
+class BatchResult:
+    def __init__(self):
+        self.results: List[StatementResult] = []
+        self.transaction = False
+        self.committed = False
+        self.elapsed = 0.0
+
+    @property
+    def failed(self) -> bool:
+        return any(r.error for r in self.results)
+
+
+def _read_result(cursor, max_rows: int, max_bytes: int) -> QueryPage:
+    if not cursor.description:
+        return QueryPage(affected_rows=cursor.rowcount)
+    page = fetch_page(cursor, max_rows, max_bytes)
+    if page.more:
+        # Skip the rest of the result set without holding it in memory
+        while cursor.fetchmany(FETCH_BATCH):
+            pass
+        page.pending = []
+    return page
+
+
+def _error(e: Exception) -> str:
+    return f"SQL Error [{e.args[0]}]: {e.args[1]}"
+
+
+def run_batch(conn, statements: Optional[Sequence[str]] = None, script: Optional[str] = None,
+              bulk_sql: Optional[str] = None, bulk_params: Optional[Sequence[Sequence[Any]]] = None,
+              transaction: bool = False, stop_on_error: bool = True,
+              max_rows: int = 1000, max_bytes: int = 1000000) -> BatchResult:
+    """Run statements, then a script, then a bulk statement; called on the DB executor.
+
+    In a transaction the first error rolls everything back and stops the batch.
+    """
+    batch = BatchResult()
+    batch.transaction = transaction
+    started = time.perf_counter()
+    stop_on_error = stop_on_error or transaction
+    if transaction:
+        conn.begin()
+
+    with conn.cursor(mysql_connector.cursors.SSCursor) as cursor:
+        for sql in statements or ():
+            # A statement list entry may itself hold several statements, each
+            # reported on its own
+            label = functools.partial(_entry_label, sql)
+            if not _execute(cursor, sql, label, batch, max_rows, max_bytes) and stop_on_error:
+                break
+
+        if script and not (batch.failed and stop_on_error):
+            _execute(cursor, script, _script_label, batch, max_rows, max_bytes)
+
+    if bulk_sql and not (batch.failed and stop_on_error):
+        start = time.perf_counter()
+        try:
+            with conn.cursor() as cursor:
+                affected = cursor.executemany(bulk_sql, bulk_params or [])
+            batch.results.append(StatementResult(bulk_sql, QueryPage(affected_rows=affected or 0),
+                                                 elapsed=time.perf_counter() - start))
+        except mysql_connector.Error as e:
+            batch.results.append(StatementResult(bulk_sql, error=_error(e), elapsed=time.perf_counter() - start))
+
+    if transaction:
+        if batch.failed:
+            conn.rollback()
+        else:
+            conn.commit()
+            batch.committed = True
+    batch.elapsed = time.perf_counter() - started
+    return batch
+
+
+def _entry_label(sql: str, index: int) -> str:
+    return sql if index == 1 else f"{sql} (result {index})"
+
+
+def _script_label(index: int) -> str:
+    return f"Script statement {index}"
+
+
+def _execute(cursor, sql: str, label: Callable[[int], str], batch: BatchResult, max_rows: int, max_bytes: int) -> bool:
+    """Run sql and add a result for each of its result sets; False if it failed"""
+    # The server runs the statements back to back, so each result's time is
+    # measured from the arrival of the previous one
+    index = 1
+    start = time.perf_counter()
+    try:
+        cursor.execute(sql)
+        while True:
+            page = _read_result(cursor, max_rows, max_bytes)
+            now = time.perf_counter()
+            batch.results.append(StatementResult(label(index), page, elapsed=now - start))
+            start = now
+            index += 1
+            if not cursor.nextset():
+                return True
+    except mysql_connector.Error as e:
+        # The server stops executing statements at the first error
+        batch.results.append(StatementResult(label(index), error=_error(e), elapsed=time.perf_counter() - start))
+        return False
@@ -0,0 +1,177 @@
+"""
+Bulk loading of CSV, TSV and NDJSON data with LOAD DATA LOCAL INFILE.
+
+The source (a local file or an in-memory payload) is read in batches of
+batch_size rows. Each batch is written to a temporary tab-separated file in
+LOAD DATA's escaped format and sent with LOAD DATA LOCAL INFILE, so neither
+the source nor a giant INSERT statement is ever held in memory. If the server
+refuses LOAD DATA LOCAL, the remaining batches are inserted with
+executemany() instead.
+"""
+import io
+import os
+import csv
+import json
+import time
+import logging
+import tempfile
+from typing import Any, Iterator, List, Optional
+
+from db_pool import mysql_connector
+
+logger = logging.getLogger(__name__)
+
+SOURCE_FORMATS = ("csv", "tsv", "ndjson")
+
+# Errors meaning LOAD DATA LOCAL is disabled on the server or the client side
+_LOAD_DATA_REFUSED = (
+    1148,  # ER_NOT_ALLOWED_COMMAND
+    1227,  # ER_SPECIFIC_ACCESS_DENIED_ERROR
+    2068,  # CR_LOAD_DATA_LOCAL_INFILE_REJECTED
+    3948,  # ER_CLIENT_LOCAL_FILES_DISABLED
+)
+
+_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r", "\0": "\\0"})
+
+
+def default_batch_size() -> int:
+    return int(os.getenv("SKYSQL_BULK_LOAD_BATCH_SIZE", "10000"))
+
+
+def quote_identifier(name: str) -> str:
+    """Backtick-quote a possibly schema-qualified identifier such as db.table"""
+    return ".".join("`" + part.replace("`", "``") + "`" for part in name.split("."))
+
+
+def resolve_path(file_path: str) -> str:
+    """Return the absolute path, enforcing SKYSQL_BULK_LOAD_DIR when it is set"""
+    path = os.path.realpath(os.path.expanduser(file_path))
+    allowed = os.getenv("SKYSQL_BULK_LOAD_DIR")
+    if allowed:
+        allowed = os.path.realpath(os.path.expanduser(allowed))
+        if os.path.commonpath([path, allowed]) != allowed:
+            raise ValueError(f"file_path must be inside {allowed}")
+    if not os.path.isfile(path):
+        raise ValueError(f"File not found: {file_path}")
+    return path
+
+
+class Source:
+    """Rows read from a file or payload, as lists of strings (None for NULL)"""
+
+    def __init__(self, fmt: str, file_path: Optional[str] = None, data: Optional[str] = None,
+                 columns: Optional[List[str]] = None, has_header: bool = True):
+        if fmt not in SOURCE_FORMATS:
+            raise ValueError(f"Unsupported format '{fmt}'. Use one of: {', '.join(SOURCE_FORMATS)}")
+        self.fmt = fmt
+        self._stream = open(file_path, newline="", encoding="utf-8") if file_path else io.StringIO(data or "", newline="")
+        self.columns = columns
+        self._rows = self._ndjson_rows() if fmt == "ndjson" else self._delimited_rows(has_header)
+
+    def _delimited_rows(self, has_header: bool) -> Iterator[List[Optional[str]]]:
+        reader = csv.reader(self._stream, delimiter="\t" if self.fmt == "tsv" else ",")
+        if has_header:
+            header = next(reader, None)
+            if self.columns is None:
+                self.columns = header
+        return ([None if v == "\\N" else v for v in row] for row in reader if row)
+
+    def _ndjson_rows(self) -> Iterator[List[Optional[str]]]:
+        for line in self._stream:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if self.columns is None:
+                self.columns = list(record)
+            yield [_ndjson_value(record.get(name)) for name in self.columns]
+
+    def read_batch(self, size: int) -> List[List[Optional[str]]]:
+        batch = []
+        for row in self._rows:
+            batch.append(row)
+            if len(batch) >= size:
+                break
+        return batch
+
+    def close(self):
+        self._stream.close()
+
+
+def _ndjson_value(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return str(value)
+
+
+class BulkLoader:
+    """Loads a Source into a table one batch at a time; every method runs on the DB executor"""
+
+    def __init__(self, source: Source, table: str, batch_size: int):
+        self.source = source
+        self.table = table
+        self.batch_size = batch_size
+        self.method = "load_data"
+        self.fallback_reason: Optional[str] = None
+        # Rows reported by the server, and rows read from the source
+        self.rows = 0
+        self.rows_read = 0
+        self.batches = 0
+        self.started = time.perf_counter()
+
+    @property
+    def rows_per_second(self) -> float:
+        elapsed = time.perf_counter() - self.started
+        return self.rows / elapsed if elapsed > 0 else 0.0
+
+    def _column_list(self) -> str:
+        if not self.source.columns:
+            return ""
+        return " (" + ", ".join(quote_identifier(c) for c in self.source.columns) + ")"
+
+    def load_next_batch(self, conn) -> int:
+        """Load the next batch and return the number of source rows it held, 0 once the source is exhausted"""
+        batch = self.source.read_batch(self.batch_size)
+        if not batch:
+            return 0
+        if self.method == "load_data":
+            try:
+                loaded = self._load_data(conn, batch)
+            except mysql_connector.Error as e:
+                if e.args[0] not in _LOAD_DATA_REFUSED:
+                    raise
+                logger.info(f"LOAD DATA LOCAL refused ({e.args[0]}), falling back to batched inserts")
+                self.method = "insert"
+                self.fallback_reason = f"[{e.args[0]}] {e.args[1]}"
+                loaded = self._insert(conn, batch)
+        else:
+            loaded = self._insert(conn, batch)
+        self.rows += loaded
+        self.rows_read += len(batch)
+        self.batches += 1
+        return len(batch)
+
+    def _load_data(self, conn, batch: List[List[Optional[str]]]) -> int:
+        fd, path = tempfile.mkstemp(prefix="skysql-load-", suffix=".tsv")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+                f.writelines(
+                    "\t".join("\\N" if v is None else v.translate(_ESCAPES) for v in row) + "\n"
+                    for row in batch
+                )
+            sql = (f"LOAD DATA LOCAL INFILE {conn.escape(path)} INTO TABLE {quote_identifier(self.table)} "
+                   f"CHARACTER SET utf8mb4 FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' "
+                   f"LINES TERMINATED BY '\\n'{self._column_list()}")
+            with conn.cursor() as cursor:
+                return cursor.execute(sql)
+        finally:
+            os.unlink(path)
+
+    def _insert(self, conn, batch: List[List[Optional[str]]]) -> int:
+        placeholders = ", ".join(["%s"] * len(batch[0]))
+        sql = f"INSERT INTO {quote_identifier(self.table)}{self._column_list()} VALUES ({placeholders})"
+        with conn.cursor() as cursor:
+            return cursor.executemany(sql, batch) or 0
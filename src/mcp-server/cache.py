@@ -0,0 +1,194 @@
+"""
+In-memory caching helpers shared by the server's tools.
+"""
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Set
+
+
+class TTLCache:
+    """Least-recently-used cache whose entries expire after a time-to-live"""
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # key -> (expires_at, value), least recently used first
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and entry[0] > time.monotonic()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+class ResultCache:
+    """Query results keyed by service, bounded by total size and evicted least recently used first.
+
+    Every entry carries the tags (table names) it was computed from, so a
+    write can drop exactly the results that depend on the tables it touched.
+    Keys must be tuples whose first element is the service id.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: float = 60.0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        # key -> (expires_at, size, tags, value), least recently used first
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        # service_id -> tag -> keys
+        self._tags: Dict[str, Dict[str, Set[tuple]]] = {}
+        # Bumped on every invalidation, so a result read while a write was
+        # running is not stored afterwards
+        self._generations: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: tuple) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[3]
+
+    def generation(self, service_id: str) -> int:
+        return self._generations.get(service_id, 0)
+
+    def set(self, key: tuple, value: str, tags: Iterable[str], generation: Optional[int] = None):
+        """Store a result; generation is the value of generation() from before the query ran"""
+        if generation is not None and generation != self.generation(key[0]):
+            return
+        size = len(value)
+        if size > self.max_bytes // 4:
+            # One huge result would flush most of the cache
+            return
+        self._remove(key)
+        tags = frozenset(tags)
+        self._entries[key] = (time.monotonic() + self.ttl, size, tags, value)
+        self.bytes += size
+        service_tags = self._tags.setdefault(key[0], {})
+        for tag in tags:
+            service_tags.setdefault(tag, set()).add(key)
+        while self.bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key: tuple):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.bytes -= entry[1]
+        service_tags = self._tags.get(key[0], {})
+        for tag in entry[2]:
+            keys = service_tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del service_tags[tag]
+        if not service_tags:
+            self._tags.pop(key[0], None)
+
+    def invalidate_tags(self, service_id: str, tags: Iterable[str]):
+        """Drop every result of a service that depends on any of the tags"""
+        self._generations[service_id] = self.generation(service_id) + 1
+        service_tags = self._tags.get(service_id, {})
+        keys = set()
+        for tag in tags:
+            keys |= service_tags.get(tag, set())
+        for key in keys:
+            self._remove(key)
+        self.invalidations += len(keys)
+
+    def invalidate_service(self, service_id: str):
+        self._generations[service_id] = self.generation(service_id) + 1
+        keys = [key for key in self._entries if key[0] == service_id]
+        for key in keys:
+            self._remove(key)
+        self.invalidations += len(keys)
+
+    def clear(self):
+        self._entries.clear()
+        self._tags.clear()
+        self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+class SingleFlight:
+    """Collapses concurrent calls for the same key into a single call.
+
+    The call runs in its own task, so a caller that gives up (for example
+    because its tool call was cancelled) does not cancel it for the others.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the exception as retrieved even if every caller went away
+        if not task.cancelled():
+            task.exception()
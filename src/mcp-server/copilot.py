@@ -0,0 +1,122 @@
+"""
+Calls to the SkySQL copilot chat endpoint.
+
+The request asks for a server-sent event stream. If the API answers with
+one, each partial chunk of text is passed to on_text as it arrives;
+otherwise the JSON body is read as before. The whole call, retries
+included, runs under one deadline. Failures where the request is known not
+to have produced an answer are retried with exponential backoff. These are
+connection errors, 429 and 502-504 responses, and dropped connections before
+any text was streamed. Asking a question has no side effects, so a retry
+cannot do harm.
+"""
+import json
+import time
+import random
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+CHAT_PATH = "/copilot/v1/chat/"
+
+RETRY_STATUSES = (429, 502, 503, 504)
+
+OnText = Callable[[str, int], Awaitable[None]]
+
+
+class _Stream:
+    """Text relayed so far by one attempt"""
+
+    def __init__(self, on_text: Optional[OnText]):
+        self.on_text = on_text
+        self.chars = 0
+
+    async def emit(self, text: str):
+        self.chars += len(text)
+        if self.on_text is not None:
+            await self.on_text(text, self.chars)
+
+
+def _retryable(e: Exception, stream: _Stream) -> bool:
+    if stream.chars:
+        # Retrying would repeat text the caller has already seen
+        return False
+    if isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout, httpx.RemoteProtocolError)):
+        return True
+    return isinstance(e, httpx.HTTPStatusError) and e.response.status_code in RETRY_STATUSES
+
+
+def _retry_after(e: Exception) -> Optional[float]:
+    if isinstance(e, httpx.HTTPStatusError):
+        try:
+            return float(e.response.headers.get("Retry-After", ""))
+        except ValueError:
+            return None
+    return None
+
+
+async def _read_events(response: httpx.Response, stream: _Stream) -> Dict[str, Any]:
+    parts = []
+    final = None
+    async for line in response.aiter_lines():
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if not data or data == "[DONE]":
+            continue
+        event = json.loads(data)
+        if "response" in event:
+            final = event
+            continue
+        text = event.get("content") or event.get("delta") or ""
+        if text:
+            parts.append(text)
+            await stream.emit(text)
+    if final is None:
+        final = {"response": {"content": "".join(parts), "sql_text": "", "error_text": ""}}
+    return final
+
+
+async def _chat_once(client: httpx.AsyncClient, payload: Dict[str, Any], timeout: float,
+                     stream: _Stream) -> Dict[str, Any]:
+    async with client.stream("POST", CHAT_PATH, json=payload, timeout=timeout,
+                             headers={"Accept": "text/event-stream, application/json"}) as response:
+        logger.debug(f"Response status: {response.status_code}")
+        if response.is_error:
+            await response.aread()
+            response.raise_for_status()
+        if response.headers.get("content-type", "").startswith("text/event-stream"):
+            return await _read_events(response, stream)
+        await response.aread()
+        logger.debug(f"Response body: {response.text}")
+        return response.json()
+
+
+async def chat(client: httpx.AsyncClient, payload: Dict[str, Any], timeout: float, retries: int = 2,
+               backoff: float = 0.5, on_text: Optional[OnText] = None) -> Dict[str, Any]:
+    """Send a chat request and return the response JSON.
+
+    Raises httpx.TimeoutException once timeout seconds have passed in total.
+    """
+    deadline = time.monotonic() + timeout
+    attempt = 0
+    while True:
+        remaining = deadline - time.monotonic()
+        stream = _Stream(on_text)
+        try:
+            return await asyncio.wait_for(_chat_once(client, payload, remaining, stream), remaining)
+        except asyncio.TimeoutError:
+            raise httpx.TimeoutException(f"No complete answer within {timeout:g} seconds")
+        except httpx.HTTPError as e:
+            if attempt >= retries or not _retryable(e, stream):
+                raise
+            delay = _retry_after(e) or backoff * 2 ** attempt * random.uniform(0.8, 1.2)
+            if time.monotonic() + delay >= deadline:
+                raise
+            attempt += 1
+            logger.warning(f"Chat request failed ({str(e)}), retry {attempt}/{retries} in {delay:.1f} s")
+            await asyncio.sleep(delay)
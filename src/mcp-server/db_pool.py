@@ -0,0 +1,507 @@
+"""
+Connection pooling for SkySQL database services.
+
+pymysql is a blocking driver, so every connect, query and close is run on a
+dedicated thread pool instead of the asyncio event loop. Connections are kept
+per service_id and reused across tool calls to avoid paying the TLS handshake
+for every query.
+
+A statement that runs too long, or whose tool call is cancelled, is stopped
+on the server with KILL QUERY, sent over a separate short-lived connection;
+the driver offers no way to interrupt a query from another thread.
+"""
+import os
+import ssl
+import sys
+import time
+import asyncio
+import logging
+import functools
+import threading
+import importlib.util
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, Callable
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def _lazy_import(name: str):
+    """Import a module whose code only runs when one of its attributes is first read"""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+# Loading pymysql is left out of the stdio server's startup, until the first
+# query. Every module uses it through this name. LazyLoader is not thread-safe
+# before Python 3.12, but the first read is always on the event loop, at the
+# latest when get_pool() builds the connection arguments
+mysql_connector = _lazy_import("pymysql")
+
+# Not among pymysql's command constants
+COM_RESET_CONNECTION = 0x1f
+
+
+class PoolError(Exception):
+    """Raised when a connection cannot be checked out of a pool"""
+
+
+class QueryTimeout(Exception):
+    """Raised when a statement is killed for running longer than its timeout"""
+
+
+def _connect_kwargs(host: str, port: int, user: str, password: str, ssl_context: ssl.SSLContext) -> Dict[str, Any]:
+    return {
+        "host": host,
+        "port": int(port),
+        "user": user,
+        "password": password,
+        "ssl": ssl_context,
+        "local_infile": True,
+        "client_flag": mysql_connector.constants.CLIENT.LOCAL_FILES | mysql_connector.constants.CLIENT.MULTI_STATEMENTS,
+        "autocommit": True,
+        "connect_timeout": int(os.getenv("SKYSQL_DB_CONNECT_TIMEOUT", "10")),
+        # Last resort for a server that stops answering; unset by default since
+        # a long query sends nothing until it is done
+        "read_timeout": int(os.getenv("SKYSQL_DB_READ_TIMEOUT", "0")) or None,
+    }
+
+
+class PooledConnection:
+    """A pymysql connection checked out of a ConnectionPool.
+
+    Every call on the underlying connection goes through call(), which holds a
+    lock so that a connection abandoned mid-query (for example when the tool
+    call is cancelled) is only closed once the executor thread is done with it.
+    """
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.released_at = time.monotonic()
+        # Server-side statement time limit set on the session, 0 for none
+        self.time_limit = 0.0
+        # net_write_timeout raised on the session, 0 for the server default
+        self.write_timeout = 0
+        self._lock = threading.Lock()
+
+    @property
+    def open(self) -> bool:
+        return self.raw.open
+
+    @property
+    def thread_id(self) -> int:
+        """Server connection ID, as used by KILL"""
+        return self.raw.server_thread_id[0]
+
+    def call(self, func: Callable, *args, **kwargs):
+        with self._lock:
+            return func(self.raw, *args, **kwargs)
+
+
+class ConnectionPool:
+    """Pool of open connections to a single database service"""
+
+    def __init__(self, service_id: str, connect_kwargs: Dict[str, Any], executor: ThreadPoolExecutor,
+                 min_size: int = 0, max_size: int = 10, idle_timeout: float = 300.0,
+                 max_waiters: int = 32, acquire_timeout: float = 30.0, ping_interval: float = 5.0):
+        self.service_id = service_id
+        self.connect_kwargs = connect_kwargs
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.max_waiters = max_waiters
+        self.acquire_timeout = acquire_timeout
+        self.ping_interval = ping_interval
+        self._executor = executor
+        # Most recently released connection on the right
+        self._idle = deque()
+        self._slots = asyncio.Semaphore(max_size)
+        self._in_use = 0
+        self._waiting = 0
+        self._closed = False
+        self._kills = set()
+        self._recycling = set()
+
+    @property
+    def size(self) -> int:
+        return len(self._idle) + self._in_use
+
+    def stats(self) -> Dict[str, int]:
+        return {"idle": len(self._idle), "in_use": self._in_use, "waiting": self._waiting}
+
+    async def run(self, conn: PooledConnection, func: Callable, *args, **kwargs):
+        """Run func(raw_connection, *args, **kwargs) on the database executor"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(conn.call, func, *args, **kwargs))
+
+    async def run_killable(self, conn: PooledConnection, timeout: Optional[float], func: Callable, *args):
+        """Like run(), but the statement is killed on the server if the call times out or is cancelled.
+
+        Raises QueryTimeout after timeout seconds. Either way the connection
+        is still busy until the killed statement returns, so it should be
+        released with discard=True.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, functools.partial(conn.call, func, *args))
+        try:
+            # Shielded: a timeout must not leave the executor call unobserved
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            metrics.queries_killed.inc(reason="timeout")
+            await self.kill_query(conn)
+            raise QueryTimeout(f"Query cancelled after {timeout:g} seconds")
+        except asyncio.CancelledError:
+            if not future.done():
+                metrics.queries_killed.inc(reason="cancelled")
+                # The caller is being cancelled, so the kill cannot be awaited
+                task = loop.create_task(self.kill_query(conn))
+                self._kills.add(task)
+                task.add_done_callback(self._kills.discard)
+            raise
+
+    async def kill_query(self, conn: PooledConnection):
+        """Stop the statement running on conn, using a separate connection"""
+        # Not on the database executor, which may be full of the very queries
+        # that need killing
+        try:
+            await asyncio.to_thread(_kill_query, self.connect_kwargs, conn.thread_id)
+        except mysql_connector.Error as e:
+            logger.warning(f"Failed to kill query on service {self.service_id}: {str(e)}")
+
+    async def set_time_limit(self, conn: PooledConnection, seconds: float, write_timeout: int = 0):
+        """Have the server abort statements on conn that run longer than seconds (0 for no limit).
+
+        A write_timeout above the session's raises net_write_timeout, the
+        seconds the server waits for the client to read on in a result set.
+        """
+        raise_write = write_timeout > conn.write_timeout
+        if conn.time_limit == seconds and not raise_write:
+            return
+        write_timeout = write_timeout if raise_write else 0
+        try:
+            await self.run(conn, _set_session_limits, seconds if conn.time_limit != seconds else None, write_timeout)
+        except mysql_connector.OperationalError:
+            raise
+        except mysql_connector.Error as e:
+            # Servers without either variable still get the client-side timeout
+            logger.debug(f"Cannot set a statement time limit on service {self.service_id}: {str(e)}")
+            if write_timeout:
+                await self.run(conn, _set_session_limits, None, write_timeout)
+        conn.time_limit = seconds
+        conn.write_timeout = max(conn.write_timeout, write_timeout)
+
+    async def _connect(self) -> PooledConnection:
+        loop = asyncio.get_running_loop()
+        raw = await loop.run_in_executor(self._executor, functools.partial(mysql_connector.connect, **self.connect_kwargs))
+        return PooledConnection(raw)
+
+    def _discard(self, conn: PooledConnection):
+        metrics.connections_discarded.inc()
+        # An unread unbuffered result would otherwise be drained row by row,
+        # on whichever thread garbage collects its cursor
+        result = getattr(conn.raw, "_result", None)
+        if result is not None:
+            result.unbuffered_active = False
+        # Not awaited: closing waits for any call still running on the connection
+        self._executor.submit(conn.call, _close_quietly)
+
+    async def acquire(self) -> PooledConnection:
+        """Check out a healthy connection, opening a new one if none are idle"""
+        if self._closed:
+            raise PoolError(f"Connection pool for service {self.service_id} is closed")
+        if self._slots.locked() and self._waiting >= self.max_waiters:
+            raise PoolError(f"Too many queries waiting for a connection to service {self.service_id}")
+
+        self._waiting += 1
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            raise PoolError(f"Timed out after {self.acquire_timeout} seconds waiting for a connection to service {self.service_id}")
+        finally:
+            self._waiting -= 1
+            metrics.pool_wait_seconds.observe(time.perf_counter() - started)
+
+        self._in_use += 1
+        try:
+            while self._idle:
+                conn = self._idle.pop()
+                idle_for = time.monotonic() - conn.released_at
+                if idle_for > self.idle_timeout:
+                    self._discard(conn)
+                    continue
+                if idle_for > self.ping_interval:
+                    try:
+                        await self.run(conn, _ping)
+                    except mysql_connector.Error:
+                        logger.debug(f"Discarding stale connection to service {self.service_id}")
+                        self._discard(conn)
+                        continue
+                metrics.connection_checkouts.inc(outcome="reused")
+                return conn
+            logger.debug(f"Opening new connection to service {self.service_id}")
+            conn = await self._connect()
+            metrics.connection_checkouts.inc(outcome="opened")
+            return conn
+        except BaseException:
+            self._in_use -= 1
+            self._slots.release()
+            raise
+
+    async def release(self, conn: PooledConnection, discard: bool = False):
+        """Return a connection to the pool, or close it if it can no longer be reused.
+
+        A reusable connection is only handed out again once its session has
+        been reset, so that nothing a caller set on it (USE, SET, user
+        variables, temporary tables, locks) carries over to the next one. The
+        reset runs in the background, off the caller's response path, and the
+        connection counts as in use until it is done.
+        """
+        if discard or self._closed or not conn.open:
+            self._in_use -= 1
+            try:
+                self._discard(conn)
+            finally:
+                self._slots.release()
+            return
+        task = asyncio.get_running_loop().create_task(self._recycle(conn))
+        self._recycling.add(task)
+        task.add_done_callback(self._recycling.discard)
+
+    async def _recycle(self, conn: PooledConnection):
+        time_limit, write_timeout = conn.time_limit, conn.write_timeout
+        try:
+            if await self.run(conn, _reset):
+                # The reset put the server's defaults back. Restore the limits
+                # the last caller set, since the next one most likely asks for
+                # the same and then has nothing to send
+                conn.time_limit = 0.0
+                conn.write_timeout = 0
+                await self.set_time_limit(conn, time_limit, write_timeout)
+                if not self._closed:
+                    conn.released_at = time.monotonic()
+                    self._idle.append(conn)
+                    return
+        except mysql_connector.Error:
+            pass
+        except BaseException:
+            self._discard(conn)
+            raise
+        finally:
+            self._in_use -= 1
+            self._slots.release()
+        self._discard(conn)
+
+    @asynccontextmanager
+    async def connection(self):
+        """Check out a connection for the duration of the block.
+
+        The connection is closed instead of reused if the block fails with
+        anything other than an ordinary SQL error, since it may be mid-query
+        or broken.
+        """
+        conn = await self.acquire()
+        discard = False
+        try:
+            yield conn
+        except mysql_connector.OperationalError:
+            discard = True
+            raise
+        except mysql_connector.Error:
+            raise
+        except BaseException:
+            discard = True
+            raise
+        finally:
+            await self.release(conn, discard=discard)
+
+    async def fill(self):
+        """Open connections until the pool holds at least min_size"""
+        while not self._closed and self.size < self.min_size and not self._slots.locked():
+            await self._slots.acquire()
+            try:
+                self._idle.appendleft(await self._connect())
+            finally:
+                self._slots.release()
+
+    def prune(self):
+        """Close connections that have been idle longer than idle_timeout, keeping min_size"""
+        now = time.monotonic()
+        while len(self._idle) > self.min_size and now - self._idle[0].released_at > self.idle_timeout:
+            self._discard(self._idle.popleft())
+
+    def close(self):
+        self._closed = True
+        while self._idle:
+            self._discard(self._idle.pop())
+
+
+def _ping(conn):
+    conn.ping(reconnect=False)
+
+
+def _reset_connection(conn):
+    """Send COM_RESET_CONNECTION, which pymysql has no public call for.
+
+    Uses the private Connection._execute_command and _read_ok_packet, checked
+    against pymysql 0.10.1, 1.0.2, 1.0.3 and 1.1.0 to 1.1.2.
+    """
+    conn._execute_command(COM_RESET_CONNECTION, b"")
+    conn._read_ok_packet()
+
+
+def _reset(conn) -> bool:
+    """Return a session to the state of a new connection; False if it cannot be"""
+    # Rolls back, unlocks tables, drops temporary tables and resets user and
+    # session variables, autocommit included
+    _reset_connection(conn)
+    if conn.db:
+        conn.select_db(conn.db)
+        return True
+    # The reset keeps the database chosen with USE, and there is no way back
+    # to having none
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT DATABASE()")
+        return cursor.fetchone()[0] is None
+
+
+def _set_session_limits(conn, time_limit: Optional[float], write_timeout: int):
+    """Set the statement time limit, unless None, and net_write_timeout, unless 0, in one statement"""
+    assignments, args = [], []
+    if time_limit is not None:
+        if "mariadb" in conn.get_server_info().lower():
+            assignments.append("max_statement_time = %s")
+            args.append(time_limit)
+        else:
+            # MySQL only limits SELECT statements, in milliseconds
+            assignments.append("max_execution_time = %s")
+            args.append(int(time_limit * 1000))
+    if write_timeout:
+        assignments.append("net_write_timeout = %s")
+        args.append(write_timeout)
+    with conn.cursor() as cursor:
+        cursor.execute("SET SESSION " + ", ".join(assignments), args)
+
+
+def _kill_query(connect_kwargs: Dict[str, Any], thread_id: int):
+    conn = mysql_connector.connect(**connect_kwargs)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("KILL QUERY %s", (thread_id,))
+    except mysql_connector.Error as e:
+        # 1094: the statement finished and the connection is gone already
+        if e.args[0] != mysql_connector.constants.ER.NO_SUCH_THREAD:
+            raise
+    finally:
+        _close_quietly(conn)
+
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+class PoolManager:
+    """Keeps one ConnectionPool per service_id"""
+
+    def __init__(self):
+        self._pools: Dict[str, ConnectionPool] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._ssl_context: Optional[ssl.SSLContext] = None
+        self._reaper: Optional[asyncio.Task] = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv("SKYSQL_DB_EXECUTOR_WORKERS", "32")),
+                thread_name_prefix="skysql-db"
+            )
+        return self._executor
+
+    @property
+    def ssl_context(self) -> ssl.SSLContext:
+        # Shared by every connection; same checks as ssl_verify_cert=True
+        # (certificate verified, hostname not)
+        if self._ssl_context is None:
+            context = ssl.create_default_context()
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_REQUIRED
+            self._ssl_context = context
+        return self._ssl_context
+
+    def get_pool(self, service_id: str, host: str, port: int, user: str, password: str) -> ConnectionPool:
+        """Return the pool for a service, replacing it if its connection details have changed"""
+        connect_kwargs = _connect_kwargs(host, port, user, password, self.ssl_context)
+        pool = self._pools.get(service_id)
+        if pool is not None and pool.connect_kwargs == connect_kwargs:
+            return pool
+        if pool is not None:
+            logger.info(f"Connection details changed for service {service_id}, replacing pool")
+            pool.close()
+
+        pool = ConnectionPool(
+            service_id,
+            connect_kwargs,
+            self.executor,
+            min_size=int(os.getenv("SKYSQL_DB_POOL_MIN_SIZE", "0")),
+            max_size=int(os.getenv("SKYSQL_DB_POOL_MAX_SIZE", "10")),
+            idle_timeout=float(os.getenv("SKYSQL_DB_POOL_IDLE_TIMEOUT", "300")),
+            max_waiters=int(os.getenv("SKYSQL_DB_POOL_MAX_WAITERS", "32")),
+            acquire_timeout=float(os.getenv("SKYSQL_DB_POOL_ACQUIRE_TIMEOUT", "30")),
+            ping_interval=float(os.getenv("SKYSQL_DB_POOL_PING_INTERVAL", "5")),
+        )
+        self._pools[service_id] = pool
+        self._start_reaper()
+        return pool
+
+    def _start_reaper(self):
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.get_running_loop().create_task(self._reap())
+
+    async def _reap(self):
+        while self._pools:
+            for pool in list(self._pools.values()):
+                try:
+                    pool.prune()
+                    await pool.fill()
+                except mysql_connector.Error as e:
+                    logger.warning(f"Failed to maintain pool for service {pool.service_id}: {str(e)}")
+            await asyncio.sleep(30)
+
+    def stats(self) -> Dict[str, int]:
+        """Connection counts summed over every pool"""
+        totals = {"pools": len(self._pools), "idle": 0, "in_use": 0, "waiting": 0}
+        for pool in self._pools.values():
+            for name, value in pool.stats().items():
+                totals[name] += value
+        return totals
+
+    def close_pool(self, service_id: str):
+        pool = self._pools.pop(service_id, None)
+        if pool is not None:
+            pool.close()
+
+    def close_all(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        for service_id in list(self._pools):
+            self.close_pool(service_id)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+db_pools = PoolManager()
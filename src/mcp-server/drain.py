@@ -0,0 +1,50 @@
+"""
+Graceful shutdown for tool calls in flight.
+
+DrainMiddleware counts the tool calls that are running. On shutdown the
+server lifespan calls drain(): new tool calls are refused from then on,
+and it waits (up to a timeout) for the running ones to finish before the
+connection pools they use are closed.
+"""
+import asyncio
+import logging
+
+from fastmcp.exceptions import ToolError
+from fastmcp.server.middleware import Middleware
+
+logger = logging.getLogger(__name__)
+
+
+class DrainMiddleware(Middleware):
+    """Tracks tool calls in flight and refuses new ones once draining"""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.draining = False
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    async def on_call_tool(self, context, call_next):
+        if self.draining:
+            raise ToolError("The server is shutting down; retry the call")
+        self.in_flight += 1
+        self._idle.clear()
+        try:
+            return await call_next(context)
+        finally:
+            self.in_flight -= 1
+            if not self.in_flight:
+                self._idle.set()
+
+    async def drain(self, timeout: float) -> bool:
+        """Refuse new tool calls and wait for running ones; False if some are still running after timeout"""
+        self.draining = True
+        if not self.in_flight:
+            return True
+        logger.info(f"Waiting up to {timeout:g} s for {self.in_flight} tool calls to finish")
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            logger.warning(f"{self.in_flight} tool calls still running after {timeout:g} s, shutting down anyway")
+            return False
@@ -0,0 +1,102 @@
+"""
+Running one query on many services at once.
+
+Targets run concurrently up to a limit, each under its own timeout. A target
+that fails or times out is recorded with its error and never affects the
+others. When every target returns the same columns, the pages are merged
+into one result with a leading service_id column.
+"""
+import time
+import asyncio
+import fnmatch
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from db_pool import mysql_connector
+from results import QueryPage
+
+
+class TargetResult:
+    """Outcome of the query on one service"""
+
+    def __init__(self, service_id: str, name: Optional[str] = None):
+        self.service_id = service_id
+        self.name = name
+        self.page: Optional[QueryPage] = None
+        self.error: Optional[str] = None
+        # ok, error, timeout or skipped
+        self.status = "pending"
+        self.elapsed = 0.0
+
+    @property
+    def label(self) -> str:
+        return f"{self.name} ({self.service_id})" if self.name else self.service_id
+
+    def summary(self) -> Dict[str, Any]:
+        summary = {
+            "service_id": self.service_id,
+            "name": self.name,
+            "status": self.status,
+            "elapsed_ms": round(self.elapsed * 1000, 3),
+        }
+        if self.error:
+            summary["error"] = self.error
+        if self.page is not None:
+            if self.page.columns is None:
+                summary["affected_rows"] = self.page.affected_rows
+            else:
+                summary["rows"] = len(self.page.rows)
+                summary["truncated"] = self.page.more
+        return summary
+
+
+def match_services(services: List[Dict[str, Any]], name: Optional[str] = None,
+                   region: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Services whose name matches a glob pattern (case-insensitive) and whose region matches exactly"""
+    matched = []
+    for service in services:
+        if name and not fnmatch.fnmatchcase(service.get("name", "").lower(), name.lower()):
+            continue
+        if region and service.get("region") != region:
+            continue
+        matched.append(service)
+    return matched
+
+
+async def run_all(targets: List[TargetResult], query: Callable[[str], Awaitable[QueryPage]],
+                  concurrency: int, timeout: float):
+    """Run query(service_id) for every pending target, filling in its page or error"""
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run_one(target: TargetResult):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                target.page = await asyncio.wait_for(query(target.service_id), timeout)
+                target.status = "ok"
+            except asyncio.TimeoutError:
+                target.status = "timeout"
+                target.error = f"Timed out after {timeout:g} s"
+            except Exception as e:
+                target.status = "error"
+                target.error = str(e)
+            target.elapsed = time.perf_counter() - started
+
+    await asyncio.gather(*(run_one(t) for t in targets if t.status == "pending"))
+
+
+def merge_pages(targets: List[TargetResult]) -> Optional[QueryPage]:
+    """One page holding every successful target's rows, tagged by service_id.
+
+    Returns None if there are no result sets or their columns or types differ.
+    """
+    pages = [(t.service_id, t.page) for t in targets if t.page is not None and t.page.columns is not None]
+    if not pages:
+        return None
+    columns, types = pages[0][1].columns, pages[0][1].column_types
+    if any(page.columns != columns or page.column_types != types for _, page in pages):
+        return None
+    merged = QueryPage(columns=["service_id"] + list(columns),
+                       column_types=[mysql_connector.constants.FIELD_TYPE.VAR_STRING] + list(types))
+    for service_id, page in pages:
+        merged.rows.extend((service_id,) + tuple(row) for row in page.rows)
+    return merged
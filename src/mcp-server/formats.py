@@ -0,0 +1,197 @@
+"""
+Serializers for execute_sql result pages.
+
+Rows are transposed into columns once and every column gets a single
+converter chosen from its MySQL field type, so no format has to inspect and
+stringify values cell by cell.
+
+    markdown   Markdown table (the default), with | and newlines escaped
+    json       {"columns": [...], "rows": [{column: value, ...}, ...]}
+    columnar   {"columns": [...], "data": [[column 0 values], [column 1 values], ...]}
+    csv        RFC 4180 CSV with a header row
+    arrow      Arrow IPC stream, base64 encoded in a JSON envelope (needs pyarrow)
+"""
+import io
+import csv
+import json
+import base64
+import datetime
+import functools
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from db_pool import mysql_connector
+
+FORMATS = ("markdown", "json", "columnar", "csv", "arrow")
+
+
+@functools.lru_cache(maxsize=None)
+def _type_names() -> Dict[int, str]:
+    FIELD_TYPE = mysql_connector.constants.FIELD_TYPE
+    return {
+        FIELD_TYPE.TINY: "integer", FIELD_TYPE.SHORT: "integer", FIELD_TYPE.LONG: "integer",
+        FIELD_TYPE.LONGLONG: "integer", FIELD_TYPE.INT24: "integer", FIELD_TYPE.YEAR: "integer",
+        FIELD_TYPE.FLOAT: "float", FIELD_TYPE.DOUBLE: "float",
+        FIELD_TYPE.DECIMAL: "decimal", FIELD_TYPE.NEWDECIMAL: "decimal",
+        FIELD_TYPE.DATE: "date", FIELD_TYPE.NEWDATE: "date",
+        FIELD_TYPE.DATETIME: "datetime", FIELD_TYPE.TIMESTAMP: "datetime",
+        FIELD_TYPE.TIME: "time",
+        FIELD_TYPE.BIT: "bit",
+        FIELD_TYPE.JSON: "json",
+        FIELD_TYPE.TINY_BLOB: "blob", FIELD_TYPE.MEDIUM_BLOB: "blob",
+        FIELD_TYPE.LONG_BLOB: "blob", FIELD_TYPE.BLOB: "blob",
+        FIELD_TYPE.GEOMETRY: "bytes",
+        FIELD_TYPE.NULL: "null",
+    }
+
+
+def type_name(type_code: int) -> str:
+    return _type_names().get(type_code, "string")
+
+
+def _time_str(value: datetime.timedelta) -> str:
+    seconds = int(value.total_seconds())
+    sign = "-" if seconds < 0 else ""
+    hours, rest = divmod(abs(seconds), 3600)
+    return f"{sign}{hours:02d}:{rest // 60:02d}:{rest % 60:02d}"
+
+
+def _text_or_base64(value: Any) -> Any:
+    # TEXT columns share the BLOB field types but arrive as str
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode("ascii")
+    return value
+
+
+def _if_instance(cls: type, convert: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    # pymysql returns values it cannot parse, such as the zero date
+    # '0000-00-00 00:00:00', as the server's str
+    return lambda v: convert(v) if isinstance(v, cls) else v
+
+
+_JSON_CONVERTERS: Dict[str, Callable[[Any], Any]] = {
+    "decimal": str,  # keeps the exact value
+    "date": _if_instance(datetime.date, datetime.date.isoformat),
+    "datetime": _if_instance(datetime.datetime, datetime.datetime.isoformat),
+    "time": _if_instance(datetime.timedelta, _time_str),
+    "bit": lambda v: int.from_bytes(v, "big"),
+    "blob": _text_or_base64,
+    "bytes": lambda v: base64.b64encode(v).decode("ascii"),
+}
+
+
+def _json_column(values: Sequence[Any], kind: str) -> List[Any]:
+    convert = _JSON_CONVERTERS.get(kind)
+    if convert is None:
+        return list(values)
+    return [None if v is None else convert(v) for v in values]
+
+
+def _markdown_column(values: Sequence[Any], kind: str) -> List[str]:
+    if kind in ("integer", "float", "decimal", "date", "datetime", "null"):
+        return [str(v) for v in values]
+    if kind == "time":
+        return [str(v) for v in _json_column(values, kind)]
+    return [str(v).replace("|", "\\|").replace("\r\n", "<br>").replace("\n", "<br>") for v in _json_column(values, kind)]
+
+
+def _columns(page) -> List[Sequence[Any]]:
+    if not page.rows:
+        return [() for _ in page.columns]
+    return list(zip(*page.rows))
+
+
+def _schema(page) -> List[Dict[str, str]]:
+    return [{"name": name, "type": type_name(code)} for name, code in zip(page.columns, page.column_types)]
+
+
+def _markdown(page) -> str:
+    columns = [_markdown_column(values, type_name(code)) for values, code in zip(_columns(page), page.column_types)]
+    result = ["| " + " | ".join(page.columns) + " |"]
+    result.append("| " + " | ".join(["---" for _ in page.columns]) + " |")
+    result.extend("| " + " | ".join(cells) + " |" for cells in zip(*columns))
+    return "\n".join(result)
+
+
+def _csv(page) -> str:
+    columns = [_json_column(values, type_name(code)) for values, code in zip(_columns(page), page.column_types)]
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    writer.writerow(page.columns)
+    writer.writerows(zip(*columns))
+    return out.getvalue().rstrip("\n")
+
+
+def _json_data(page, fmt: str) -> Dict[str, Any]:
+    columns = [_json_column(values, type_name(code)) for values, code in zip(_columns(page), page.column_types)]
+    if fmt == "columnar":
+        return {"columns": _schema(page), "row_count": len(page.rows), "data": columns}
+    names = page.columns
+    return {"columns": _schema(page), "rows": [dict(zip(names, cells)) for cells in zip(*columns)]}
+
+
+def _arrow_data(page) -> Dict[str, Any]:
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ValueError("The arrow format requires the pyarrow package (pip install pyarrow)")
+
+    arrays = []
+    for values, code in zip(_columns(page), page.column_types):
+        try:
+            arrays.append(pa.array(values))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Mixed Python types in one column; fall back to the JSON representation
+            arrays.append(pa.array([None if v is None else str(v) for v in _json_column(values, type_name(code))]))
+    table = pa.Table.from_arrays(arrays, names=list(page.columns))
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return {
+        "format": "arrow-ipc-stream",
+        "encoding": "base64",
+        "row_count": len(page.rows),
+        "data": base64.b64encode(sink.getvalue().to_pybytes()).decode("ascii"),
+    }
+
+
+def is_text_format(fmt: str) -> bool:
+    return fmt in ("markdown", "csv")
+
+
+def render_text(page, fmt: str) -> str:
+    """Serialize a QueryPage as markdown or csv"""
+    if page.columns is None:
+        return f"Query executed successfully. Rows affected: {page.affected_rows}"
+    return _markdown(page) if fmt == "markdown" else _csv(page)
+
+
+def render_data(page, fmt: str) -> Dict[str, Any]:
+    """Serialize a QueryPage as a JSON-compatible dict for the json, columnar and arrow formats"""
+    if page.columns is None:
+        return {"affected_rows": page.affected_rows}
+    return _arrow_data(page) if fmt == "arrow" else _json_data(page, fmt)
+
+
+def to_json(data: Any) -> str:
+    return json.dumps(data, default=str, ensure_ascii=False)
+
+
+def render(page, fmt: str = "markdown", truncation: Optional[Dict[str, Any]] = None) -> str:
+    """Serialize a QueryPage; truncation describes why and how the result was cut short"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format '{fmt}'. Use one of: {', '.join(FORMATS)}")
+
+    if is_text_format(fmt):
+        text = render_text(page, fmt)
+        if truncation and page.columns is not None:
+            text += f"\n\n[{truncation['message']}]"
+        for warning in page.warnings:
+            text += f"\n\n[Warning: {warning}]"
+        return text
+
+    data = render_data(page, fmt)
+    if truncation and page.columns is not None:
+        data["truncated"] = truncation
+    if page.warnings:
+        data["warnings"] = page.warnings
+    return to_json(data)
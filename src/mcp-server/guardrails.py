@@ -0,0 +1,73 @@
+"""
+Limits on how long and how expensive an execute_sql query may be.
+
+Every query gets a time limit, enforced twice. The server aborts the
+statement itself (max_statement_time on MariaDB, max_execution_time on
+MySQL, where it only covers SELECT). A little after the limit, the client
+also sends KILL QUERY, which covers other statements and servers that ignore
+the setting.
+
+Queries can also be screened with EXPLAIN before they run. A statement whose
+plan examines more than SKYSQL_EXPLAIN_MAX_ROWS rows is then refused or
+flagged with a warning. The estimate multiplies the row counts of the tables
+joined in each SELECT of the plan and adds up the SELECTs. It is as rough as
+the optimizer's statistics.
+"""
+import os
+import logging
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence
+
+from db_pool import mysql_connector
+
+logger = logging.getLogger(__name__)
+
+
+def default_max_execution_time() -> float:
+    return float(os.getenv("SKYSQL_MAX_EXECUTION_TIME", "300"))
+
+
+def timeout_grace() -> float:
+    """Seconds the server is given to abort a query itself before it is killed"""
+    return float(os.getenv("SKYSQL_QUERY_TIMEOUT_GRACE", "5"))
+
+
+def default_max_estimated_rows() -> int:
+    return int(os.getenv("SKYSQL_EXPLAIN_MAX_ROWS", "0"))
+
+
+def reject_expensive() -> bool:
+    """Whether queries over the row estimate are refused rather than run with a warning"""
+    return os.getenv("SKYSQL_EXPLAIN_ACTION", "warn").lower() == "reject"
+
+
+def plan_rows(columns: Sequence[str], plan: Sequence[Sequence[Any]]) -> Optional[int]:
+    """Rows examined according to a tabular EXPLAIN, or None without a rows column"""
+    columns = [c.lower() for c in columns]
+    if "rows" not in columns:
+        return None
+    rows_at = columns.index("rows")
+    id_at = columns.index("id") if "id" in columns else None
+    selects: Dict[Any, int] = defaultdict(lambda: 1)
+    for step in plan:
+        # UNION RESULT and similar steps have no estimate of their own
+        if step[rows_at] is None:
+            continue
+        selects[step[id_at] if id_at is not None else None] *= max(1, int(step[rows_at]))
+    return sum(selects.values())
+
+
+def estimate_rows(conn, sql: str) -> Optional[int]:
+    """Rows the optimizer expects sql to examine, or None if it cannot be explained; called on the DB executor"""
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("EXPLAIN " + sql.strip().rstrip(";"))
+            columns: List[str] = [desc[0] for desc in cursor.description or ()]
+            plan = cursor.fetchall()
+    except mysql_connector.OperationalError:
+        raise
+    except mysql_connector.Error as e:
+        # The query itself will report the problem
+        logger.debug(f"EXPLAIN failed: {str(e)}")
+        return None
+    return plan_rows(columns, plan)
@@ -0,0 +1,43 @@
+"""
+ASGI app for the HTTP transport.
+
+Kept apart from the server_http.py entry point, which worker processes
+also load, so that each worker registers the /metrics route and builds the
+app once, when it imports the app by name.
+"""
+import os
+
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+
+from server import mcp, disable_page_tokens
+import metrics
+
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def prometheus_metrics(request: Request) -> PlainTextResponse:
+    """Metrics in the Prometheus text exposition format"""
+    return PlainTextResponse(metrics.registry.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+def workers() -> int:
+    """Worker processes server_http.py runs, from SKYSQL_HTTP_WORKERS"""
+    return int(os.getenv("SKYSQL_HTTP_WORKERS", "1"))
+
+
+def _stateless_http(workers: int) -> bool:
+    # With several workers or replicas a session's requests can reach any of
+    # them, so every request has to stand alone unless the load balancer
+    # keeps each session on one process
+    setting = os.getenv("SKYSQL_HTTP_STATELESS", "auto").lower()
+    if setting == "auto":
+        return workers > 1
+    return setting in ("1", "true", "yes")
+
+
+_stateless = _stateless_http(workers())
+if _stateless:
+    # The next request may reach a process that does not hold the cursor
+    disable_page_tokens()
+
+app = mcp.http_app(stateless_http=_stateless)
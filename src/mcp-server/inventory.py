@@ -0,0 +1,98 @@
+"""
+Cached inventory of the account's services.
+
+The full services list is fetched at most once per TTL. After that, callers
+get the cached list straight away while a background task refreshes it, up
+to max_stale seconds; older data is refreshed before returning. Between full
+fetches the inventory is kept current with every single-service response,
+launch and delete that passes through the server.
+"""
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from cache import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceInventory:
+    """Services indexed by id and by name"""
+
+    def __init__(self, fetch_all: Callable[[], Awaitable[List[Dict[str, Any]]]], ttl: float = 30.0,
+                 max_stale: float = 300.0):
+        self.fetch_all = fetch_all
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.refreshes = 0
+        self._services: Dict[str, Dict[str, Any]] = {}
+        self._ids_by_name: Dict[str, str] = {}
+        self._fetched_at: Optional[float] = None
+        self._flight = SingleFlight()
+        self._background: Optional[asyncio.Future] = None
+
+    def __len__(self) -> int:
+        return len(self._services)
+
+    @property
+    def age(self) -> Optional[float]:
+        return None if self._fetched_at is None else time.monotonic() - self._fetched_at
+
+    async def services(self, refresh: bool = False) -> List[Dict[str, Any]]:
+        """All services, refreshed first if refresh is set or the cache is too old to serve"""
+        age = self.age
+        if refresh or age is None or age > self.max_stale:
+            await self._flight.do("all", self._refresh)
+        elif age > self.ttl and (self._background is None or self._background.done()):
+            self._background = asyncio.ensure_future(self._flight.do("all", self._refresh))
+            self._background.add_done_callback(self._background_done)
+        return list(self._services.values())
+
+    @staticmethod
+    def _background_done(future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning(f"Background refresh of the services list failed: {str(future.exception())}")
+
+    async def _refresh(self):
+        services = await self.fetch_all()
+        self._services = {service["id"]: service for service in services}
+        self._ids_by_name = {service.get("name"): service["id"] for service in services}
+        self._fetched_at = time.monotonic()
+        self.refreshes += 1
+
+    def get(self, service_id: str) -> Optional[Dict[str, Any]]:
+        return self._services.get(service_id)
+
+    def find_by_name(self, name: str) -> Optional[Dict[str, Any]]:
+        service_id = self._ids_by_name.get(name)
+        return self._services.get(service_id) if service_id else None
+
+    def upsert(self, service: Dict[str, Any]):
+        """Record the latest details of one service"""
+        self._services[service["id"]] = service
+        if service.get("name"):
+            self._ids_by_name[service["name"]] = service["id"]
+
+    def remove(self, service_id: str):
+        service = self._services.pop(service_id, None)
+        if service is not None and self._ids_by_name.get(service.get("name")) == service_id:
+            del self._ids_by_name[service["name"]]
+
+    async def close(self):
+        if self._background is not None:
+            self._background.cancel()
+
+
+def filter_services(services: List[Dict[str, Any]], status: Optional[str] = None, provider: Optional[str] = None,
+                    region: Optional[str] = None, name_prefix: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Services matching every given filter; comparisons ignore case"""
+    def matches(value: Any, wanted: Optional[str]) -> bool:
+        return wanted is None or str(value or "").lower() == wanted.lower()
+
+    prefix = name_prefix.lower() if name_prefix else ""
+    return [
+        service for service in services
+        if matches(service.get("status"), status) and matches(service.get("provider"), provider)
+        and matches(service.get("region"), region) and service.get("name", "").lower().startswith(prefix)
+    ]
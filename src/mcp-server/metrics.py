@@ -0,0 +1,316 @@
+"""
+In-process metrics and tracing for the SkySQL MCP Server.
+
+Counters, gauges and fixed-bucket histograms live in one registry that is
+exported in the Prometheus text format on the HTTP server's /metrics route
+and as JSON by the server_stats tool. Counts that are already kept elsewhere
+(cache hits, pool sizes) are read by collector callbacks at export time
+instead of being updated twice. All updates happen on the event loop thread.
+
+span() and phase() wrap a block in an OpenTelemetry span when the
+opentelemetry-api package is installed and SKYSQL_TRACING is not turned off.
+Without an OpenTelemetry SDK configured the spans are no-ops.
+"""
+import os
+import time
+import bisect
+import logging
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from fastmcp.server.middleware import Middleware
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+BYTE_BUCKETS = tuple(256 * 4 ** i for i in range(10))
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+
+# Tool results starting with one of these are counted as errors
+ERROR_PREFIXES = ("Failed to", "SQL Error", "Database connection error", "Unsupported format", "Service with ID",
+                  "Missing connection details", "Query rejected")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def _label_text(self, key: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter(_Metric):
+    """A count that only goes up"""
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def set(self, value: float, **labels):
+        """Record a total counted elsewhere; only for collector callbacks"""
+        self.values[self._key(labels)] = value
+
+    def get(self, **labels) -> float:
+        return self.values.get(self._key(labels), 0)
+
+    def samples(self) -> Iterator[str]:
+        for key, value in self.values.items():
+            yield f"{self.name}{self._label_text(key)} {_format_number(value)}"
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        return [dict(zip(self.label_names, key), value=value) for key, value in self.values.items()]
+
+
+class Gauge(Counter):
+    """A value that can go up and down"""
+    kind = "gauge"
+
+
+class Histogram(_Metric):
+    """Observations counted into fixed buckets, with their sum"""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (last one is +Inf), sum, count]
+        self.values: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        entry = self.values.get(key)
+        if entry is None:
+            entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        entry = self.values.get(self._key(labels))
+        return None if entry is None else self._quantile(entry, q)
+
+    def _quantile(self, entry: List[Any], q: float) -> Optional[float]:
+        """Estimate a quantile by interpolating within its bucket, as Prometheus does"""
+        counts, _, total = entry
+        if not total:
+            return None
+        rank = q * total
+        cumulative = 0
+        for i, count in enumerate(counts):
+            if cumulative + count >= rank and count:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else min(0.0, self.buckets[0])
+                return lower + (self.buckets[i] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def samples(self) -> Iterator[str]:
+        for key, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_number(bound)}"'
+                yield f"{self.name}_bucket{self._label_text(key, le)} {cumulative}"
+            yield f"{self.name}_sum{self._label_text(key)} {_format_number(total)}"
+            yield f"{self.name}_count{self._label_text(key)} {count}"
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        result = []
+        for key, entry in self.values.items():
+            _, total, count = entry
+            summary = dict(zip(self.label_names, key), count=count, sum=round(total, 6))
+            for name, q in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99)):
+                value = self._quantile(entry, q)
+                summary[name] = None if value is None else round(value, 6)
+            result.append(summary)
+        return result
+
+
+class MetricsRegistry:
+    """Named metrics plus callbacks that refresh values kept elsewhere"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+        self.started = time.time()
+
+    def _add(self, metric: _Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._add(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def add_collector(self, collect: Callable[[], None]):
+        """Register a callback run before every export, e.g. to copy cache statistics into gauges"""
+        self._collectors.append(collect)
+
+    def collect(self):
+        for collect in self._collectors:
+            try:
+                collect()
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {str(e)}")
+
+    def render_prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        self.collect()
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Metrics with at least one value, histograms summarized as count, sum and quantiles"""
+        self.collect()
+        result: Dict[str, Any] = {"uptime_s": round(time.time() - self.started, 1)}
+        for metric in self._metrics.values():
+            values = metric.snapshot()
+            if values:
+                result[metric.name] = values
+        return result
+
+
+registry = MetricsRegistry()
+
+tool_seconds = registry.histogram(
+    "skysql_tool_duration_seconds", "Tool call latency", ["tool", "outcome"])
+tool_response_bytes = registry.histogram(
+    "skysql_tool_response_bytes", "Size of tool results", ["tool"], BYTE_BUCKETS)
+tool_errors = registry.counter(
+    "skysql_tool_errors_total", "Tool calls that raised or returned an error message", ["tool", "kind"])
+result_rows = registry.histogram(
+    "skysql_result_rows", "Rows returned per result page", ["tool"], ROW_BUCKETS)
+phase_seconds = registry.histogram(
+    "skysql_phase_duration_seconds", "Time spent in each phase of a query", ["phase"])
+api_seconds = registry.histogram(
+    "skysql_api_request_duration_seconds", "SkySQL API request latency, including reading the body",
+    ["method", "endpoint", "status"])
+api_response_bytes = registry.histogram(
+    "skysql_api_response_bytes", "Size of SkySQL API response bodies", ["method", "endpoint"], BYTE_BUCKETS)
+api_errors = registry.counter(
+    "skysql_api_errors_total", "SkySQL API requests that failed without a response", ["method", "endpoint", "error"])
+api_throttled = registry.counter(
+    "skysql_api_throttled_total", "SkySQL API requests held back by a client-side limit, or throttled upstream",
+    ["endpoint_class", "reason"])
+api_retries = registry.counter(
+    "skysql_api_retries_total", "SkySQL API requests retried, by the status that was retried", ["endpoint_class", "status"])
+api_queue_seconds = registry.histogram(
+    "skysql_api_queue_seconds", "Time SkySQL API requests waited for the rate and concurrency limits",
+    ["endpoint_class"])
+pool_wait_seconds = registry.histogram(
+    "skysql_db_pool_wait_seconds", "Time spent waiting for a free connection slot")
+connection_checkouts = registry.counter(
+    "skysql_db_connection_checkouts_total", "Connections checked out of a pool, by whether one was reused",
+    ["outcome"])
+connections_discarded = registry.counter(
+    "skysql_db_connections_discarded_total", "Connections closed instead of returned to a pool")
+queries_killed = registry.counter(
+    "skysql_db_queries_killed_total", "Statements stopped with KILL QUERY, by reason", ["reason"])
+queries_screened = registry.counter(
+    "skysql_db_queries_screened_total", "Queries checked with EXPLAIN, by outcome", ["outcome"])
+
+
+_tracer = None
+_tracer_loaded = False
+
+
+def _get_tracer():
+    global _tracer, _tracer_loaded
+    if not _tracer_loaded:
+        _tracer_loaded = True
+        if os.getenv("SKYSQL_TRACING", "true").lower() in ("1", "true", "yes"):
+            try:
+                from opentelemetry import trace
+                _tracer = trace.get_tracer("skysql-mcp")
+            except ImportError:
+                logger.debug("opentelemetry-api is not installed, tracing disabled")
+    return _tracer
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Run the block in an OpenTelemetry span if tracing is available"""
+    tracer = _get_tracer()
+    if tracer is None:
+        yield None
+        return
+    with tracer.start_as_current_span(name, attributes=attributes) as current:
+        yield current
+
+
+@contextmanager
+def phase(name: str, **attributes):
+    """Time one phase of a query into skysql_phase_duration_seconds, in a span of its own"""
+    with span(f"skysql.{name}", **attributes) as current, phase_seconds.time(phase=name):
+        yield current
+
+
+def _result_text(result) -> str:
+    return "".join(getattr(block, "text", "") or "" for block in getattr(result, "content", None) or [])
+
+
+class MetricsMiddleware(Middleware):
+    """Records latency, result size and errors for every tool call"""
+
+    async def on_call_tool(self, context, call_next):
+        tool = context.message.name
+        started = time.perf_counter()
+        try:
+            result = await call_next(context)
+        except BaseException as e:
+            tool_seconds.observe(time.perf_counter() - started, tool=tool, outcome="exception")
+            tool_errors.inc(tool=tool, kind=type(e).__name__)
+            raise
+        text = _result_text(result)
+        failed = getattr(result, "is_error", False) or text.startswith(ERROR_PREFIXES)
+        tool_seconds.observe(time.perf_counter() - started, tool=tool, outcome="error" if failed else "ok")
+        tool_response_bytes.observe(len(text.encode("utf-8")), tool=tool)
+        if failed:
+            tool_errors.inc(tool=tool, kind="error")
+        return result
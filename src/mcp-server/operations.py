@@ -0,0 +1,246 @@
+"""
+Background tracking of service provisioning and deletion.
+
+One poller task runs per service, no matter how many callers are waiting on
+it. It reads the service with exponential backoff and jitter until the
+operation finishes (the service is ready, failed, or gone after a delete)
+and wakes every waiter whenever the status changes. A failed poll only
+delays the next one; a poller that stops anyway before the operation is
+done is restarted by the next watch().
+
+With a shared state backend, only one process polls the API for a given
+service: whichever holds its lease. It publishes every response, and the
+pollers in other processes follow those instead. If the leader stops
+renewing the lease, another poller takes over.
+"""
+import time
+import uuid
+import random
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from state import MemoryBackend, StateBackend
+
+logger = logging.getLogger(__name__)
+
+FAILED_STATUSES = ("failed", "error")
+
+
+class Operation:
+    """A launch or delete being watched for one service"""
+
+    def __init__(self, service_id: str, kind: str):
+        self.service_id = service_id
+        # "create" or "delete"
+        self.kind = kind
+        self.status: Optional[str] = None
+        self.name: Optional[str] = None
+        self.done = False
+        self.error: Optional[str] = None
+        self.polls = 0
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    @property
+    def succeeded(self) -> bool:
+        return self.done and self.error is None
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    def _update(self, status: Optional[str], error: Optional[str] = None, done: bool = False):
+        changed = status != self.status or done != self.done
+        self.status = status
+        if error is not None:
+            self.error = error
+        if done:
+            self.done = True
+            self.finished = time.monotonic()
+        if changed:
+            # Wake the current waiters; later ones wait for the next change
+            self._changed.set()
+            self._changed = asyncio.Event()
+
+    @property
+    def changed(self) -> asyncio.Event:
+        """Event set on the next status change"""
+        return self._changed
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "service_id": self.service_id,
+            "name": self.name,
+            "operation": self.kind,
+            "status": self.status,
+            "done": self.done,
+            "error": self.error,
+            "elapsed_s": round(self.elapsed, 1),
+            "polls": self.polls,
+        }
+
+
+class OperationTracker:
+    """Shared pollers for services being created or deleted.
+
+    fetch(service_id) returns the service as a dict, or None once it no
+    longer exists.
+    """
+
+    def __init__(self, fetch: Callable[[str], Awaitable[Optional[Dict[str, Any]]]], initial_delay: float = 2.0,
+                 max_delay: float = 30.0, jitter: float = 0.2, max_duration: float = 3600.0,
+                 retention: float = 60.0, store: Optional[StateBackend] = None):
+        self.fetch = fetch
+        self.store = store or MemoryBackend()
+        self.worker_id = uuid.uuid4().hex
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.max_duration = max_duration
+        # Seconds a finished operation is remembered before a new watch polls again
+        self.retention = retention
+        self._operations: Dict[str, Operation] = {}
+
+    def __len__(self) -> int:
+        return len(self._operations)
+
+    def get(self, service_id: str) -> Optional[Operation]:
+        return self._operations.get(service_id)
+
+    def watch(self, service_id: str, kind: str = "create", status: Optional[str] = None,
+              name: Optional[str] = None) -> Operation:
+        """Start polling a service, or join the poller that is already running for it"""
+        self._prune()
+        operation = self._operations.get(service_id)
+        if operation is not None:
+            if operation.kind == kind or (kind == "create" and not operation.done):
+                if not operation.done and operation.task.done():
+                    # The poller died without finishing the operation
+                    logger.warning(f"Restarting the poller for service {service_id}")
+                    operation.task = asyncio.create_task(self._poll(operation))
+                return operation
+            # A delete supersedes the launch being watched
+            if not operation.done:
+                operation._update(operation.status, f"Superseded by a {kind}", done=True)
+            operation.task.cancel()
+        operation = Operation(service_id, kind)
+        operation.status = status
+        operation.name = name
+        operation.task = asyncio.create_task(self._poll(operation))
+        self._operations[service_id] = operation
+        return operation
+
+    def _prune(self):
+        now = time.monotonic()
+        for service_id in [s for s, op in self._operations.items()
+                           if op.done and now - op.finished > self.retention]:
+            del self._operations[service_id]
+
+    def _delay(self, attempt: int) -> float:
+        delay = min(self.initial_delay * 2 ** attempt, self.max_delay)
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    async def _poll(self, operation: Operation):
+        attempt = 0
+        try:
+            while not operation.done:
+                try:
+                    known, service = await self._read(operation)
+                    if known:
+                        self._apply(operation, service)
+                except httpx.HTTPError as e:
+                    # Transient API errors only delay the next poll
+                    logger.warning(f"Polling service {operation.service_id} failed: {str(e)}")
+                except Exception as e:
+                    # So do unexpected responses and state backend errors, until max_duration
+                    logger.warning(f"Polling service {operation.service_id} failed: {type(e).__name__}: {str(e)}")
+                if operation.done:
+                    break
+                if operation.elapsed > self.max_duration:
+                    operation._update(operation.status, f"Gave up after {self.max_duration:.0f} s", done=True)
+                    break
+                await asyncio.sleep(self._delay(attempt))
+                attempt += 1
+        finally:
+            try:
+                if await self.store.get("operation_leases", operation.service_id) == self.worker_id:
+                    await self.store.delete("operation_leases", operation.service_id)
+            except Exception as e:
+                # The lease expires on its own
+                logger.warning(f"Releasing the lease on service {operation.service_id} failed: {str(e)}")
+        logger.info(f"Service {operation.service_id} {operation.kind} finished with status {operation.status} "
+                    f"after {operation.elapsed:.1f} s and {operation.polls} polls")
+
+    async def _read(self, operation: Operation) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """Poll the service if this process holds its lease, else read what the lease holder published.
+
+        Returns (False, None) if there is nothing new to apply.
+        """
+        service_id = operation.service_id
+        # Outlives the longest gap between the leader's polls
+        lease_ttl = self.max_delay * (1 + self.jitter) * 2
+        leading = await self.store.add("operation_leases", service_id, self.worker_id, lease_ttl)
+        if not leading and await self.store.get("operation_leases", service_id) == self.worker_id:
+            await self.store.set("operation_leases", service_id, self.worker_id, lease_ttl)
+            leading = True
+        if not leading:
+            record = await self.store.get("operations", service_id)
+            return (False, None) if record is None else (True, record["service"])
+
+        service = await self.fetch(service_id)
+        operation.polls += 1
+        await self.store.set("operations", service_id, {"service": service}, self.retention + lease_ttl)
+        return True, service
+
+    @staticmethod
+    def _apply(operation: Operation, service: Optional[Dict[str, Any]]):
+        if service is None:
+            if operation.kind == "delete":
+                operation._update("deleted", done=True)
+            else:
+                operation._update("not_found", "Service not found", done=True)
+            return
+        operation.name = service.get("name", operation.name)
+        status = service.get("status")
+        if operation.kind == "delete" and status == "deleted":
+            operation._update(status, done=True)
+        elif status in FAILED_STATUSES:
+            operation._update(status, f"Service {operation.kind} failed with status {status}", done=True)
+        elif operation.kind == "create" and status == "ready":
+            operation._update(status, done=True)
+        else:
+            operation._update(status)
+
+    async def wait(self, operations: List[Operation], timeout: float,
+                   on_change: Optional[Callable[[List[Operation]], Awaitable[None]]] = None) -> bool:
+        """Wait until every operation is done; False if the timeout expires first"""
+        deadline = time.monotonic() + timeout
+        while True:
+            pending = [op for op in operations if not op.done]
+            if not pending:
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            # Take the events now, so a change that lands before the waiters start is not missed
+            waiters = [asyncio.ensure_future(op.changed.wait()) for op in pending]
+            try:
+                await asyncio.wait(waiters, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for waiter in waiters:
+                    waiter.cancel()
+            if on_change is not None:
+                await on_change(operations)
+
+    async def close(self):
+        operations, self._operations = self._operations, {}
+        for operation in operations.values():
+            if operation.task is not None:
+                operation.task.cancel()
+        await asyncio.gather(*(op.task for op in operations.values() if op.task is not None),
+                             return_exceptions=True)
@@ -0,0 +1,58 @@
+"""
+Background pre-warming once a client has connected.
+
+With SKYSQL_PREWARM on, a background task does the slow parts of a first
+tool call ahead of time. It creates the SkySQL API client, with its TLS
+context and a connection to the API. It also fetches the service list and
+the credentials of the services in SKYSQL_PREWARM_SERVICES.
+
+The task starts once the first tools/list request has been answered.
+Clients send it right after the handshake (initialize, or server/discover
+on newer protocol versions), and usually wait for their user after that.
+Starting any earlier would make the task compete with the handshake and
+the tool listing for the CPU. A failure only costs the head start.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Optional
+
+from fastmcp.server.middleware import Middleware
+
+logger = logging.getLogger(__name__)
+
+# Seconds between answering tools/list and starting: enough for the answer
+# to be written out, and for the client to take the tool list in, before
+# the task's first steps (creating the client, importing h2) take the CPU
+START_DELAY = 0.5
+
+
+class PrewarmMiddleware(Middleware):
+    """Runs warm() in the background once the first tools/list request has been answered"""
+
+    def __init__(self, warm: Callable[[], Awaitable[None]]):
+        self._warm = warm
+        self._task: Optional[asyncio.Task] = None
+
+    async def on_list_tools(self, context, call_next):
+        result = await call_next(context)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return result
+
+    async def _run(self):
+        await asyncio.sleep(START_DELAY)
+        started = time.perf_counter()
+        try:
+            await self._warm()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Pre-warming failed: {str(e)}")
+            return
+        logger.info(f"Pre-warmed in {time.perf_counter() - started:.2f} s")
+
+    async def close(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
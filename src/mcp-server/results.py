@@ -0,0 +1,209 @@
+"""
+Size-bounded, paginated query results.
+
+Queries are read through an unbuffered server-side cursor (SSCursor), so only
+the rows that fit in a page are ever held in memory. When a page fills up
+before the result set is exhausted, the cursor and its connection are parked
+under a continuation token and the next page is read from the same cursor
+instead of running the query again.
+"""
+import os
+import time
+import asyncio
+import secrets
+import logging
+from typing import Any, Dict, List, Optional, Sequence
+
+from db_pool import mysql_connector
+
+logger = logging.getLogger(__name__)
+
+# Rows pulled from the server per round of fetchmany()
+FETCH_BATCH = 500
+
+
+def default_max_rows() -> int:
+    return int(os.getenv("SKYSQL_MAX_ROWS", "1000"))
+
+
+def default_max_bytes() -> int:
+    return int(os.getenv("SKYSQL_MAX_BYTES", "1000000"))
+
+
+class QueryPage:
+    """One page of a query result, or the row count of a statement without one"""
+
+    def __init__(self, columns: Optional[List[str]] = None, rows: Optional[List[Sequence[Any]]] = None,
+                 affected_rows: int = 0, column_types: Optional[List[int]] = None):
+        self.columns = columns
+        # pymysql FIELD_TYPE codes, one per column
+        self.column_types = column_types or []
+        self.rows = rows or []
+        self.affected_rows = affected_rows
+        # Rows already read from the server but not returned yet
+        self.pending: List[Sequence[Any]] = []
+        self.more = False
+        self.limit_hit: Optional[str] = None
+        # Shown with the result, e.g. a high EXPLAIN estimate
+        self.warnings: List[str] = []
+
+
+def _row_size(row: Sequence[Any]) -> int:
+    return sum(len(str(val)) for val in row) + 3 * len(row) + 2
+
+
+def fetch_page(cursor, max_rows: int, max_bytes: int, pending: Optional[List[Sequence[Any]]] = None) -> QueryPage:
+    """Read rows from an open cursor until max_rows or max_bytes is reached.
+
+    A page always holds at least one row so that paging makes progress even
+    when a single row is larger than max_bytes, or max_rows is below 1.
+    """
+    page = QueryPage(columns=[desc[0] for desc in cursor.description],
+                     column_types=[desc[1] for desc in cursor.description])
+    size = 0
+    buffer = list(pending or ())
+    while True:
+        if not buffer:
+            buffer = list(cursor.fetchmany(FETCH_BATCH))
+            if not buffer:
+                return page
+        for i, row in enumerate(buffer):
+            row_size = _row_size(row)
+            if page.rows and len(page.rows) >= max_rows:
+                page.limit_hit = f"max_rows={max_rows}"
+            elif page.rows and size + row_size > max_bytes:
+                page.limit_hit = f"max_bytes={max_bytes}"
+            if page.limit_hit:
+                page.pending = buffer[i:]
+                page.more = True
+                return page
+            page.rows.append(row)
+            size += row_size
+        buffer = []
+
+
+def run_query(conn, sql_query: str, max_rows: int, max_bytes: int):
+    """Execute a query with an unbuffered cursor and read its first page; called on the DB executor.
+
+    Returns (page, cursor). The cursor is still open when page.more is set.
+    """
+    cursor = conn.cursor(mysql_connector.cursors.SSCursor)
+    try:
+        cursor.execute(sql_query)
+        if not cursor.description:
+            # For DDL/DML queries that don't return results
+            page = QueryPage(affected_rows=cursor.rowcount)
+        else:
+            page = fetch_page(cursor, max_rows, max_bytes)
+    except BaseException:
+        cursor.close()
+        raise
+    if not page.more:
+        cursor.close()
+    return page, cursor
+
+
+def read_next_page(conn, cursor, max_rows: int, max_bytes: int, pending: List[Sequence[Any]]) -> QueryPage:
+    """Read the next page from a parked cursor; called on the DB executor"""
+    page = fetch_page(cursor, max_rows, max_bytes, pending)
+    if not page.more:
+        cursor.close()
+    return page
+
+
+class OpenCursor:
+    """A partially read result set parked between pages"""
+
+    def __init__(self, service_id: str, pool, conn, cursor, pending: List[Sequence[Any]], rows_sent: int,
+                 fmt: str, ttl: float):
+        self.service_id = service_id
+        self.pool = pool
+        self.conn = conn
+        self.cursor = cursor
+        self.pending = pending
+        self.rows_sent = rows_sent
+        self.fmt = fmt
+        self.expires_at = time.monotonic() + ttl
+
+
+class OpenCursorRegistry:
+    """Continuation tokens for result sets that did not fit in one page.
+
+    A parked cursor keeps its pooled connection checked out, so the number of
+    open cursors is capped and abandoned ones are closed by a background task
+    after the ttl. Until then the unfinished statement also holds metadata
+    locks on the tables it reads, which blocks DDL (ALTER TABLE, DROP TABLE,
+    ...) on them and every statement queued behind that DDL.
+    """
+
+    def __init__(self, max_open: int = 16, ttl: float = 300.0):
+        self.max_open = max_open
+        self.ttl = ttl
+        # Seconds between checks for expired cursors
+        self.reap_interval = max(1.0, min(30.0, ttl / 10))
+        self._cursors: Dict[str, OpenCursor] = {}
+        self._reaper: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._cursors)
+
+    @property
+    def write_timeout(self) -> int:
+        """net_write_timeout for connections that may park a cursor.
+
+        The server gives up on a client that reads nothing for that long, so
+        it must outlast a cursor's ttl plus the time until it is reaped.
+        """
+        return int(self.ttl + self.reap_interval) + 1
+
+    async def park(self, service_id: str, pool, conn, cursor, pending: List[Sequence[Any]], rows_sent: int,
+                   fmt: str) -> Optional[str]:
+        """Store an open cursor and return its token, or None if too many are open"""
+        await self.expire()
+        if len(self._cursors) >= self.max_open:
+            return None
+        # Leave at least half of the service's connections for new queries
+        if sum(1 for c in self._cursors.values() if c.pool is pool) >= max(1, pool.max_size // 2):
+            return None
+        token = secrets.token_urlsafe(16)
+        self._cursors[token] = OpenCursor(service_id, pool, conn, cursor, pending, rows_sent, fmt, self.ttl)
+        self._start_reaper()
+        return token
+
+    async def take(self, token: str) -> Optional[OpenCursor]:
+        """Remove and return the cursor for a token; the caller must park or close it"""
+        await self.expire()
+        return self._cursors.pop(token, None)
+
+    async def expire(self):
+        now = time.monotonic()
+        for token in [t for t, c in self._cursors.items() if c.expires_at <= now]:
+            logger.debug(f"Closing abandoned cursor for service {self._cursors[token].service_id}")
+            await self.close(self._cursors.pop(token))
+
+    def _start_reaper(self):
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._reap())
+
+    async def _reap(self):
+        """Close expired cursors until none are left open"""
+        while self._cursors:
+            await asyncio.sleep(self.reap_interval)
+            try:
+                await self.expire()
+            except Exception as e:
+                logger.warning(f"Closing expired cursors failed: {str(e)}")
+
+    @staticmethod
+    async def close(open_cursor: OpenCursor):
+        # Closing an unbuffered cursor would read the rest of the result set,
+        # so drop the whole connection instead
+        await open_cursor.pool.release(open_cursor.conn, discard=True)
+
+    async def close_all(self):
+        if self._reaper is not None and not self._reaper.done():
+            self._reaper.cancel()
+            await asyncio.gather(self._reaper, return_exceptions=True)
+        cursors, self._cursors = self._cursors, {}
+        for open_cursor in cursors.values():
+            await self.close(open_cursor)
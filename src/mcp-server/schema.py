@@ -0,0 +1,330 @@
+"""
+Per-service schema snapshots built from a few bulk information_schema queries.
+
+A snapshot holds every database, table, column, index and foreign key of a
+service. Refreshing it re-reads only information_schema.TABLES; columns,
+indexes and foreign keys are reloaded just for tables that are new, whose
+CREATE_TIME changed (ALTER TABLE rewrites the table definition), that are
+views, or that a DDL statement sent through this server marked as dirty.
+Row estimates and UPDATE_TIME come from the TABLES query, so data changes
+never trigger a reload.
+"""
+import time
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from cache import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+_SYSTEM_SCHEMAS = "('information_schema', 'mysql', 'performance_schema', 'sys')"
+
+_SCHEMATA_SQL = f"SELECT SCHEMA_NAME FROM information_schema.SCHEMATA WHERE SCHEMA_NAME NOT IN {_SYSTEM_SCHEMAS}"
+_TABLES_SQL = (
+    "SELECT TABLE_SCHEMA, TABLE_NAME, TABLE_TYPE, ENGINE, TABLE_ROWS, CREATE_TIME, UPDATE_TIME, TABLE_COMMENT "
+    f"FROM information_schema.TABLES WHERE TABLE_SCHEMA NOT IN {_SYSTEM_SCHEMAS}"
+)
+_COLUMNS_SQL = (
+    "SELECT TABLE_SCHEMA, TABLE_NAME, COLUMN_NAME, COLUMN_TYPE, IS_NULLABLE, COLUMN_DEFAULT, COLUMN_KEY, EXTRA, "
+    "COLUMN_COMMENT FROM information_schema.COLUMNS WHERE {filter} "
+    "ORDER BY TABLE_SCHEMA, TABLE_NAME, ORDINAL_POSITION"
+)
+_INDEXES_SQL = (
+    "SELECT TABLE_SCHEMA, TABLE_NAME, INDEX_NAME, NON_UNIQUE, COLUMN_NAME, INDEX_TYPE "
+    "FROM information_schema.STATISTICS WHERE {filter} "
+    "ORDER BY TABLE_SCHEMA, TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX"
+)
+_FOREIGN_KEYS_SQL = (
+    "SELECT TABLE_SCHEMA, TABLE_NAME, CONSTRAINT_NAME, COLUMN_NAME, REFERENCED_TABLE_SCHEMA, REFERENCED_TABLE_NAME, "
+    "REFERENCED_COLUMN_NAME FROM information_schema.KEY_COLUMN_USAGE "
+    "WHERE REFERENCED_TABLE_NAME IS NOT NULL AND {filter} "
+    "ORDER BY TABLE_SCHEMA, TABLE_NAME, CONSTRAINT_NAME, ORDINAL_POSITION"
+)
+
+# (schema, table) pairs per detail query during an incremental refresh
+_CHUNK = 500
+
+
+class TableInfo:
+    """One table or view with its columns, indexes and foreign keys"""
+
+    def __init__(self, database: str, name: str, table_type: str, engine: Optional[str], rows: Optional[int],
+                 create_time, update_time, comment: str):
+        self.database = database
+        self.name = name
+        self.table_type = table_type
+        self.engine = engine
+        self.rows = rows
+        self.create_time = create_time
+        self.update_time = update_time
+        self.comment = comment
+        self.columns: List[Dict[str, Any]] = []
+        self.indexes: Dict[str, Dict[str, Any]] = {}
+        self.foreign_keys: Dict[str, Dict[str, Any]] = {}
+
+    @property
+    def is_view(self) -> bool:
+        return self.table_type == "VIEW"
+
+    @property
+    def primary_key(self) -> List[str]:
+        return self.indexes.get("PRIMARY", {}).get("columns", [])
+
+    def copy_details(self, other: "TableInfo"):
+        self.columns = other.columns
+        self.indexes = other.indexes
+        self.foreign_keys = other.foreign_keys
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "type": "view" if self.is_view else "table",
+            "engine": self.engine,
+            "rows_estimate": self.rows,
+            "columns": len(self.columns),
+            "primary_key": self.primary_key,
+            "updated": self.update_time.isoformat() if self.update_time else None,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.summary(), database=self.database, comment=self.comment, columns=self.columns,
+                    indexes=[dict(name=name, **index) for name, index in self.indexes.items()],
+                    foreign_keys=[dict(name=name, **fk) for name, fk in self.foreign_keys.items()])
+
+
+class SchemaSnapshot:
+    """Every database and table of a service at one point in time"""
+
+    def __init__(self, databases: Dict[str, Dict[str, TableInfo]]):
+        self.databases = databases
+        self.refreshed_at = time.time()
+        # Tables whose details were (re)loaded to produce this snapshot
+        self.tables_loaded = 0
+
+    @property
+    def table_count(self) -> int:
+        return sum(len(tables) for tables in self.databases.values())
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.refreshed_at
+
+    def find_tables(self, table: str, database: Optional[str] = None) -> List[TableInfo]:
+        """Tables matching a name case-insensitively, optionally within one database"""
+        name = table.lower()
+        return [
+            info
+            for db_name, tables in self.databases.items()
+            if database is None or db_name == database
+            for info in tables.values()
+            if info.name.lower() == name
+        ]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "refreshed_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.refreshed_at)),
+            "databases": {
+                db_name: [info.summary() for info in tables.values()]
+                for db_name, tables in self.databases.items()
+            },
+        }
+
+
+def _pair_filter(pairs: List[Tuple[str, str]]) -> str:
+    return "(TABLE_SCHEMA, TABLE_NAME) IN (" + ", ".join(["(%s, %s)"] * len(pairs)) + ")"
+
+
+def _read_tables(conn) -> Dict[str, Dict[str, TableInfo]]:
+    databases: Dict[str, Dict[str, TableInfo]] = {}
+    with conn.cursor() as cursor:
+        cursor.execute(_SCHEMATA_SQL)
+        for (db_name,) in cursor.fetchall():
+            databases[db_name] = {}
+        cursor.execute(_TABLES_SQL)
+        for db_name, name, table_type, engine, rows, created, updated, comment in cursor.fetchall():
+            databases.setdefault(db_name, {})[name] = TableInfo(db_name, name, table_type, engine, rows,
+                                                                created, updated, comment)
+    return databases
+
+
+def _read_details(conn, databases: Dict[str, Dict[str, TableInfo]], pairs: Optional[List[Tuple[str, str]]]):
+    """Fill in columns, indexes and foreign keys for the given (schema, table) pairs, or for every table"""
+    chunks = [pairs[i:i + _CHUNK] for i in range(0, len(pairs), _CHUNK)] if pairs is not None else [None]
+    with conn.cursor() as cursor:
+        for chunk in chunks:
+            where = _pair_filter(chunk) if chunk else f"TABLE_SCHEMA NOT IN {_SYSTEM_SCHEMAS}"
+            params = [v for pair in chunk for v in pair] if chunk else None
+
+            cursor.execute(_COLUMNS_SQL.format(filter=where), params)
+            for db_name, table, name, column_type, nullable, default, key, extra, comment in cursor.fetchall():
+                info = databases.get(db_name, {}).get(table)
+                if info is not None:
+                    info.columns.append({"name": name, "type": column_type, "nullable": nullable == "YES",
+                                         "default": default, "key": key or None, "extra": extra or None,
+                                         "comment": comment or None})
+
+            cursor.execute(_INDEXES_SQL.format(filter=where), params)
+            for db_name, table, name, non_unique, column, index_type in cursor.fetchall():
+                info = databases.get(db_name, {}).get(table)
+                if info is not None:
+                    index = info.indexes.setdefault(name, {"unique": not int(non_unique), "type": index_type,
+                                                           "columns": []})
+                    index["columns"].append(column)
+
+            cursor.execute(_FOREIGN_KEYS_SQL.format(filter=where), params)
+            for db_name, table, name, column, ref_db, ref_table, ref_column in cursor.fetchall():
+                info = databases.get(db_name, {}).get(table)
+                if info is not None:
+                    fk = info.foreign_keys.setdefault(name, {"columns": [], "references": f"{ref_db}.{ref_table}",
+                                                             "referenced_columns": []})
+                    fk["columns"].append(column)
+                    fk["referenced_columns"].append(ref_column)
+
+
+def build_snapshot(conn) -> SchemaSnapshot:
+    """Read the whole schema of a service; called on the DB executor"""
+    databases = _read_tables(conn)
+    _read_details(conn, databases, None)
+    snapshot = SchemaSnapshot(databases)
+    snapshot.tables_loaded = snapshot.table_count
+    return snapshot
+
+
+def refresh_snapshot(conn, previous: SchemaSnapshot, dirty: Set[str]) -> SchemaSnapshot:
+    """Build a new snapshot that reuses the details of unchanged tables; called on the DB executor.
+
+    dirty holds lowercased table names that DDL through this server touched.
+    """
+    databases = _read_tables(conn)
+    stale = []
+    for db_name, tables in databases.items():
+        for name, info in tables.items():
+            old = previous.databases.get(db_name, {}).get(name)
+            if (old is None or info.is_view or old.create_time != info.create_time or info.create_time is None
+                    or name.lower() in dirty):
+                stale.append((db_name, name))
+            else:
+                info.copy_details(old)
+    _read_details(conn, databases, stale)
+    snapshot = SchemaSnapshot(databases)
+    snapshot.tables_loaded = len(stale)
+    return snapshot
+
+
+class SchemaRegistry:
+    """Schema snapshots per service, refreshed when they are older than
+    refresh_interval or after DDL went through this server"""
+
+    def __init__(self, refresh_interval: float = 300.0):
+        self.refresh_interval = refresh_interval
+        self.full_builds = 0
+        self.refreshes = 0
+        self._snapshots: Dict[str, SchemaSnapshot] = {}
+        # service_id -> lowercased names of tables changed by DDL since the last refresh
+        self._dirty: Dict[str, Set[str]] = {}
+        self._flight = SingleFlight()
+
+    def mark_dirty(self, service_id: str, tables: Optional[Set[str]] = None):
+        """Force a refresh on the next lookup; tables are reloaded even if CREATE_TIME did not change"""
+        self._dirty.setdefault(service_id, set()).update(tables or ())
+
+    def forget(self, service_id: str):
+        self._snapshots.pop(service_id, None)
+        self._dirty.pop(service_id, None)
+
+    def cached(self, service_id: str) -> Optional[SchemaSnapshot]:
+        return self._snapshots.get(service_id)
+
+    async def get(self, service_id: str, connect: Callable[[str], Awaitable[tuple]],
+                  refresh: bool = False) -> SchemaSnapshot:
+        """Return the snapshot for a service, building or refreshing it first if needed.
+
+        connect(service_id) must return a (pool, connection) pair.
+        """
+        snapshot = self._snapshots.get(service_id)
+        if (snapshot is not None and not refresh and service_id not in self._dirty
+                and snapshot.age < self.refresh_interval):
+            return snapshot
+        return await self._flight.do(service_id, lambda: self._load(service_id, connect))
+
+    async def _load(self, service_id: str, connect: Callable[[str], Awaitable[tuple]]) -> SchemaSnapshot:
+        # Take the dirty set first so DDL that lands during the refresh marks the service again
+        dirty = self._dirty.pop(service_id, set())
+        try:
+            pool, conn = await connect(service_id)
+            discard = True
+            try:
+                previous = self._snapshots.get(service_id)
+                if previous is None:
+                    snapshot = await pool.run(conn, build_snapshot)
+                    self.full_builds += 1
+                else:
+                    snapshot = await pool.run(conn, refresh_snapshot, previous, dirty)
+                    self.refreshes += 1
+                discard = False
+            finally:
+                await pool.release(conn, discard=discard)
+        except BaseException:
+            self.mark_dirty(service_id, dirty)
+            raise
+        logger.debug(f"Schema of service {service_id}: {snapshot.table_count} tables, "
+                     f"{snapshot.tables_loaded} loaded")
+        self._snapshots[service_id] = snapshot
+        return snapshot
+
+
+def _cell(value: Any) -> str:
+    if value is None or value == []:
+        return ""
+    if isinstance(value, list):
+        value = ", ".join(str(v) for v in value)
+    return str(value).replace("|", "\\|").replace("\n", " ")
+
+
+def _table(headers: List[str], rows: List[List[Any]]) -> str:
+    lines = ["| " + " | ".join(headers) + " |", "| " + " | ".join("---" for _ in headers) + " |"]
+    lines.extend("| " + " | ".join(_cell(v) for v in row) + " |" for row in rows)
+    return "\n".join(lines)
+
+
+def render_overview(snapshot: SchemaSnapshot) -> str:
+    rows = [
+        [db_name, len(tables), sum(info.rows or 0 for info in tables.values())]
+        for db_name, tables in sorted(snapshot.databases.items())
+    ]
+    return (f"{len(snapshot.databases)} databases, {snapshot.table_count} tables "
+            f"(snapshot {snapshot.age:.0f}s old)\n\n" + _table(["Database", "Tables", "Rows (estimate)"], rows))
+
+
+def render_database(snapshot: SchemaSnapshot, database: str) -> str:
+    tables = snapshot.databases[database]
+    rows = [
+        [s["name"], s["type"], s["engine"], s["rows_estimate"], s["columns"], s["primary_key"], s["updated"]]
+        for s in (info.summary() for _, info in sorted(tables.items()))
+    ]
+    return (f"## {database} ({len(tables)} tables)\n\n"
+            + _table(["Table", "Type", "Engine", "Rows (estimate)", "Columns", "Primary key", "Updated"], rows))
+
+
+def render_table(info: TableInfo) -> str:
+    sections = [f"## {info.database}.{info.name}",
+                f"{'View' if info.is_view else 'Table'}, engine {info.engine}, ~{info.rows or 0} rows"
+                + (f". {info.comment}" if info.comment else "")]
+    sections.append(_table(
+        ["Column", "Type", "Nullable", "Default", "Key", "Extra"],
+        [[c["name"], c["type"], "YES" if c["nullable"] else "NO", c["default"], c["key"], c["extra"]]
+         for c in info.columns]
+    ))
+    if info.indexes:
+        sections.append("### Indexes\n\n" + _table(
+            ["Index", "Unique", "Type", "Columns"],
+            [[name, "YES" if index["unique"] else "NO", index["type"], index["columns"]]
+             for name, index in info.indexes.items()]
+        ))
+    if info.foreign_keys:
+        sections.append("### Foreign keys\n\n" + _table(
+            ["Constraint", "Columns", "References"],
+            [[name, fk["columns"], f"{fk['references']} ({', '.join(fk['referenced_columns'])})"]
+             for name, fk in info.foreign_keys.items()]
+        ))
+    return "\n\n".join(sections)
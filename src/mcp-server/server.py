@@ -3,12 +3,36 @@ import httpx
 import json
 import logging
 import sys
+import time
 import signal
+import asyncio
+from contextlib import asynccontextmanager
 from typing import Optional, List, Dict, Any, Union
-from fastmcp import FastMCP
+from fastmcp import FastMCP, Context
+from fastmcp.exceptions import ResourceError
 from pydantic import BaseModel
 from dotenv import load_dotenv
-import pymysql as mysql_connector
+from db_pool import db_pools, mysql_connector, PoolError, QueryTimeout
+from api_client import api_clients
+from cache import ResultCache, TTLCache, SingleFlight
+from results import OpenCursorRegistry, default_max_bytes, default_max_rows, read_next_page, run_query
+from formats import FORMATS, is_text_format, render, render_data, render_text, to_json
+from batch import run_batch
+from bulk_load import BulkLoader, Source, default_batch_size, resolve_path
+from sql_analysis import (SCHEMA_TAG, is_cacheable, is_explainable, is_read_only, normalize, read_tags, table_tag,
+                          write_tags)
+from schema import SchemaRegistry, render_database, render_overview, render_table
+from fanout import TargetResult, match_services, merge_pages, run_all
+from operations import OperationTracker
+from inventory import ServiceInventory, filter_services
+from agents import AgentRegistry
+from copilot import chat
+from state import api_key_scope, create_backend
+from drain import DrainMiddleware
+from prewarm import PrewarmMiddleware
+from guardrails import (default_max_estimated_rows, default_max_execution_time, estimate_rows, reject_expensive,
+                        timeout_grace)
+import metrics
 
 # Configure logging with both file and console handlers
 logging.basicConfig(
@@ -21,30 +45,36 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Signal handler for graceful shutdown
-def signal_handler(signum, frame):
-    logger.info(f"Signal handler called with signal {signum} from frame {frame}")
-    sys.exit(0)
-
-signal.signal(signal.SIGTERM, signal_handler)
-signal.signal(signal.SIGINT, signal_handler)
-
 # Load environment variables from .env file
 load_dotenv()
 
-# Initialize MCP server with debug info
 logger.info("Initializing MCP server...")
-logger.debug("Python version: %s", sys.version)
-logger.debug("Working directory: %s", os.getcwd())
-logger.debug("Environment variables: %s", list(os.environ.keys()))
-logger.debug("stdin isatty: %s", sys.stdin.isatty())
-logger.debug("stdout isatty: %s", sys.stdout.isatty())
-logger.debug("stderr isatty: %s", sys.stderr.isatty())
-logger.debug("sys.argv: %s", sys.argv)
-logger.debug("sys.executable: %s", sys.executable)
-logger.debug("sys.path: %s", sys.path)
-
-mcp = FastMCP("SkySQL MCP Server")
+
+@asynccontextmanager
+async def lifespan(server):
+    try:
+        yield
+    finally:
+        await tool_drain.drain(float(os.getenv("SKYSQL_DRAIN_TIMEOUT", "30")))
+        await _prewarmer.close()
+        logger.info("Closing API clients and database connection pools...")
+        await _operations.close()
+        await _inventory.close()
+        await api_clients.close_all()
+        await _open_cursors.close_all()
+        db_pools.close_all()
+        await _state.close()
+
+# Tool calls in flight, waited for on shutdown
+tool_drain = DrainMiddleware()
+
+mcp = FastMCP("SkySQL MCP Server", lifespan=lifespan)
+mcp.add_middleware(tool_drain)
+mcp.add_middleware(metrics.MetricsMiddleware())
+
+# State shared with other server processes, if SKYSQL_STATE_BACKEND is set,
+# and kept apart from that of servers using another API key
+_state = create_backend(os.getenv("SKYSQL_STATE_BACKEND"), scope=api_key_scope(os.getenv("SKYSQL_API_KEY", "")))
 
 # Models for request/response handling
 class ServerlessDBResponse(BaseModel):
@@ -66,167 +96,301 @@ class LlamaResponse(BaseModel):
     error_text: str
     col_keys: List[str]
 
-# Cache to store agent information
-_agent_cache = {}
+class DBCredentials(BaseModel):
+    service_id: str
+    host: Optional[str]
+    port: Optional[int]
+    username: Optional[str]
+    password: Optional[str]
+
+    def is_complete(self) -> bool:
+        return bool(self.host and self.port and self.username is not None and self.password is not None)
+
+class CredentialsError(Exception):
+    """Raised when connection details for a service cannot be resolved"""
+
+# Cache of connection details, keyed by service_id
+_credentials_cache = TTLCache(
+    max_size=int(os.getenv("SKYSQL_CREDENTIALS_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("SKYSQL_CREDENTIALS_CACHE_TTL", "300"))
+)
+_credentials_flight = SingleFlight()
+
+# Partially read result sets waiting for fetch_next_page
+_open_cursors = OpenCursorRegistry(
+    max_open=int(os.getenv("SKYSQL_MAX_OPEN_CURSORS", "16")),
+    ttl=float(os.getenv("SKYSQL_CURSOR_TTL", "300"))
+)
+# Whether truncated results get a page_token; see disable_page_tokens
+_page_tokens = True
+
+def disable_page_tokens():
+    """Truncate results without a page_token, for deployments where any process may serve the next request"""
+    global _page_tokens
+    _page_tokens = False
+
+# Rendered results of read-only queries, dropped when a write through this
+# server touches one of their tables
+_result_cache = ResultCache(
+    max_bytes=int(os.getenv("SKYSQL_RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    ttl=float(os.getenv("SKYSQL_RESULT_CACHE_TTL", "60"))
+)
 
-# SkySQL API client helper
+def _result_cache_enabled(use_cache: Optional[bool]) -> bool:
+    if use_cache is not None:
+        return use_cache
+    return os.getenv("SKYSQL_RESULT_CACHE", "false").lower() in ("1", "true", "yes")
+
+# Schema snapshots behind describe_schema and the schema resources
+_schemas = SchemaRegistry(refresh_interval=float(os.getenv("SKYSQL_SCHEMA_REFRESH_INTERVAL", "300")))
+
+def _record_write(service_id: str, sql: str):
+    """Drop cached results and schema details that a statement may have changed"""
+    tags = write_tags(sql)
+    if tags is None:
+        _result_cache.invalidate_service(service_id)
+        _schemas.mark_dirty(service_id)
+    elif tags:
+        _result_cache.invalidate_tags(service_id, tags)
+        if SCHEMA_TAG in tags:
+            _schemas.mark_dirty(service_id, tags - {SCHEMA_TAG})
+
+# SkySQL API client helper; returns the shared client for the configured API key
 async def get_skysql_client():
     api_key = os.getenv("SKYSQL_API_KEY")
-    logger.info(f"API key is configured: {bool(api_key)}")
 
     if not api_key:
         raise ValueError("SKYSQL_API_KEY not configured")
 
-    return httpx.AsyncClient(
-        base_url="https://api.skysql.com",
-        headers={"X-API-Key": api_key, "Content-Type": "application/json"},
-        timeout=30.0  # Increase timeout to 30 seconds
-    )
+    return api_clients.get(api_key)
 
 # Tool for listing available DB agents
+async def _fetch_agents() -> List[Dict[str, Any]]:
+    client = await get_skysql_client()
+    response = await client.get("/copilot/v1/agent/")
+    response.raise_for_status()
+    return response.json()
+
+_agent_negative_ttl = float(os.getenv("SKYSQL_AGENT_NEGATIVE_TTL", "60"))
+
+# Copilot agents, refreshed after a TTL. A list another process fetched is
+# only reused within the negative TTL, so an unknown agent ID still causes a
+# refresh after that long
+_agents = AgentRegistry(
+    lambda: _state.read_through("agents", "all", _agent_negative_ttl, _fetch_agents),
+    ttl=float(os.getenv("SKYSQL_AGENT_CACHE_TTL", "300")),
+    negative_ttl=_agent_negative_ttl
+)
+
 @mcp.tool()
-async def list_agents() -> str:
-    """List all available SkySQL DB agents with their capabilities"""
-    async with await get_skysql_client() as client:
-        try:
-            response = await client.get("/copilot/v1/agent/")
-            response.raise_for_status()
-            agents = response.json()
-
-            # Cache agent information
-            global _agent_cache
-            _agent_cache = {agent['id']: agent for agent in agents}
-
-            # Format the output to clearly show agent names and datasource IDs
-            formatted_agents = []
-            for agent in agents:
-                agent_info = f"Name: {agent['name']}\n"
-                agent_info += f"ID: {agent['id']}\n"
-                agent_info += f"Type: {agent['type']}\n"
-                if 'datasource_id' in agent:
-                    agent_info += f"Datasource ID: {agent['datasource_id']}\n"
-                else:
-                    agent_info += "Datasource ID: None\n"
-                if 'description' in agent:
-                    agent_info += f"Description: {agent['description']}\n"
-                agent_info += "---"
-                formatted_agents.append(agent_info)
-
-            return "\n\n".join(formatted_agents)
-        except httpx.HTTPError as e:
-            return f"Failed to list agents: {str(e)}"
+async def list_agents(refresh: bool = False) -> str:
+    """List all available SkySQL DB agents with their capabilities.
+
+    The list is cached; set refresh=True to fetch it again.
+    """
+    try:
+        if refresh:
+            await _state.delete("agents", "all")
+        agents = await _agents.agents(refresh)
+
+        # Format the output to clearly show agent names and datasource IDs
+        formatted_agents = []
+        for agent in agents:
+            agent_info = f"Name: {agent['name']}\n"
+            agent_info += f"ID: {agent['id']}\n"
+            agent_info += f"Type: {agent['type']}\n"
+            if 'datasource_id' in agent:
+                agent_info += f"Datasource ID: {agent['datasource_id']}\n"
+            else:
+                agent_info += "Datasource ID: None\n"
+            if 'description' in agent:
+                agent_info += f"Description: {agent['description']}\n"
+            agent_info += "---"
+            formatted_agents.append(agent_info)
+
+        return "\n\n".join(formatted_agents)
+    except httpx.HTTPError as e:
+        return f"Failed to list agents: {str(e)}"
 
 # Tool for launching a serverless DB
 @mcp.tool()
 async def launch_serverless_db(name: str, region: str = "eastus", provider: str = "azure") -> str:
-    """Launch a new Serverless DB instance in SkySQL"""
+    """Launch a new Serverless DB instance in SkySQL.
+
+    Provisioning continues in the background; use wait_until_ready to wait for it.
+    """
     # Convert name to lowercase
     name = name.lower()
 
-    async with await get_skysql_client() as client:
-        try:
-            payload = {
-                "topology": "serverless-standalone",
-                "provider": provider,
-                "region": region,
-                "name": name
-            }
-            logger.debug(f"Launching serverless DB with payload: {json.dumps(payload, indent=2)}")
-            response = await client.post(
-                "/provisioning/v1/services",
-                json=payload
-            )
-            logger.debug(f"Launch response status: {response.status_code}")
-            logger.debug(f"Launch response body: {response.text}")
+    try:
+        data = await _launch_service(name, region, provider)
+        return (f"Successfully launched serverless DB '{name}' with ID: {data['id']}. "
+                f"Status: {data.get('status', 'unknown')}; call wait_until_ready to wait until it is ready.")
+    except httpx.HTTPError as e:
+        logger.error(f"Failed to launch DB: {str(e)}")
+        if isinstance(e, httpx.HTTPStatusError):
+            logger.error(f"Error response body: {e.response.text}")
+        return f"Failed to launch DB: {str(e)}"
 
-            response.raise_for_status()
-            data = response.json()
-            return f"Successfully launched serverless DB '{name}' with ID: {data['id']}"
-        except httpx.HTTPError as e:
-            logger.error(f"Failed to launch DB: {str(e)}")
-            if isinstance(e, httpx.HTTPStatusError):
-                logger.error(f"Error response body: {e.response.text}")
-            return f"Failed to launch DB: {str(e)}"
+async def _launch_service(name: str, region: str, provider: str) -> Dict[str, Any]:
+    """Create a serverless service and start watching its provisioning"""
+    client = await get_skysql_client()
+    payload = {
+        "topology": "serverless-standalone",
+        "provider": provider,
+        "region": region,
+        "name": name
+    }
+    logger.debug(f"Launching serverless DB with payload: {json.dumps(payload, indent=2)}")
+    response = await client.post(
+        "/provisioning/v1/services",
+        json=payload
+    )
+    logger.debug(f"Launch response status: {response.status_code}")
+    logger.debug(f"Launch response body: {response.text}")
+
+    response.raise_for_status()
+    data = response.json()
+    _inventory.upsert(data)
+    _operations.watch(data['id'], "create", data.get('status'), name)
+    return data
+
+@mcp.tool()
+async def launch_serverless_dbs(names: List[str], region: str = "eastus", provider: str = "azure") -> str:
+    """Launch several Serverless DB instances in SkySQL at once.
+
+    Provisioning continues in the background; use wait_until_ready with service_ids
+    to wait for all of them.
+    """
+    names = list(dict.fromkeys(name.lower() for name in names))
+    results = await asyncio.gather(*(_launch_service(name, region, provider) for name in names),
+                                   return_exceptions=True)
+    lines = []
+    for name, result in zip(names, results):
+        # One failure must not hide the IDs of the services that did launch
+        if isinstance(result, httpx.HTTPError):
+            logger.error(f"Failed to launch DB {name}: {str(result)}")
+            lines.append(f"- {name}: Failed to launch DB: {str(result)}")
+        elif isinstance(result, Exception):
+            logger.error(f"Failed to launch DB {name}", exc_info=result)
+            lines.append(f"- {name}: Failed to launch DB: {type(result).__name__}: {str(result)}")
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            lines.append(f"- {name}: launched with ID {result['id']} (status: {result.get('status', 'unknown')})")
+    return "\n".join(lines)
 
 # Tool for deleting a DB
 @mcp.tool()
 async def delete_db(service_id: str) -> str:
     """Delete a DB instance from SkySQL"""
-    async with await get_skysql_client() as client:
-        try:
-            logger.debug(f"Attempting to delete DB with ID: {service_id}")
-            response = await client.delete(f"/provisioning/v1/services/{service_id}")
-            logger.debug(f"Delete response status: {response.status_code}")
-            logger.debug(f"Delete response body: {response.text}")
+    client = await get_skysql_client()
+    try:
+        logger.debug(f"Attempting to delete DB with ID: {service_id}")
+        response = await client.delete(f"/provisioning/v1/services/{service_id}")
+        logger.debug(f"Delete response status: {response.status_code}")
+        logger.debug(f"Delete response body: {response.text}")
             
-            response.raise_for_status()
-            return f"Successfully deleted DB with ID: {service_id}"
-        except httpx.HTTPError as e:
-            logger.error(f"Failed to delete DB: {str(e)}")
-            if isinstance(e, httpx.HTTPStatusError):
-                logger.error(f"Error response body: {e.response.text}")
-            return f"Failed to delete DB: {str(e)}"
+        response.raise_for_status()
+        await _forget_credentials(service_id)
+        _result_cache.invalidate_service(service_id)
+        _schemas.forget(service_id)
+        db_pools.close_pool(service_id)
+        _operations.watch(service_id, "delete")
+        return (f"Successfully deleted DB with ID: {service_id}. "
+                f"Deletion continues in the background; wait_until_ready reports when it is gone.")
+    except httpx.HTTPError as e:
+        logger.error(f"Failed to delete DB: {str(e)}")
+        if isinstance(e, httpx.HTTPStatusError):
+            logger.error(f"Error response body: {e.response.text}")
+        return f"Failed to delete DB: {str(e)}"
+
+# Recent agent answers keyed by (agent_id, question), the requests in
+# flight, and the callers relaying each in-flight answer as it streams
+_agent_responses = TTLCache(max_size=256, ttl=float(os.getenv("SKYSQL_AGENT_RESPONSE_TTL", "30")))
+_agent_flight = SingleFlight()
+_agent_listeners: Dict[tuple, List[Any]] = {}
+
+def _format_agent_response(chat_data: Dict[str, Any]) -> str:
+    # Format response with both explanation and SQL
+    response_parts = []
+    if chat_data["response"]["content"]:
+        response_parts.append(f"Analysis: {chat_data['response']['content']}")
+    if chat_data["response"]["sql_text"]:
+        response_parts.append(f"Generated SQL:\n```sql\n{chat_data['response']['sql_text']}\n```")
+    if chat_data["response"]["error_text"]:
+        response_parts.append(f"Errors: {chat_data['response']['error_text']}")
+    return "\n\n".join(response_parts)
+
+async def _ask(key: tuple, agent_info: Dict[str, Any], question: str, timeout: float) -> str:
+    client = await get_skysql_client()
+    # Prepare request payload
+    request_payload = {
+        "prompt": question,
+        "agent_id": agent_info['id'],
+        "config": {}
+    }
+    # Only add datasource_id for DBA agents, not for IMDB or other agents
+    if agent_info.get('type') == 'dba' and 'datasource_id' in agent_info:
+        request_payload["datasource_id"] = agent_info["datasource_id"]
+
+    logger.debug(f"Sending chat request with payload: {json.dumps(request_payload, indent=2)}")
+
+    async def relay(text: str, total: int):
+        await asyncio.gather(*(listener(text, total) for listener in list(_agent_listeners.get(key, ()))))
+
+    chat_data = await chat(client, request_payload, timeout, retries=int(os.getenv("SKYSQL_AGENT_RETRIES", "2")),
+                           on_text=relay)
+    result = _format_agent_response(chat_data)
+    _agent_responses.set(key, result)
+    await _state.set("agent_answers", json.dumps(key), result, _agent_responses.ttl)
+    return result
 
 # Tool for asking questions to DB agents
 @mcp.tool()
-async def ask_agent(agent_id: str, question: str) -> str:
-    """Ask a question to a specific DB agent"""
-    async with await get_skysql_client() as client:
-        try:
-            # Get agent info from cache
-            if agent_id not in _agent_cache:
-                # If agent not in cache, refresh the cache
-                await list_agents()
-                if agent_id not in _agent_cache:
-                    return f"Agent {agent_id} not found. Please check the agent ID and try again."
-            
-            agent_info = _agent_cache[agent_id]
-            # Prepare request payload
-            request_payload = {
-                "prompt": question,
-                "agent_id": agent_id,
-                "config": {}
-            }
-            # Only add datasource_id for DBA agents, not for IMDB or other agents
-            if agent_info.get('type') == 'dba' and 'datasource_id' in agent_info:
-                request_payload["datasource_id"] = agent_info["datasource_id"]
-            
-            logger.debug(f"Sending chat request with payload: {json.dumps(request_payload, indent=2)}")
-
-            # Send the chat request directly
-            try:
-                chat_response = await client.post(
-                    "/copilot/v1/chat/",
-                    json=request_payload
-                )
-
-                # Log response details for debugging
-                logger.debug(f"Response status: {chat_response.status_code}")
-                logger.debug(f"Response headers: {dict(chat_response.headers)}")
-                logger.debug(f"Response body: {chat_response.text}")
-                
-                chat_response.raise_for_status()
-                chat_data = chat_response.json()
-
-                # Format response with both explanation and SQL
-                response_parts = []
-                if chat_data["response"]["content"]:
-                    response_parts.append(f"Analysis: {chat_data['response']['content']}")
-                if chat_data["response"]["sql_text"]:
-                    response_parts.append(f"Generated SQL:\n```sql\n{chat_data['response']['sql_text']}\n```")
-                if chat_data["response"]["error_text"]:
-                    response_parts.append(f"Errors: {chat_data['response']['error_text']}")
-
-                return "\n\n".join(response_parts)
-            except httpx.TimeoutException as e:
-                logger.error(f"Request timed out after {client.timeout} seconds")
-                return f"Request timed out. The API is taking longer than expected to respond. You may want to try again or check if the API is experiencing delays."
+async def ask_agent(agent_id: str, question: str, timeout: Optional[float] = None, ctx: Context = None) -> str:
+    """Ask a question to a specific DB agent.
 
-        except httpx.HTTPError as e:
-            logger.error(f"Exception details: {str(e)}")
-            if isinstance(e, httpx.HTTPStatusError):
-                logger.error(f"Error response body: {e.response.text}")
-            return f"Failed to get response from agent: {str(e)}"
+    If the API streams its answer, partial text is relayed as progress notifications.
+    timeout is in seconds and defaults to SKYSQL_ASK_AGENT_TIMEOUT. The same question
+    asked of the same agent at the same time is sent only once, and repeated
+    questions are answered from a short-lived cache.
+    """
+    timeout = timeout or float(os.getenv("SKYSQL_ASK_AGENT_TIMEOUT", "120"))
+    key = (agent_id, " ".join(question.split()))
+    cached = _agent_responses.get(key)
+    if cached is None:
+        cached = await _state.get("agent_answers", json.dumps(key))
+    if cached is not None:
+        return cached
+
+    listener = None
+    try:
+        agent_info = await _agents.get(agent_id)
+        if agent_info is None:
+            return f"Agent {agent_id} not found. Please check the agent ID and try again."
+
+        if ctx:
+            async def listener(text: str, total: int):
+                await ctx.report_progress(progress=total, message=text)
+            _agent_listeners.setdefault(key, []).append(listener)
+        return await _agent_flight.do(key, lambda: _ask(key, agent_info, question, timeout))
+
+    except httpx.TimeoutException as e:
+        logger.error(f"Request timed out after {timeout} seconds: {str(e)}")
+        return (f"Request timed out after {timeout:g} seconds. The API is taking longer than expected to respond. "
+                f"You may want to try again with a larger timeout or check if the API is experiencing delays.")
+    except httpx.HTTPError as e:
+        logger.error(f"Exception details: {str(e)}")
+        if isinstance(e, httpx.HTTPStatusError):
+            logger.error(f"Error response body: {e.response.text}")
+        return f"Failed to get response from agent: {str(e)}"
+    finally:
+        if listener is not None:
+            listeners = _agent_listeners.get(key, [])
+            listeners.remove(listener)
+            if not listeners:
+                _agent_listeners.pop(key, None)
 
 # Prompts for common operations
 @mcp.prompt()
@@ -254,189 +418,835 @@ def ask_agent_prompt() -> str:
 2. Your question about database management
 """
 
+async def _fetch_service(service_id: str) -> Optional[Dict[str, Any]]:
+    """Get one service's details, or None if it does not exist"""
+    client = await get_skysql_client()
+    logger.debug(f"Fetching service details for ID: {service_id}")
+    response = await client.get(f"/provisioning/v1/services/{service_id}")
+    if response.status_code == 404:
+        _inventory.remove(service_id)
+        return None
+    response.raise_for_status()
+    service = response.json()
+    _inventory.upsert(service)
+    return service
+
+async def _fetch_all_services() -> List[Dict[str, Any]]:
+    client = await get_skysql_client()
+    logger.debug("Fetching all database services")
+    response = await client.get("/provisioning/v1/services")
+    response.raise_for_status()
+    return response.json()
+
+_inventory_ttl = float(os.getenv("SKYSQL_INVENTORY_TTL", "30"))
+
+# All services of the account, indexed by id and name; a list another
+# process fetched less than a TTL ago is reused
+_inventory = ServiceInventory(
+    lambda: _state.read_through("services", "all", _inventory_ttl, _fetch_all_services),
+    ttl=_inventory_ttl,
+    max_stale=float(os.getenv("SKYSQL_INVENTORY_MAX_STALE", "300"))
+)
+
+# Pollers for services being launched or deleted
+_operations = OperationTracker(
+    _fetch_service,
+    store=_state,
+    initial_delay=float(os.getenv("SKYSQL_POLL_INITIAL_DELAY", "2")),
+    max_delay=float(os.getenv("SKYSQL_POLL_MAX_DELAY", "30")),
+    max_duration=float(os.getenv("SKYSQL_OPERATION_TIMEOUT", "3600"))
+)
+
+async def _fetch_db_credentials(service_id: str) -> Optional[DBCredentials]:
+    client = await get_skysql_client()
+
+    # First get the service details to get hostname and port; the inventory
+    # has them unless the service is new or still provisioning
+    service = _inventory.get(service_id)
+    if service is None or not (service.get('fqdn') and service.get('endpoints')):
+        service = await _fetch_service(service_id)
+    if service is None:
+        return None
+
+    # Extract hostname and port from service details
+    endpoint = service['endpoints'][0] if service.get('endpoints') else {}
+    port = endpoint.get('ports', [{}])[0].get('port') if endpoint.get('ports') else None
+
+    # Now get the credentials
+    logger.debug(f"Fetching credentials for DB with ID: {service_id}")
+    creds_response = await client.get(f"/provisioning/v1/services/{service_id}/security/credentials")
+    logger.debug(f"Credentials response status: {creds_response.status_code}")
+
+    creds_response.raise_for_status()
+    creds_data = creds_response.json()
+
+    creds = DBCredentials(
+        service_id=service_id,
+        host=service.get('fqdn'),
+        port=port,
+        username=creds_data.get('username'),
+        password=creds_data.get('password')
+    )
+    # Services that are still provisioning have no endpoint yet; don't cache those.
+    # Passwords stay in this process, out of the shared state backend
+    if creds.is_complete():
+        _credentials_cache.set(service_id, creds)
+    return creds
+
+async def _forget_credentials(service_id: str):
+    _credentials_cache.invalidate(service_id)
+
+async def get_service_credentials(service_id: str) -> Optional[DBCredentials]:
+    """Return connection details for a service from the cache, fetching them on a miss"""
+    creds = _credentials_cache.get(service_id)
+    if creds is None:
+        creds = await _credentials_flight.do(service_id, lambda: _fetch_db_credentials(service_id))
+    return creds
+
+async def get_db_connection(service_id: str, time_limit: float = 0, write_timeout: int = 0):
+    """Check out a pooled connection to a service as a (pool, connection) pair.
+
+    Statements on it are aborted by the server after time_limit seconds (0
+    for no limit). A write_timeout raises the session's net_write_timeout to
+    that many seconds, for connections that may park a cursor. Cached
+    credentials are refreshed once if the server rejects them, e.g. after a
+    password rotation.
+    """
+    for attempt in range(2):
+        with metrics.phase("credentials", service_id=service_id):
+            creds = await get_service_credentials(service_id)
+        if creds is None:
+            raise CredentialsError(f"Service with ID {service_id} not found")
+        if not creds.is_complete():
+            raise CredentialsError("Missing connection details")
+
+        pool = db_pools.get_pool(service_id, creds.host, creds.port, creds.username, creds.password)
+        try:
+            with metrics.phase("connect", service_id=service_id):
+                conn = await pool.acquire()
+        except mysql_connector.OperationalError as e:
+            if e.args[0] != mysql_connector.constants.ER.ACCESS_DENIED_ERROR or attempt:
+                raise
+            logger.info(f"Access denied for service {service_id}, refreshing credentials")
+            await _forget_credentials(service_id)
+            continue
+        try:
+            await pool.set_time_limit(conn, time_limit, write_timeout)
+        except BaseException:
+            await pool.release(conn, discard=True)
+            raise
+        return pool, conn
+
+def _connection_error_message(e: Exception) -> str:
+    """Describe an httpx, CredentialsError, PoolError or pymysql error raised by get_db_connection"""
+    if isinstance(e, httpx.HTTPError):
+        logger.error(f"Failed to fetch credentials: {str(e)}")
+        return f"Failed to fetch credentials: {str(e)}"
+    if isinstance(e, mysql_connector.Error):
+        return f"Database connection error [{e.args[0]}]: {e.args[1]}"
+    if isinstance(e, PoolError):
+        return f"Database connection error: {str(e)}"
+    return str(e)
+
+@mcp.tool()
+async def wait_until_ready(service_id: Optional[str] = None, timeout: float = 600,
+                           service_ids: Optional[List[str]] = None, ctx: Context = None) -> str:
+    """Wait until launched services are ready (or deleted services are gone), up to timeout seconds.
+
+    Pass one service_id or several service_ids. Progress notifications are sent
+    on every status change. With timeout=0 the current status is returned at once.
+    """
+    ids = list(dict.fromkeys(([service_id] if service_id else []) + (service_ids or [])))
+    if not ids:
+        return "Provide service_id or service_ids"
+    operations = [_operations.watch(i) for i in ids]
+
+    async def report(ops):
+        if ctx:
+            await ctx.report_progress(
+                progress=sum(1 for op in ops if op.done),
+                total=len(ops),
+                message="; ".join(f"{op.name or op.service_id}: {op.status or 'checking'}" for op in ops)
+            )
+
+    await report(operations)
+    finished = await _operations.wait(operations, timeout, report)
+
+    lines = []
+    for op in operations:
+        label = f"{op.name} ({op.service_id})" if op.name else op.service_id
+        if op.error:
+            lines.append(f"- {label}: {op.error} after {op.elapsed:.1f} s")
+        elif op.done:
+            lines.append(f"- {label}: {op.status} after {op.elapsed:.1f} s")
+        else:
+            lines.append(f"- {label}: still {op.status or 'unknown'} after {op.elapsed:.1f} s")
+    if not finished:
+        lines.append(f"Timed out after {timeout:g} s; polling continues in the background, call wait_until_ready again.")
+    return "\n".join(lines)
+
 @mcp.tool()
 async def get_db_credentials(service_id: str) -> str:
     """Get the credentials for a SkySQL database instance"""
-    async with await get_skysql_client() as client:
-        try:
-            # First get the service details to get hostname and port
-            logger.debug(f"Fetching service details for ID: {service_id}")
-            services_response = await client.get("/provisioning/v1/services")
-            services_response.raise_for_status()
-            services = services_response.json()
-            
-            # Find the matching service
-            service = next((s for s in services if s['id'] == service_id), None)
-            if not service:
-                return f"Service with ID {service_id} not found"
-            
-            # Extract hostname and port from service details
-            hostname = service.get('fqdn', 'N/A')
-            endpoint = service['endpoints'][0] if service.get('endpoints') else {}
-            port = endpoint.get('ports', [{}])[0].get('port', 'N/A') if endpoint.get('ports') else 'N/A'
-
-            # Now get the credentials
-            logger.debug(f"Fetching credentials for DB with ID: {service_id}")
-            creds_response = await client.get(f"/provisioning/v1/services/{service_id}/security/credentials")
-            logger.debug(f"Credentials response status: {creds_response.status_code}")
-            
-            creds_response.raise_for_status()
-            creds_data = creds_response.json()
-
-            return f"""Database Credentials:
-Host: {hostname}
-Port: {port}
-Username: {creds_data.get('username', 'N/A')}
-Password: {creds_data.get('password', 'N/A')}"""
-        except httpx.HTTPError as e:
-            logger.error(f"Failed to fetch credentials: {str(e)}")
-            if isinstance(e, httpx.HTTPStatusError):
-                logger.error(f"Error response body: {e.response.text}")
-            return f"Failed to fetch credentials: {str(e)}"
+    try:
+        creds = await get_service_credentials(service_id)
+        if creds is None:
+            return f"Service with ID {service_id} not found"
+
+        return f"""Database Credentials:
+Host: {creds.host or 'N/A'}
+Port: {creds.port or 'N/A'}
+Username: {creds.username or 'N/A'}
+Password: {creds.password or 'N/A'}"""
+    except httpx.HTTPError as e:
+        logger.error(f"Failed to fetch credentials: {str(e)}")
+        if isinstance(e, httpx.HTTPStatusError):
+            logger.error(f"Error response body: {e.response.text}")
+        return f"Failed to fetch credentials: {str(e)}"
 
 @mcp.tool()
 async def update_ip_allowlist(service_id: str) -> str:
     """Update the IP allowlist for a SkySQL database instance with the current IP"""
-    async with await get_skysql_client() as client:
+    client = await get_skysql_client()
+    try:
+        # First get the current IP
+        ip_response = await client.get("https://checkip.amazonaws.com")
+        ip_response.raise_for_status()
+        current_ip = ip_response.text.strip()
+
+        logger.debug(f"Current IP address: {current_ip}")
+
+        # Update the allowlist
+        payload = {
+            "ip_address": f"{current_ip}/32"
+        }
+        response = await client.post(
+            f"/provisioning/v1/services/{service_id}/security/allowlist",
+            json=payload
+        )
+        logger.debug(f"Allowlist update response status: {response.status_code}")
+
+        response.raise_for_status()
+        return f"Successfully added IP {current_ip} to the allowlist for service {service_id}"
+    except httpx.HTTPError as e:
+        logger.error(f"Failed to update IP allowlist: {str(e)}")
+        if isinstance(e, httpx.HTTPStatusError):
+            logger.error(f"Error response body: {e.response.text}")
+        return f"Failed to update IP allowlist: {str(e)}"
+
+def _format_service(service: Dict[str, Any]) -> str:
+    # Get endpoint details
+    endpoint = service['endpoints'][0] if service.get('endpoints') else {}
+    port = endpoint.get('ports', [{}])[0].get('port', 'N/A') if endpoint.get('ports') else 'N/A'
+
+    service_info = [
+        f"Service: {service['name']}",
+        f"ID: {service['id']}",
+        f"Status: {service['status']}",
+        f"Type: {service['service_type']}",
+        f"Provider: {service['provider']}",
+        f"Region: {service['region']}",
+        f"Version: {service.get('version', 'N/A')}",
+        f"FQDN: {service.get('fqdn', 'N/A')}",
+        f"Port: {port}",
+        f"Created: {service.get('created_on', 'N/A')}",
+        "---"
+    ]
+    return "\n".join(service_info)
+
+@mcp.tool()
+async def list_services(status: Optional[str] = None, provider: Optional[str] = None, region: Optional[str] = None,
+                        name_prefix: Optional[str] = None, limit: int = 50, offset: int = 0,
+                        compact: bool = False, refresh: bool = False) -> str:
+    """List SkySQL database services, optionally filtered by status, provider, region or name prefix.
+
+    Returns at most limit services starting at offset. compact=True gives one
+    table row per service instead of a full block. The list is cached briefly;
+    set refresh=True to fetch it again.
+    """
+    try:
+        if refresh:
+            await _state.delete("services", "all")
+        services = await _inventory.services(refresh)
+    except httpx.HTTPError as e:
+        logger.error(f"Failed to list services: {str(e)}")
+        if isinstance(e, httpx.HTTPStatusError):
+            logger.error(f"Error response body: {e.response.text}")
+        return f"Failed to list services: {str(e)}"
+
+    if not services:
+        return "No database services found"
+    services = filter_services(services, status, provider, region, name_prefix)
+    if not services:
+        return "No database services match the given filters"
+
+    offset = max(offset, 0)
+    page = services[offset:offset + max(limit, 1)]
+    if not page:
+        return f"No services at offset {offset}; {len(services)} services match"
+    if compact:
+        lines = ["| Name | ID | Status | Provider | Region | Version |", "| --- | --- | --- | --- | --- | --- |"]
+        lines.extend(f"| {s.get('name')} | {s.get('id')} | {s.get('status')} | {s.get('provider')} | "
+                     f"{s.get('region')} | {s.get('version', 'N/A')} |" for s in page)
+        result = "\n".join(lines)
+    else:
+        # Format each service's information
+        result = "\n\n".join(_format_service(service) for service in page)
+    end = offset + len(page)
+    if offset or end < len(services):
+        result += f"\n\nShowing services {offset + 1}-{end} of {len(services)}"
+        if end < len(services):
+            result += f"; call again with offset={end} for more"
+    return result
+
+async def _render_page(service_id: str, pool, conn, cursor, page, fmt: str, rows_sent: int = 0) -> str:
+    """Format a page and release its connection, or park the cursor if more rows remain"""
+    if not page.more:
+        await pool.release(conn)
+        return render(page, fmt)
+
+    total = rows_sent + len(page.rows)
+    token = None
+    if _page_tokens:
         try:
-            # First get the current IP
-            ip_response = await client.get("https://checkip.amazonaws.com")
-            ip_response.raise_for_status()
-            current_ip = ip_response.text.strip()
-
-            logger.debug(f"Current IP address: {current_ip}")
-
-            # Update the allowlist
-            payload = {
-                "ip_address": f"{current_ip}/32"
-            }
-            response = await client.post(
-                f"/provisioning/v1/services/{service_id}/security/allowlist",
-                json=payload
-            )
-            logger.debug(f"Allowlist update response status: {response.status_code}")
+            token = await _open_cursors.park(service_id, pool, conn, cursor, page.pending, total, fmt)
+        except BaseException:
+            await pool.release(conn, discard=True)
+            raise
+    truncation = {"rows_returned": total, "limit": page.limit_hit, "page_token": token}
+    if token is None:
+        # Unread rows make the connection unusable, so it cannot go back to the pool
+        await pool.release(conn, discard=True)
+        reason = "Too many result sets are open" if _page_tokens else "This server does not keep result sets open"
+        truncation["message"] = (f"Truncated after {total} rows: {page.limit_hit} reached. {reason} to continue "
+                                 f"this one; narrow the query with LIMIT or WHERE.")
+    else:
+        truncation["message"] = (f"Truncated after {total} rows: {page.limit_hit} reached. More rows are "
+                                 f"available: call fetch_next_page with page_token \"{token}\"")
+    return render(page, fmt, truncation)
 
-            response.raise_for_status()
-            return f"Successfully added IP {current_ip} to the allowlist for service {service_id}"
-        except httpx.HTTPError as e:
-            logger.error(f"Failed to update IP allowlist: {str(e)}")
-            if isinstance(e, httpx.HTTPStatusError):
-                logger.error(f"Error response body: {e.response.text}")
-            return f"Failed to update IP allowlist: {str(e)}"
+async def _screen_query(pool, conn, service_id: str, sql_query: str, limit: int) -> Optional[str]:
+    """EXPLAIN a query and describe the problem if it would examine more than limit rows"""
+    with metrics.phase("explain", service_id=service_id):
+        estimate = await pool.run(conn, estimate_rows, sql_query)
+    if estimate is None:
+        metrics.queries_screened.inc(outcome="unknown")
+        return None
+    if estimate <= limit:
+        metrics.queries_screened.inc(outcome="ok")
+        return None
+    metrics.queries_screened.inc(outcome="rejected" if reject_expensive() else "warned")
+    return f"EXPLAIN estimates {estimate} rows examined, above the limit of {limit}"
+
+def _query_timeout(time_limit: float) -> Optional[float]:
+    """Seconds after which a query is killed from the client, if the server has not stopped it"""
+    return time_limit + timeout_grace() if time_limit else None
+
+# Add the new execute_sql tool
+@mcp.tool()
+async def execute_sql(service_id: str, sql_query: str, max_rows: Optional[int] = None, max_bytes: Optional[int] = None,
+                      format: str = "markdown", use_cache: Optional[bool] = None,
+                      max_execution_time: Optional[float] = None, max_estimated_rows: Optional[int] = None) -> str:
+    """Execute SQL query on a SkySQL database instance and return the results.
+
+    At most max_rows rows and roughly max_bytes of data are returned. A truncated
+    result may end with a page_token that fetch_next_page accepts to read more rows.
+    format is one of markdown (default), json, columnar, csv or arrow (base64 Arrow IPC).
+    use_cache serves repeated read-only queries from the result cache; it defaults
+    to the SKYSQL_RESULT_CACHE setting.
+    The query is cancelled after max_execution_time seconds (0 for no limit).
+    With max_estimated_rows set, a SELECT, UPDATE or DELETE whose EXPLAIN plan
+    examines more rows is refused or runs with a warning, as configured.
+    """
+    if format not in FORMATS:
+        return f"Unsupported format '{format}'. Use one of: {', '.join(FORMATS)}"
+    max_rows = max_rows or default_max_rows()
+    max_bytes = max_bytes or default_max_bytes()
+    time_limit = default_max_execution_time() if max_execution_time is None else max_execution_time
+    row_limit = default_max_estimated_rows() if max_estimated_rows is None else max_estimated_rows
+    cache_key = None
+    if _result_cache_enabled(use_cache) and is_cacheable(sql_query):
+        cache_key = (service_id, normalize(sql_query), format, max_rows, max_bytes)
+        cached = _result_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        generation = _result_cache.generation(service_id)
+
+    try:
+        await _open_cursors.expire()
+        try:
+            pool, conn = await get_db_connection(service_id, time_limit, _open_cursors.write_timeout)
+        except (httpx.HTTPError, CredentialsError, PoolError, mysql_connector.Error) as e:
+            return _connection_error_message(e)
+
+        warning = None
+        submitted = False
+        try:
+            if row_limit and is_explainable(sql_query):
+                warning = await _screen_query(pool, conn, service_id, sql_query, row_limit)
+            if not (warning and reject_expensive()):
+                submitted = True
+                with metrics.phase("execute", service_id=service_id):
+                    page, cursor = await pool.run_killable(conn, _query_timeout(time_limit), run_query, sql_query,
+                                                           max_rows, max_bytes)
+        except QueryTimeout as e:
+            await pool.release(conn, discard=True)
+            return f"SQL Error: {str(e)}. Narrow the query or pass a higher max_execution_time."
+        except mysql_connector.Error as e:
+            # A broken connection must not go back to the pool
+            await pool.release(conn, discard=isinstance(e, mysql_connector.OperationalError))
+            return f"SQL Error [{e.args[0]}]: {e.args[1]}"
+        except BaseException:
+            await pool.release(conn, discard=True)
+            raise
+        finally:
+            if submitted and not is_read_only(sql_query):
+                _record_write(service_id, sql_query)
+        if not submitted:
+            await pool.release(conn)
+            return f"Query rejected: {warning}. Narrow it with WHERE or LIMIT, or pass a higher max_estimated_rows."
+        if warning:
+            page.warnings.append(warning)
+        metrics.result_rows.observe(len(page.rows), tool="execute_sql")
+        with metrics.phase("format", format=format):
+            result = await _render_page(service_id, pool, conn, cursor, page, format)
+        # Truncated results hold a page_token that is only good once
+        if cache_key and not page.more:
+            _result_cache.set(cache_key, result, read_tags(sql_query), generation)
+        return result
+
+    except Exception as e:
+        logger.error(f"Failed to execute query: {str(e)}")
+        return f"Failed to execute query: {str(e)}"
+
+@mcp.tool()
+async def fetch_next_page(page_token: str, max_rows: Optional[int] = None, max_bytes: Optional[int] = None,
+                          format: Optional[str] = None) -> str:
+    """Fetch the next page of a truncated execute_sql result using its page_token.
+
+    The page uses the format of the original query unless format is given.
+    """
+    if format is not None and format not in FORMATS:
+        return f"Unsupported format '{format}'. Use one of: {', '.join(FORMATS)}"
+    if not _page_tokens:
+        return ("Paging is not available: this server runs as several stateless HTTP workers, and a page_token "
+                "only works on the process that issued it. Run the query again with execute_sql, narrowed with "
+                "LIMIT or WHERE.")
+    open_cursor = await _open_cursors.take(page_token)
+    if open_cursor is None:
+        return "Unknown or expired page_token. Run the query again with execute_sql."
+
+    pool, conn = open_cursor.pool, open_cursor.conn
+    try:
+        page = await pool.run_killable(conn, None, read_next_page, open_cursor.cursor,
+                                       max_rows or default_max_rows(), max_bytes or default_max_bytes(),
+                                       open_cursor.pending)
+    except mysql_connector.Error as e:
+        await pool.release(conn, discard=True)
+        return f"SQL Error [{e.args[0]}]: {e.args[1]}"
+    except BaseException:
+        await pool.release(conn, discard=True)
+        raise
+    metrics.result_rows.observe(len(page.rows), tool="fetch_next_page")
+    return await _render_page(open_cursor.service_id, pool, conn, open_cursor.cursor, page,
+                              format or open_cursor.fmt, open_cursor.rows_sent)
+
+async def _query_service(service_id: str, sql_query: str, max_rows: int, max_bytes: int):
+    """Run a query on one service and return its first page; unread rows are dropped"""
+    time_limit = default_max_execution_time()
+    try:
+        pool, conn = await get_db_connection(service_id, time_limit)
+    except (httpx.HTTPError, CredentialsError, PoolError, mysql_connector.Error) as e:
+        raise RuntimeError(_connection_error_message(e))
+
+    discard = True
+    try:
+        page, cursor = await pool.run_killable(conn, _query_timeout(time_limit), run_query, sql_query,
+                                               max_rows, max_bytes)
+        metrics.result_rows.observe(len(page.rows), tool="execute_sql_many")
+        # A cursor with unread rows makes the connection unusable
+        discard = page.more
+    except QueryTimeout as e:
+        raise RuntimeError(f"SQL Error: {str(e)}")
+    except mysql_connector.Error as e:
+        discard = isinstance(e, mysql_connector.OperationalError)
+        raise RuntimeError(f"SQL Error [{e.args[0]}]: {e.args[1]}")
+    finally:
+        await pool.release(conn, discard=discard)
+        if not is_read_only(sql_query):
+            _record_write(service_id, sql_query)
+    return page
+
+def _render_fanout(targets: List[TargetResult], fmt: str, elapsed: float) -> str:
+    merged = merge_pages(targets)
+    succeeded = sum(1 for t in targets if t.status == "ok")
+    if not is_text_format(fmt):
+        data = {"elapsed_ms": round(elapsed * 1000, 3), "services": [t.summary() for t in targets]}
+        if merged is not None:
+            data["result"] = render_data(merged, fmt)
+        else:
+            data["results"] = {t.service_id: render_data(t.page, fmt) for t in targets if t.page is not None}
+        return to_json(data)
+
+    sections = [f"Ran on {len(targets)} service(s) in {elapsed * 1000:.1f} ms: "
+                f"{succeeded} succeeded, {len(targets) - succeeded} failed"]
+    if merged is not None:
+        sections.append(render_text(merged, fmt))
+    else:
+        sections.extend(f"### {t.label} ({t.elapsed * 1000:.1f} ms)\n{render_text(t.page, fmt)}"
+                        for t in targets if t.page is not None)
+    truncated = [t.label for t in targets if t.page is not None and t.page.more]
+    if truncated:
+        sections.append(f"[Truncated to max_rows/max_bytes on: {', '.join(truncated)}]")
+    failures = [t for t in targets if t.error]
+    if failures:
+        sections.append("Failures:\n" + "\n".join(f"- {t.label}: {t.status}: {t.error}" for t in failures))
+    return "\n\n".join(sections)
 
 @mcp.tool()
-async def list_services() -> str:
-    """List all available SkySQL database services"""
-    async with await get_skysql_client() as client:
+async def execute_sql_many(sql_query: str, service_ids: Optional[List[str]] = None, name: Optional[str] = None,
+                           region: Optional[str] = None, concurrency: Optional[int] = None,
+                           timeout: Optional[float] = None, max_rows: Optional[int] = None,
+                           format: str = "markdown") -> str:
+    """Run the same SQL query on several SkySQL services concurrently.
+
+    Targets are the given service_ids and/or the services whose name matches the
+    glob pattern name (e.g. "prod-*") and whose region matches region. Up to
+    concurrency services are queried at once, each with its own timeout in seconds.
+    Rows are merged into one result with a service_id column when every service
+    returns the same columns. Failures are reported per service and do not stop
+    the others. max_rows applies per service; format is as for execute_sql.
+    """
+    if format not in FORMATS:
+        return f"Unsupported format '{format}'. Use one of: {', '.join(FORMATS)}"
+    if not (service_ids or name or region):
+        return "Provide service_ids, or a name and/or region filter (name=\"*\" selects every service)"
+
+    started = time.perf_counter()
+    if name or region:
         try:
-            logger.debug("Fetching all database services")
-            response = await client.get("/provisioning/v1/services")
-            response.raise_for_status()
-            services = response.json()
-
-            if not services:
-                return "No database services found"
-
-            # Format each service's information
-            formatted_services = []
-            for service in services:
-                # Get endpoint details
-                endpoint = service['endpoints'][0] if service.get('endpoints') else {}
-                port = endpoint.get('ports', [{}])[0].get('port', 'N/A') if endpoint.get('ports') else 'N/A'
-
-                service_info = [
-                    f"Service: {service['name']}",
-                    f"ID: {service['id']}",
-                    f"Status: {service['status']}",
-                    f"Type: {service['service_type']}",
-                    f"Provider: {service['provider']}",
-                    f"Region: {service['region']}",
-                    f"Version: {service.get('version', 'N/A')}",
-                    f"FQDN: {service.get('fqdn', 'N/A')}",
-                    f"Port: {port}",
-                    f"Created: {service.get('created_on', 'N/A')}",
-                    "---"
-                ]
-                formatted_services.append("\n".join(service_info))
-
-            return "\n\n".join(formatted_services)
+            services = match_services(await _inventory.services(), name, region)
         except httpx.HTTPError as e:
             logger.error(f"Failed to list services: {str(e)}")
-            if isinstance(e, httpx.HTTPStatusError):
-                logger.error(f"Error response body: {e.response.text}")
             return f"Failed to list services: {str(e)}"
+        if service_ids:
+            services = [s for s in services if s["id"] in service_ids]
+        targets = []
+        for service in services:
+            target = TargetResult(service["id"], service.get("name"))
+            if service.get("status") != "ready":
+                target.status = "skipped"
+                target.error = f"Service is {service.get('status')}"
+            targets.append(target)
+    else:
+        targets = [TargetResult(service_id) for service_id in dict.fromkeys(service_ids)]
+    if not targets:
+        return "No services match the given filters"
+
+    # Keep the combined output within one page's worth of data
+    max_rows = max_rows or default_max_rows()
+    max_bytes = max(default_max_bytes() // len(targets), 10000)
+    await run_all(
+        targets,
+        lambda service_id: _query_service(service_id, sql_query, max_rows, max_bytes),
+        concurrency or int(os.getenv("SKYSQL_FANOUT_CONCURRENCY", "8")),
+        timeout or float(os.getenv("SKYSQL_FANOUT_TIMEOUT", "30"))
+    )
+    try:
+        return _render_fanout(targets, format, time.perf_counter() - started)
+    except ValueError as e:
+        return f"Failed to execute query: {str(e)}"
+
+def _render_batch(batch, fmt: str) -> str:
+    outcome = ""
+    if batch.transaction:
+        outcome = ", committed" if batch.committed else ", rolled back"
+    if not is_text_format(fmt):
+        return to_json({
+            "elapsed_ms": round(batch.elapsed * 1000, 3),
+            "transaction": batch.transaction,
+            "committed": batch.committed,
+            "results": [
+                {
+                    "statement": r.label,
+                    "elapsed_ms": round(r.elapsed * 1000, 3),
+                    "error": r.error,
+                    "result": render_data(r.page, fmt) if r.page else None
+                }
+                for r in batch.results
+            ]
+        })
+
+    sections = [f"Ran {len(batch.results)} statement(s) in {batch.elapsed * 1000:.1f} ms{outcome}"]
+    for i, r in enumerate(batch.results, 1):
+        label = " ".join(r.label.split())
+        if len(label) > 200:
+            label = label[:197] + "..."
+        body = r.error or render_text(r.page, fmt)
+        if r.page and r.page.more:
+            body += f"\n\n[Truncated after {len(r.page.rows)} rows: {r.page.limit_hit} reached]"
+        sections.append(f"### {i}. `{label}` ({r.elapsed * 1000:.1f} ms)\n{body}")
+    return "\n\n".join(sections)
 
-# Add the new execute_sql tool
 @mcp.tool()
-async def execute_sql(service_id: str, sql_query: str) -> str:
-    """Execute SQL query on a SkySQL database instance and return the results"""
+async def execute_sql_batch(service_id: str, statements: Optional[List[str]] = None, script: Optional[str] = None,
+                            bulk_sql: Optional[str] = None, bulk_params: Optional[List[List[Any]]] = None,
+                            transaction: bool = False, stop_on_error: bool = True,
+                            max_rows: Optional[int] = None, format: str = "markdown") -> str:
+    """Run several SQL statements on one connection and return a timed result for each.
+
+    statements are executed one by one, script is sent as a single multi-statement
+    string, and bulk_sql (e.g. an INSERT with %s placeholders) is executed for every
+    row of bulk_params as multi-row inserts. They run in that order. With
+    transaction=True everything is committed together or rolled back on the first error.
+    """
+    if format not in FORMATS:
+        return f"Unsupported format '{format}'. Use one of: {', '.join(FORMATS)}"
+    if not (statements or script or bulk_sql):
+        return "Nothing to run: provide statements, script or bulk_sql"
+    if bulk_sql and not bulk_params:
+        return "bulk_sql needs bulk_params: one list of values per row"
+
     try:
-        # Get credentials using existing tool
-        creds_str = await get_db_credentials(service_id)
-        if "Failed to fetch credentials" in creds_str:
-            return creds_str
-
-        # Parse the credentials string
-        creds_lines = creds_str.split('\n')
-        creds = {}
-        for line in creds_lines:
-            if ': ' in line:
-                key, value = line.split(': ')
-                creds[key] = value
-
-        if not all(k in creds for k in ['Host', 'Port', 'Username', 'Password']):
-            return "Missing connection details"
+        try:
+            pool, conn = await get_db_connection(service_id)
+        except (httpx.HTTPError, CredentialsError, PoolError, mysql_connector.Error) as e:
+            return _connection_error_message(e)
 
+        discard = True
         try:
-            # Create connection with SSL configuration
-            conn = mysql_connector.connect(
-                host=creds['Host'],
-                port=int(creds['Port']),
-                user=creds['Username'],
-                password=creds['Password'],
-                ssl_verify_cert=True,
-                ssl={"verify_cert": True},
-                local_infile=True,
-                client_flag=mysql_connector.constants.CLIENT.LOCAL_FILES | mysql_connector.constants.CLIENT.MULTI_STATEMENTS,
-                autocommit=True
-            )
+            batch = await pool.run(conn, run_batch, statements, script, bulk_sql, bulk_params, transaction,
+                                   stop_on_error, max_rows or default_max_rows(), default_max_bytes())
+            discard = False
+        except mysql_connector.Error as e:
+            return f"SQL Error [{e.args[0]}]: {e.args[1]}"
+        finally:
+            await pool.release(conn, discard=discard)
+            for sql in (statements or []) + [script, bulk_sql]:
+                if sql and not is_read_only(sql):
+                    _record_write(service_id, sql)
+        return _render_batch(batch, format)
+
+    except Exception as e:
+        logger.error(f"Failed to execute batch: {str(e)}")
+        return f"Failed to execute batch: {str(e)}"
 
-            cursor = conn.cursor()
-
-            try:
-                cursor.execute(sql_query)
-
-                # Get column names
-                if cursor.description:
-                    columns = [desc[0] for desc in cursor.description]
-                    # Fetch all rows
-                    rows = cursor.fetchall()
-                    # Format results as markdown table
-                    result = ["| " + " | ".join(columns) + " |"]
-                    result.append("| " + " | ".join(["---" for _ in columns]) + " |")
-                    for row in rows:
-                        result.append("| " + " | ".join(str(val) for val in row) + " |")
-                    return "\n".join(result)
-                else:
-                    # For DDL/DML queries that don't return results
-                    affected_rows = cursor.rowcount
-                    return f"Query executed successfully. Rows affected: {affected_rows}"
-
-            except mysql_connector.Error as e:
-                return f"SQL Error [{e.args[0]}]: {e.args[1]}"
-            finally:
-                cursor.close()
-                conn.close()
+@mcp.tool()
+async def bulk_load(service_id: str, table: str, file_path: Optional[str] = None, data: Optional[str] = None,
+                    format: Optional[str] = None, columns: Optional[List[str]] = None, has_header: bool = True,
+                    batch_size: Optional[int] = None, ctx: Context = None) -> str:
+    """Load CSV, TSV or NDJSON rows into a table using LOAD DATA LOCAL INFILE.
+
+    Provide either file_path (a file on the machine running this server) or data
+    (the payload itself). format defaults to the file extension, otherwise csv.
+    CSV/TSV input starts with a header row naming the columns unless has_header is
+    false; columns overrides the column list. Rows are sent in batches of batch_size,
+    and batched INSERTs are used instead if the server refuses LOAD DATA LOCAL.
+    """
+    if bool(file_path) == (data is not None):
+        return "Provide exactly one of file_path or data"
+    if format is None:
+        extension = os.path.splitext(file_path or "")[1].lstrip(".").lower()
+        format = {"tsv": "tsv", "ndjson": "ndjson", "jsonl": "ndjson"}.get(extension, "csv")
+
+    try:
+        source = Source(format, resolve_path(file_path) if file_path else None, data, columns, has_header)
+    except (ValueError, OSError) as e:
+        return f"Failed to read input: {str(e)}"
+
+    try:
+        try:
+            pool, conn = await get_db_connection(service_id)
+        except (httpx.HTTPError, CredentialsError, PoolError, mysql_connector.Error) as e:
+            return _connection_error_message(e)
 
+        loader = BulkLoader(source, table, batch_size or default_batch_size())
+        discard = True
+        try:
+            while await pool.run(conn, loader.load_next_batch):
+                if ctx:
+                    await ctx.report_progress(
+                        progress=loader.rows_read,
+                        message=f"Loaded {loader.rows_read} rows ({loader.rows_per_second:.0f} rows/s)"
+                    )
+            discard = False
         except mysql_connector.Error as e:
-            return f"Database connection error [{e.args[0]}]: {e.args[1]}"
+            discard = isinstance(e, mysql_connector.OperationalError)
+            return f"SQL Error [{e.args[0]}]: {e.args[1]} (after loading {loader.rows} rows in {loader.batches} batches)"
+        except (ValueError, UnicodeDecodeError) as e:
+            discard = False
+            return f"Failed to read input: {str(e)} (after loading {loader.rows} rows in {loader.batches} batches)"
+        finally:
+            await pool.release(conn, discard=discard)
+            _result_cache.invalidate_tags(service_id, [table_tag(table)])
+
+        elapsed = time.perf_counter() - loader.started
+        if loader.method == "load_data":
+            method = "LOAD DATA LOCAL INFILE"
+        else:
+            method = f"batched INSERTs (LOAD DATA LOCAL was refused: {loader.fallback_reason})"
+        return (f"Loaded {loader.rows} rows into {table} in {loader.batches} batches "
+                f"({elapsed:.2f} s, {loader.rows_per_second:.0f} rows/s) using {method}")
 
     except Exception as e:
-        logger.error(f"Failed to execute query: {str(e)}")
-        return f"Failed to execute query: {str(e)}"
+        logger.error(f"Failed to bulk load: {str(e)}")
+        return f"Failed to bulk load: {str(e)}"
+    finally:
+        source.close()
+
+@mcp.tool()
+async def describe_schema(service_id: str, database: Optional[str] = None, table: Optional[str] = None,
+                          refresh: bool = False, format: str = "markdown") -> str:
+    """Describe the databases, tables, columns, indexes and foreign keys of a SkySQL service.
+
+    With no database or table, lists the databases. With database, lists its tables
+    with row estimates. With table (optionally written as database.table), shows its
+    columns, indexes and foreign keys. The schema is cached and refreshed after DDL
+    through this server; set refresh=True to re-read it now. format is markdown or json.
+    """
+    if format not in ("markdown", "json"):
+        return f"Unsupported format '{format}'. Use markdown or json"
+    if table and database is None and "." in table:
+        database, table = table.split(".", 1)
+    try:
+        snapshot = await _schemas.get(service_id, get_db_connection, refresh)
+    except mysql_connector.Error as e:
+        return f"Failed to read schema [{e.args[0]}]: {e.args[1]}"
+    except (httpx.HTTPError, CredentialsError, PoolError, mysql_connector.Error) as e:
+        return _connection_error_message(e)
+    except Exception as e:
+        logger.error(f"Failed to read schema: {str(e)}")
+        return f"Failed to read schema: {str(e)}"
+
+    if database is not None and database not in snapshot.databases:
+        return f"Database {database} not found. Databases: {', '.join(sorted(snapshot.databases)) or 'none'}"
+    if table:
+        matches = snapshot.find_tables(table, database)
+        if not matches:
+            return f"Table {table} not found" + (f" in database {database}" if database else "")
+        if format == "json":
+            return to_json([info.to_dict() for info in matches])
+        return "\n\n".join(render_table(info) for info in matches)
+    if database is not None:
+        if format == "json":
+            return to_json({database: [info.summary() for info in snapshot.databases[database].values()]})
+        return render_database(snapshot, database)
+    if format == "json":
+        return to_json(snapshot.to_dict())
+    return render_overview(snapshot)
+
+async def _schema_for_resource(service_id: str):
+    try:
+        return await _schemas.get(service_id, get_db_connection)
+    except mysql_connector.Error as e:
+        raise ResourceError(f"Failed to read schema [{e.args[0]}]: {e.args[1]}")
+    except (httpx.HTTPError, CredentialsError, PoolError, mysql_connector.Error) as e:
+        raise ResourceError(_connection_error_message(e))
+
+@mcp.resource("skysql://services/{service_id}/schema", mime_type="application/json")
+async def service_schema(service_id: str) -> str:
+    """Databases and tables of a service with row estimates, column counts and primary keys"""
+    snapshot = await _schema_for_resource(service_id)
+    return to_json(snapshot.to_dict())
+
+@mcp.resource("skysql://services/{service_id}/schema/{database}", mime_type="application/json")
+async def database_schema(service_id: str, database: str) -> str:
+    """Columns, indexes and foreign keys of every table in one database"""
+    snapshot = await _schema_for_resource(service_id)
+    if database not in snapshot.databases:
+        raise ResourceError(f"Database {database} not found")
+    return to_json([info.to_dict() for info in snapshot.databases[database].values()])
+
+@mcp.resource("skysql://services/{service_id}/schema/{database}/{table}", mime_type="application/json")
+async def table_schema(service_id: str, database: str, table: str) -> str:
+    """Columns, indexes and foreign keys of one table"""
+    snapshot = await _schema_for_resource(service_id)
+    matches = snapshot.find_tables(table, database)
+    if not matches:
+        raise ResourceError(f"Table {database}.{table} not found")
+    return to_json(matches[0].to_dict())
+
+@mcp.tool()
+async def cache_stats() -> str:
+    """Show statistics for the query result, credentials, service inventory and schema caches"""
+    return to_json({
+        "result_cache": dict(_result_cache.stats(), enabled_by_default=_result_cache_enabled(None)),
+        "credentials_cache": {
+            "entries": len(_credentials_cache),
+            "hits": _credentials_cache.hits,
+            "misses": _credentials_cache.misses,
+        },
+        "service_inventory": {
+            "services": len(_inventory),
+            "age_s": None if _inventory.age is None else round(_inventory.age, 1),
+            "full_refreshes": _inventory.refreshes,
+        },
+        "schema": {
+            "full_builds": _schemas.full_builds,
+            "incremental_refreshes": _schemas.refreshes,
+        },
+    })
+
+# Counts kept by the caches and pools, copied into metrics on export
+_cache_lookups = metrics.registry.counter(
+    "skysql_cache_lookups_total", "Cache lookups by cache and outcome", ["cache", "outcome"])
+_cache_entries = metrics.registry.gauge("skysql_cache_entries", "Entries held by each cache", ["cache"])
+_db_connections = metrics.registry.gauge("skysql_db_connections", "Pooled database connections by state", ["state"])
+_db_pools = metrics.registry.gauge("skysql_db_pools", "Services with a connection pool")
+_api_requests = metrics.registry.gauge(
+    "skysql_api_requests", "SkySQL API requests queued for or in flight past the client-side limits",
+    ["endpoint_class", "state"])
+_api_concurrency_limit = metrics.registry.gauge(
+    "skysql_api_concurrency_limit", "Current adaptive limit on SkySQL API requests in flight", ["endpoint_class"])
+
+def _collect_metrics():
+    for name, cache in (("result", _result_cache), ("credentials", _credentials_cache), ("agent_response", _agent_responses)):
+        _cache_lookups.set(cache.hits, cache=name, outcome="hit")
+        _cache_lookups.set(cache.misses, cache=name, outcome="miss")
+        _cache_entries.set(len(cache), cache=name)
+    _cache_entries.set(len(_inventory), cache="service_inventory")
+    _cache_entries.set(len(_agents), cache="agents")
+    pool_stats = db_pools.stats()
+    _db_pools.set(pool_stats.pop("pools"))
+    for state, value in pool_stats.items():
+        _db_connections.set(value, state=state)
+    for endpoint_class, stats in api_clients.stats().items():
+        _api_requests.set(stats["queued"], endpoint_class=endpoint_class, state="queued")
+        _api_requests.set(stats["in_flight"], endpoint_class=endpoint_class, state="in_flight")
+        _api_concurrency_limit.set(stats["concurrency_limit"], endpoint_class=endpoint_class)
+
+metrics.registry.add_collector(_collect_metrics)
+
+@mcp.tool()
+async def server_stats() -> str:
+    """Show tool, SkySQL API and database latency histograms (count, sum, p50/p90/p99) and error, cache and connection counters"""
+    return to_json(metrics.registry.snapshot())
+
+async def _prewarm():
+    """Create the API client and fetch the service list, then the credentials of SKYSQL_PREWARM_SERVICES"""
+    await get_skysql_client()
+    await _inventory.services()
+    names = [name.strip() for name in os.getenv("SKYSQL_PREWARM_SERVICES", "").split(",") if name.strip()]
+    service_ids = []
+    for name in names:
+        service = _inventory.get(name) or _inventory.find_by_name(name)
+        if service is None:
+            logger.warning(f"Not pre-warming unknown service '{name}'")
+        else:
+            service_ids.append(service["id"])
+    if service_ids:
+        # Loading the CA certificates of the database TLS context takes a while too
+        await asyncio.to_thread(lambda: db_pools.ssl_context)
+    await asyncio.gather(*(get_service_credentials(service_id) for service_id in service_ids))
+
+# Background pre-warming after the first tools/list, if SKYSQL_PREWARM is on
+_prewarmer = PrewarmMiddleware(_prewarm)
+if os.getenv("SKYSQL_PREWARM", "false").lower() in ("1", "true", "yes"):
+    mcp.add_middleware(_prewarmer)
 
 # Update the main block with enhanced error handling and Windows compatibility
-if __name__ == "__main__":
+def main():
+    """Run the server over stdio"""
     try:
         logger.info("Starting SkySQL MCP Server (stdio mode)...")
         logger.info(f"Python version: {sys.version}")
@@ -446,10 +1256,18 @@ if __name__ == "__main__":
             import msvcrt
             msvcrt.setmode(sys.stdin.fileno(), os.O_BINARY)
             msvcrt.setmode(sys.stdout.fileno(), os.O_BINARY)
+        # Treat SIGTERM like Ctrl-C so the event loop unwinds and the
+        # lifespan closes shared clients and connection pools
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
         # Run the server in stdio mode
         mcp.run()
+    except KeyboardInterrupt:
+        logger.info("Received shutdown signal")
     except Exception as e:
         logger.error(f"Error starting server: {str(e)}", exc_info=True)
         sys.exit(1)
     finally:
-        logger.info("Server shutting down...") 
+        logger.info("Server shutting down...")
+
+if __name__ == "__main__":
+    main()
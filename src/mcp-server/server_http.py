@@ -1,18 +1,26 @@
 """
 HTTP transport entry point for SkySQL MCP Server.
 This file is used for HTTP-based deployments (e.g., Smithery.ai).
-For local stdio usage, use server.py instead.
+For local stdio usage, use server_stdio.py instead.
 """
 import os
 import sys
+import signal
+import asyncio
 import logging
+import threading
+import multiprocessing
 from dotenv import load_dotenv
 
 # Ensure we can import from the same directory
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-# Import the mcp instance from server.py
-from server import mcp
+import uvicorn
+from sse_starlette.sse import AppStatus
+
+from server import tool_drain
+# Also importable from here, as server_http:app
+from http_app import app, workers
 
 # Configure logging
 logging.basicConfig(
@@ -28,37 +36,88 @@ logger = logging.getLogger(__name__)
 # Load environment variables from .env file
 load_dotenv()
 
+_workers = workers()
+_drain_timeout = float(os.getenv("SKYSQL_DRAIN_TIMEOUT", "30"))
+
+async def _drain_then_close_streams():
+    await tool_drain.drain(_drain_timeout)
+    # Let the last results be written to their streams before they are closed
+    await asyncio.sleep(1)
+    AppStatus.should_exit = True
+
+class DrainingServer(uvicorn.Server):
+    """uvicorn server whose SSE responses end only once tool calls have finished.
+
+    sse-starlette would otherwise end every SSE response, including those
+    still waiting for a tool result, as soon as the signal arrives.
+    """
+
+    def __init__(self, config: uvicorn.Config):
+        super().__init__(config)
+        AppStatus.disable_automatic_graceful_drain()
+
+    def handle_exit(self, sig, frame):
+        first = not self.should_exit
+        super().handle_exit(sig, frame)
+        if first:
+            loop = asyncio.get_event_loop()
+            loop.call_soon_threadsafe(loop.create_task, _drain_then_close_streams())
+
+def _run_worker(config: uvicorn.Config, sockets):
+    config.configure_logging()
+    DrainingServer(config).run(sockets=sockets)
+
+def _serve(config: uvicorn.Config):
+    """Run config.workers DrainingServer processes on one listening socket.
+
+    Workers that die are replaced. SIGINT or SIGTERM is passed on to every
+    worker as SIGTERM, and each drains its tool calls before exiting.
+    """
+    if config.workers <= 1:
+        DrainingServer(config).run()
+        return
+    sock = config.bind_socket()
+    spawn = multiprocessing.get_context("spawn")
+    stopping = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda sig, frame: stopping.set())
+
+    def start():
+        process = spawn.Process(target=_run_worker, args=(config, [sock]))
+        process.start()
+        return process
+
+    workers = [start() for _ in range(config.workers)]
+    while not stopping.wait(1):
+        for i, process in enumerate(workers):
+            if not process.is_alive():
+                logger.warning(f"Worker {process.pid} exited with code {process.exitcode}, starting another")
+                workers[i] = start()
+    for process in workers:
+        process.terminate()
+    for process in workers:
+        process.join()
+    sock.close()
+
 if __name__ == "__main__":
     try:
-        import uvicorn
-        
         logger.info("Starting SkySQL MCP Server (HTTP mode)...")
         logger.info(f"Python version: {sys.version}")
         
         host = os.getenv("MCP_HOST", "0.0.0.0")
         # Smithery sets PORT environment variable, fallback to MCP_PORT for local testing
         port = int(os.getenv("PORT", os.getenv("MCP_PORT", "8000")))
-        logger.info(f"Starting HTTP server on {host}:{port}")
-        
-        # FastMCP exposes the HTTP app via .http_app() method
-        try:
-            app = mcp.http_app()
-        except AttributeError:
-            logger.error("FastMCP http_app method not found. FastMCP may not support HTTP transport in this version.")
-            logger.error("Available attributes: " + ", ".join([attr for attr in dir(mcp) if not attr.startswith('_')]))
-            sys.exit(1)
-        except Exception as e:
-            logger.error(f"Error calling http_app(): {str(e)}")
-            sys.exit(1)
-        
-        uvicorn.run(app, host=host, port=port, log_level="info")
-    except ImportError as e:
-        logger.error(f"Missing required dependency: {str(e)}")
-        logger.error("Please install uvicorn: pip install uvicorn>=0.27.0")
-        sys.exit(1)
+        logger.info(f"Starting HTTP server on {host}:{port} with {_workers} worker(s)")
+        if _workers > 1 and os.getenv("SKYSQL_STATE_BACKEND", "memory") == "memory":
+            logger.warning("Running several workers without SKYSQL_STATE_BACKEND; each worker keeps its own caches")
+
+        # Workers import the app by name, from a module without this entry
+        # point; connections still open a little after SKYSQL_DRAIN_TIMEOUT
+        # seconds are closed on shutdown
+        _serve(uvicorn.Config("http_app:app" if _workers > 1 else app, host=host, port=port, workers=_workers,
+                              timeout_graceful_shutdown=int(_drain_timeout) + 5, log_level="info"))
     except Exception as e:
         logger.error(f"Error starting server: {str(e)}", exc_info=True)
         sys.exit(1)
     finally:
         logger.info("Server shutting down...")
-
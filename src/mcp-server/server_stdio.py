@@ -0,0 +1,18 @@
+"""
+stdio entry point for SkySQL MCP Server, as launched by MCP clients.
+
+Garbage collection is paused while server.py and its dependencies load.
+Most objects created then live as long as the process, so collecting them
+only costs startup time. Once the server is set up they are frozen out of
+later collections and gc is enabled again.
+
+Running server.py directly also works, without the gc tuning.
+"""
+import gc
+
+if __name__ == "__main__":
+    gc.disable()
+    import server
+    gc.freeze()
+    gc.enable()
+    server.main()
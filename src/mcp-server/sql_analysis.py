@@ -0,0 +1,206 @@
+"""
+Lightweight, regex-based SQL inspection.
+
+This is not a parser. It masks string literals and comments, then looks at
+leading keywords and table names closely enough to decide whether a query is
+safe to cache and which tables a statement writes to. Whenever it is unsure it
+answers conservatively: "not cacheable" and "may touch every table".
+"""
+import re
+from typing import List, Optional, Set
+
+# Tag for results that depend on the set of tables rather than their rows
+# (SHOW TABLES, information_schema); any DDL invalidates it
+SCHEMA_TAG = "*schema*"
+
+_LITERALS = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"|`(?:[^`]|``)*`|/\*.*?\*/|#[^\n]*|--\s[^\n]*", re.S)
+_WHITESPACE = re.compile(r"\s+")
+# Keywords whose case is folded for cache keys; identifiers keep their case
+# because table names are case sensitive on most servers
+_KEYWORDS = re.compile(
+    r"\b(select|distinct|from|where|and|or|not|in|is|null|like|between|as|join|inner|left|right|outer|cross|on|using"
+    r"|group|by|order|asc|desc|having|limit|offset|union|all|case|when|then|else|end|exists|count|sum|avg|min|max"
+    r"|show|tables|columns|full|index|create|table|describe|explain|with|information_schema)\b",
+    re.I)
+
+_READ_VERBS = {"select", "show", "describe", "desc", "explain", "with", "values", "table"}
+_DDL_VERBS = {"create", "alter", "drop", "rename", "truncate"}
+
+# Calls whose result changes between executions even when the data does not
+_VOLATILE = re.compile(
+    r"\b(now|sysdate|curdate|curtime|current_(date|time|timestamp|user)|utc_\w+|unix_timestamp|rand|uuid\w*|"
+    r"sleep|benchmark|last_insert_id|found_rows|row_count|connection_id|get_lock|release_lock|nextval|lastval)\s*\(|"
+    r"\bcurrent_(date|time|timestamp|user)\b|@",
+    re.I)
+_LOCKING = re.compile(r"\bfor\s+update\b|\block\s+in\s+share\s+mode\b|\bfor\s+share\b|\binto\s+(outfile|dumpfile|@)", re.I)
+# Server state rather than table contents
+_LIVE_STATE = re.compile(r"\bperformance_schema\b|\bprocesslist\b|\bsys\s*\.|\binnodb_\w+", re.I)
+_CACHEABLE_SHOW = re.compile(r"\s*show\s+(full\s+)?(tables|columns|fields|index|indexes|keys|create|databases|schemas)\b", re.I)
+# Statements that change neither rows nor schema
+_NO_WRITE_VERBS = {"set", "begin", "start", "commit", "rollback", "savepoint", "release", "kill", "do", "xa"}
+# Statements whose cost depends on a query plan that EXPLAIN can show
+_EXPLAIN_VERBS = {"select", "with", "update", "delete"}
+
+_NAME = r"((?:`(?:[^`]|``)+`|[\w$]+)(?:\s*\.\s*(?:`(?:[^`]|``)+`|[\w$]+))?)"
+_READ_TABLES = re.compile(r"\b(?:join|straight_join|describe|desc|table)\s+" + _NAME, re.I)
+# A FROM clause (or its continuation after a derived table) up to the next clause keyword;
+# items are comma separated and may carry aliases
+_FROM_CLAUSE = re.compile(
+    r"(?:\bfrom\s+|\)\s*(?:as\s+)?[\w`$]+\s*,\s*)(.*?)(?=\b(?:where|group|order|having|limit|union|except|intersect|join|straight_join|natural|inner"
+    r"|left|right|cross|full|on|using|window|for|into|lock|procedure)\b|[()]|$)",
+    re.I | re.S)
+_WRITE_TABLES = re.compile(
+    r"\b(?:insert(?:\s+(?:low_priority|delayed|high_priority|ignore))*(?:\s+into)?|replace(?:\s+(?:low_priority|delayed))*(?:\s+into)?"
+    r"|update(?:\s+(?:low_priority|ignore))*|delete(?:\s+(?:low_priority|quick|ignore))*\s+from|truncate(?:\s+table)?"
+    r"|(?:create|alter|drop)(?:\s+(?:or\s+replace|temporary|online|offline|ignore))*\s+table(?:\s+if\s+(?:not\s+)?exists)?"
+    r"|rename\s+table|\bto|into\s+table)\s+" + _NAME + r"((?:\s*,\s*" + _NAME + r")*)",
+    re.I)
+
+# The table references of UPDATE and DELETE statements
+_UPDATE_REFS = re.compile(r"\bupdate(?:\s+(?:low_priority|ignore))*\s+(.*?)\s+set\b", re.I | re.S)
+_DELETE_REFS = re.compile(r"\bdelete(?:\s+(?:low_priority|quick|ignore))*\s+from\s+(.*?)(?=\b(?:where|order|limit|returning)\b|$)",
+                          re.I | re.S)
+# Marks a multi-table UPDATE or DELETE, which may write to any of its tables
+_MULTI_TABLE = re.compile(r",|(?:\b|_)join\b|\busing\b", re.I)
+
+
+def _mask(sql: str) -> str:
+    """Replace string literals and comments with placeholders, keeping backtick identifiers"""
+    def replace(match):
+        text = match.group(0)
+        return text if text.startswith("`") else " ? "
+    return _LITERALS.sub(replace, sql)
+
+
+def split_statements(sql: str) -> List[str]:
+    """Split on semicolons outside literals; returns masked statements"""
+    return [s.strip() for s in _mask(sql).split(";") if s.strip()]
+
+
+def normalize(sql: str) -> str:
+    """Fold whitespace and keyword case outside literals and drop a trailing semicolon, for use as a cache key"""
+    def fold(text: str) -> str:
+        return _KEYWORDS.sub(lambda m: m.group(0).lower(), _WHITESPACE.sub(" ", text))
+
+    parts = []
+    last = 0
+    for match in _LITERALS.finditer(sql):
+        parts.append(fold(sql[last:match.start()]))
+        parts.append(match.group(0))
+        last = match.end()
+    parts.append(fold(sql[last:]))
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def _verb(statement: str) -> str:
+    match = re.match(r"\s*\(*\s*(\w+)", statement)
+    return match.group(1).lower() if match else ""
+
+
+def table_tag(name: str) -> str:
+    """The tag used for a possibly quoted, possibly schema-qualified table name"""
+    # Compare on the bare, unquoted table name: the current database of a
+    # pooled connection is unknown, so db.t and t may be the same table
+    return name.split(".")[-1].strip().strip("`").replace("``", "`").lower()
+
+
+def _names(first: str, rest: str) -> Set[str]:
+    names = {table_tag(first)}
+    for match in re.finditer(_NAME, rest or ""):
+        names.add(table_tag(match.group(1)))
+    return names
+
+
+def _statement_is_read_only(statement: str) -> bool:
+    verb = _verb(statement)
+    if verb not in _READ_VERBS:
+        return False
+    if verb == "explain":
+        return not re.match(r"\s*explain\s+analyze\b", statement, re.I)
+    if verb == "with":
+        # MySQL 8 allows WITH ... UPDATE/DELETE
+        return not re.search(r"\b(insert|update|delete|replace)\b", statement, re.I)
+    return True
+
+
+def is_read_only(sql: str) -> bool:
+    statements = split_statements(sql)
+    return bool(statements) and all(_statement_is_read_only(s) for s in statements)
+
+
+def is_cacheable(sql: str) -> bool:
+    """True for a single read-only statement whose result depends only on table contents"""
+    statements = split_statements(sql)
+    if len(statements) != 1 or not is_read_only(sql):
+        return False
+    statement = statements[0]
+    if _verb(statement) == "show" and not _CACHEABLE_SHOW.match(statement):
+        return False
+    return not (_VOLATILE.search(statement) or _LOCKING.search(statement) or _LIVE_STATE.search(statement))
+
+
+def is_explainable(sql: str) -> bool:
+    """True for a single SELECT, UPDATE or DELETE statement"""
+    statements = split_statements(sql)
+    return len(statements) == 1 and _verb(statements[0]) in _EXPLAIN_VERBS
+
+
+def read_tags(sql: str) -> Set[str]:
+    """Tables a read-only query depends on, plus SCHEMA_TAG where it depends on the schema itself"""
+    tags: Set[str] = set()
+    for statement in split_statements(sql):
+        for match in _READ_TABLES.finditer(statement):
+            tags.add(table_tag(match.group(1)))
+        for match in _FROM_CLAUSE.finditer(statement):
+            for item in match.group(1).split(","):
+                name = re.match(r"\s*" + _NAME, item)
+                if name:
+                    tags.add(table_tag(name.group(1)))
+        lowered = statement.lower()
+        if _verb(statement) in ("show", "describe", "desc") or "information_schema" in lowered:
+            tags.add(SCHEMA_TAG)
+    return tags
+
+
+def write_tags(sql: str) -> Optional[Set[str]]:
+    """Tables the statements may change, plus SCHEMA_TAG for DDL.
+
+    Returns None when the affected tables cannot be determined (stored
+    procedures, USE, multi-table UPDATE and DELETE, unknown statements),
+    meaning everything may have changed.
+
+    >>> sorted(write_tags("UPDATE a SET x = 1 WHERE id IN (SELECT id FROM b JOIN c USING (id))"))
+    ['a']
+    >>> write_tags("UPDATE a JOIN b ON a.id=b.id SET b.x=1") is None
+    True
+    >>> write_tags("UPDATE a INNER JOIN b USING (id) SET b.x=2") is None
+    True
+    >>> write_tags("UPDATE a x, b y SET y.v = x.v WHERE x.id = y.id") is None
+    True
+    >>> write_tags("DELETE FROM a USING a JOIN b ON a.id = b.id") is None
+    True
+    >>> write_tags("DELETE a, b FROM a JOIN b ON a.id = b.id") is None
+    True
+    """
+    tags: Set[str] = set()
+    for statement in split_statements(sql):
+        verb = _verb(statement)
+        if _statement_is_read_only(statement) or verb in _NO_WRITE_VERBS:
+            continue
+        if verb in _DDL_VERBS:
+            tags.add(SCHEMA_TAG)
+            if not re.search(r"\btable\b", statement, re.I) and verb != "truncate":
+                # CREATE INDEX, DROP DATABASE, CREATE VIEW, ...
+                return None
+        if verb not in _DDL_VERBS | {"insert", "replace", "update", "delete", "load"}:
+            return None
+        if verb in ("update", "delete"):
+            refs = (_UPDATE_REFS if verb == "update" else _DELETE_REFS).search(statement)
+            if refs is None or _MULTI_TABLE.search(refs.group(1)):
+                return None
+        matches = list(_WRITE_TABLES.finditer(statement))
+        if not matches:
+            return None
+        for match in matches:
+            tags |= _names(match.group(1), match.group(2))
+    return tags
@@ -0,0 +1,232 @@
+"""
+State shared between server processes.
+
+By default each process keeps its state to itself. When SKYSQL_STATE_BACKEND
+names a SQLite file or a Redis server, the following are shared:
+
+- the service and agent lists
+- agent answers
+- the status of services being launched or deleted
+
+Sharing covers the HTTP workers on one host, or replicas behind a load
+balancer. A process that starts cold, or that serves a request another
+worker has already answered, can then skip the API call.
+
+    memory                          in-process only (default)
+    sqlite:///var/lib/skysql.db     a SQLite file shared by the processes of one host
+    redis://host:6379/0             a Redis server (needs the redis package)
+
+Values are JSON documents stored under a namespace and key, and every value
+expires after a TTL. The in-process caches stay in front of the backend, so
+the backend is only read after a local miss. Namespaces are prefixed with a
+hash of the SkySQL API key, so servers using different keys can share a
+backend without seeing each other's state. Database passwords are never
+stored in it.
+"""
+import os
+import json
+import time
+import hashlib
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+class StateBackend:
+    """JSON values with a TTL under (namespace, key)"""
+
+    async def get(self, namespace: str, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    async def set(self, namespace: str, key: str, value: Any, ttl: float):
+        raise NotImplementedError
+
+    async def add(self, namespace: str, key: str, value: Any, ttl: float) -> bool:
+        """Set a value only if the key is absent or expired; True if it was set"""
+        raise NotImplementedError
+
+    async def delete(self, namespace: str, key: str):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+    async def read_through(self, namespace: str, key: str, ttl: float, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """The stored value, or fetch()'s result, which is stored for ttl seconds"""
+        value = await self.get(namespace, key)
+        if value is None:
+            value = await fetch()
+            await self.set(namespace, key, value, ttl)
+        return value
+
+
+class MemoryBackend(StateBackend):
+    """State visible to this process only"""
+
+    def __init__(self):
+        self._values: Dict[Tuple[str, str], Tuple[float, Any]] = {}
+
+    async def get(self, namespace: str, key: str) -> Optional[Any]:
+        entry = self._values.get((namespace, key))
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._values[(namespace, key)]
+            return None
+        return entry[1]
+
+    async def set(self, namespace: str, key: str, value: Any, ttl: float):
+        now = time.monotonic()
+        if len(self._values) > 10000:
+            self._values = {k: v for k, v in self._values.items() if v[0] > now}
+        self._values[(namespace, key)] = (now + ttl, value)
+
+    async def add(self, namespace: str, key: str, value: Any, ttl: float) -> bool:
+        if await self.get(namespace, key) is not None:
+            return False
+        await self.set(namespace, key, value, ttl)
+        return True
+
+    async def delete(self, namespace: str, key: str):
+        self._values.pop((namespace, key), None)
+
+
+class SQLiteBackend(StateBackend):
+    """State in a SQLite file, shared by the processes of one host.
+
+    Queries run on a worker thread, one at a time per process; SQLite's WAL
+    mode lets processes read while another writes.
+    """
+
+    def __init__(self, path: str):
+        import sqlite3
+
+        self.path = path
+        self._lock = threading.Lock()
+        # Created owner-only, since it holds details of the account's services
+        os.close(os.open(path, os.O_CREAT | os.O_RDWR, 0o600))
+        self._db = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS state (namespace TEXT NOT NULL, key TEXT NOT NULL, "
+                         "value TEXT NOT NULL, expires REAL NOT NULL, PRIMARY KEY (namespace, key))")
+        self._writes = 0
+
+    def _run(self, sql: str, params: tuple) -> Tuple[List[tuple], int]:
+        with self._lock:
+            cursor = self._db.execute(sql, params)
+            return cursor.fetchall(), cursor.rowcount
+
+    async def _execute(self, sql: str, *params) -> Tuple[List[tuple], int]:
+        """Rows and row count of one statement"""
+        return await asyncio.to_thread(self._run, sql, params)
+
+    async def get(self, namespace: str, key: str) -> Optional[Any]:
+        rows, _ = await self._execute("SELECT value FROM state WHERE namespace = ? AND key = ? AND expires > ?",
+                                      namespace, key, time.time())
+        return json.loads(rows[0][0]) if rows else None
+
+    async def _prune(self):
+        self._writes += 1
+        if self._writes % 1000 == 0:
+            await self._execute("DELETE FROM state WHERE expires <= ?", time.time())
+
+    async def set(self, namespace: str, key: str, value: Any, ttl: float):
+        await self._execute("INSERT OR REPLACE INTO state VALUES (?, ?, ?, ?)",
+                            namespace, key, json.dumps(value), time.time() + ttl)
+        await self._prune()
+
+    async def add(self, namespace: str, key: str, value: Any, ttl: float) -> bool:
+        now = time.time()
+        _, changed = await self._execute(
+            "INSERT INTO state VALUES (?, ?, ?, ?) ON CONFLICT (namespace, key) DO UPDATE "
+            "SET value = excluded.value, expires = excluded.expires WHERE state.expires <= ?",
+            namespace, key, json.dumps(value), now + ttl, now)
+        await self._prune()
+        return changed == 1
+
+    async def delete(self, namespace: str, key: str):
+        await self._execute("DELETE FROM state WHERE namespace = ? AND key = ?", namespace, key)
+
+    async def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class RedisBackend(StateBackend):
+    """State in a Redis (or Redis-protocol) server"""
+
+    def __init__(self, url: str, prefix: str = "skysql-mcp:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise ValueError("The Redis state backend requires the redis package (pip install redis)")
+        self._redis = redis.from_url(url)
+        self.prefix = prefix
+
+    def _key(self, namespace: str, key: str) -> str:
+        return f"{self.prefix}{namespace}:{key}"
+
+    async def get(self, namespace: str, key: str) -> Optional[Any]:
+        value = await self._redis.get(self._key(namespace, key))
+        return None if value is None else json.loads(value)
+
+    async def set(self, namespace: str, key: str, value: Any, ttl: float):
+        await self._redis.set(self._key(namespace, key), json.dumps(value), px=max(1, int(ttl * 1000)))
+
+    async def add(self, namespace: str, key: str, value: Any, ttl: float) -> bool:
+        return bool(await self._redis.set(self._key(namespace, key), json.dumps(value),
+                                          px=max(1, int(ttl * 1000)), nx=True))
+
+    async def delete(self, namespace: str, key: str):
+        await self._redis.delete(self._key(namespace, key))
+
+    async def close(self):
+        await self._redis.aclose()
+
+
+class ScopedBackend(StateBackend):
+    """Another backend's values, with every namespace prefixed by a scope"""
+
+    def __init__(self, backend: StateBackend, scope: str):
+        self.backend = backend
+        self.scope = scope
+
+    def _namespace(self, namespace: str) -> str:
+        return f"{self.scope}:{namespace}"
+
+    async def get(self, namespace: str, key: str) -> Optional[Any]:
+        return await self.backend.get(self._namespace(namespace), key)
+
+    async def set(self, namespace: str, key: str, value: Any, ttl: float):
+        await self.backend.set(self._namespace(namespace), key, value, ttl)
+
+    async def add(self, namespace: str, key: str, value: Any, ttl: float) -> bool:
+        return await self.backend.add(self._namespace(namespace), key, value, ttl)
+
+    async def delete(self, namespace: str, key: str):
+        await self.backend.delete(self._namespace(namespace), key)
+
+    async def close(self):
+        await self.backend.close()
+
+
+def api_key_scope(api_key: str) -> str:
+    """A scope for state that belongs to one API key, without revealing the key"""
+    return hashlib.sha256(api_key.encode()).hexdigest()[:32]
+
+
+def create_backend(url: Optional[str] = None, scope: Optional[str] = None) -> StateBackend:
+    """Backend for a SKYSQL_STATE_BACKEND value, with its namespaces prefixed by scope if given"""
+    url = url or "memory"
+    if url == "memory":
+        # Private to this process already
+        return MemoryBackend()
+    if url.startswith("sqlite://"):
+        # sqlite:///tmp/state.db is an absolute path, sqlite://state.db a relative one
+        backend: StateBackend = SQLiteBackend(url[len("sqlite://"):])
+    elif url.startswith(("redis://", "rediss://", "unix://")):
+        backend = RedisBackend(url)
+    else:
+        raise ValueError(f"Unsupported SKYSQL_STATE_BACKEND '{url}'. Use memory, sqlite:///path or redis://host:port/db")
+    return ScopedBackend(backend, scope) if scope else backend
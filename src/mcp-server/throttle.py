@@ -0,0 +1,326 @@
+"""
+Client-side throttling of SkySQL API requests.
+
+Requests are grouped into endpoint classes: reads (GET), writes (other
+methods) and copilot chat. Each API client has its own limits per class:
+
+- a token bucket caps the request rate. After a 429 answer the bucket is
+  paused for the Retry-After period, so the class backs off as a whole, and
+  its rate is halved. Each successful request then wins back a fiftieth of
+  the configured rate.
+- an AIMD concurrency limit caps requests in flight. It grows by about one
+  each time a full window of requests succeeds, and shrinks by a third when
+  a request is throttled, or when its time to response headers rises well
+  above the usual latency of its endpoint. Both are moving averages, a
+  fast one of its latest responses and a slow one of its usual latency, so
+  the spread of a healthy upstream's latencies does not count as a rise.
+
+429 answers are retried for any method, since the request was not
+processed. 502-504 answers are retried for GET and HEAD only. Retries wait
+for Retry-After, or back off exponentially with jitter. They give up once
+the wait would exceed SKYSQL_API_MAX_RETRY_WAIT, and the last answer is
+returned as it is. Copilot requests are not retried here: copilot.chat
+retries them itself, within the deadline of the whole call.
+"""
+import os
+import time
+import random
+import asyncio
+import logging
+import email.utils
+from collections import deque
+from typing import Callable, Dict, Optional
+
+import httpx
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+ENDPOINT_CLASSES = ("read", "write", "copilot")
+
+RETRY_STATUSES = (429, 502, 503, 504)
+SAFE_METHODS = ("GET", "HEAD")
+
+# A latency rise smaller than this is noise, whatever the ratio
+LATENCY_SLACK = 0.05
+# Weights of the latest response in an endpoint's recent and usual latency
+RECENT_WEIGHT = 0.25
+USUAL_WEIGHT = 0.02
+
+
+def endpoint_class(request: httpx.Request) -> str:
+    if request.url.path.startswith("/copilot/"):
+        return "copilot"
+    return "read" if request.method in SAFE_METHODS else "write"
+
+
+def retry_after(response: httpx.Response) -> Optional[float]:
+    """Seconds from a Retry-After header, given as seconds or as an HTTP date"""
+    value = response.headers.get("Retry-After", "").strip()
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Allows rate requests per second on average, and bursts of up to burst"""
+
+    def __init__(self, rate: float, burst: float):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._slowed_at = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def take(self) -> float:
+        """Wait for a token and return the seconds waited"""
+        waited = 0.0
+        while True:
+            now = time.monotonic()
+            self._refill(now)
+            # Checked again after every wait: the rate may have changed, or
+            # a pause started, in the meantime
+            delay = self.paused_until - now
+            if delay <= 0:
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            await asyncio.sleep(delay)
+            waited += delay
+
+    def pause(self, seconds: float, started: float):
+        """Hand out no tokens for the next seconds, and halve the rate.
+
+        started is when the throttled request was sent; requests sent before
+        the last slowdown do not halve the rate again.
+        """
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens = min(self.tokens, 0.0)
+        self.paused_until = max(self.paused_until, now + seconds)
+        if started >= self._slowed_at:
+            self._slowed_at = now
+            self.rate = max(self.max_rate / 64, self.rate / 2)
+
+    def recover(self):
+        """Raise the rate back towards its configured value after a request went through"""
+        self.rate = min(self.max_rate, self.rate + self.max_rate / 50)
+
+
+class ConcurrencyLimit:
+    """A limit on requests in flight, adjusted by additive increase and multiplicative decrease"""
+
+    def __init__(self, maximum: int, minimum: int = 1, tolerance: float = 2.0):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.tolerance = tolerance
+        self.limit = float(maximum)
+        self.in_flight = 0
+        # Recent and usual latency per endpoint, exponentially weighted
+        # moving averages over a few and over about fifty responses
+        self.recent: Dict[str, float] = {}
+        self.usual: Dict[str, float] = {}
+        self._decreased_at = 0.0
+        self._waiters = deque()
+
+    async def acquire(self) -> bool:
+        """Wait for a free slot; True if the request had to wait"""
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the request was cancelled
+                self.release()
+            else:
+                self._waiters.remove(waiter)
+            raise
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        # The slot count is taken over by the woken request
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def record(self, endpoint: str, started: float, latency: float, throttled: bool) -> bool:
+        """Adjust the limit after a response; True if it was lowered"""
+        recent = self.recent.get(endpoint, latency)
+        usual = self.usual.get(endpoint, latency)
+        if not throttled:
+            # Slow responses count towards the usual latency too, so that it
+            # follows an upstream that has become slower for good
+            recent += (latency - recent) * RECENT_WEIGHT
+            usual += (latency - usual) * USUAL_WEIGHT
+            self.recent[endpoint] = recent
+            self.usual[endpoint] = usual
+        slow = recent > usual * self.tolerance and recent - usual > LATENCY_SLACK
+        if throttled or slow:
+            # Requests sent before the last decrease do not count against the new limit
+            if started < self._decreased_at:
+                return False
+            self._decreased_at = time.monotonic()
+            self.limit = max(float(self.minimum), self.limit * 2 / 3)
+            return True
+        self.limit = min(float(self.maximum), self.limit + 1 / self.limit)
+        self._wake()
+        return False
+
+
+class EndpointLimiter:
+    """The rate and concurrency limits of one endpoint class"""
+
+    def __init__(self, name: str, rate: float, max_concurrency: int, tolerance: float):
+        self.name = name
+        self.bucket = TokenBucket(rate, 2 * rate) if rate > 0 else None
+        self.concurrency = ConcurrencyLimit(max_concurrency, tolerance=tolerance)
+        self.queued = 0
+
+    async def admit(self):
+        """Wait until the request may be sent; the caller must release() it afterwards"""
+        self.queued += 1
+        started = time.perf_counter()
+        try:
+            if self.bucket is not None and await self.bucket.take() > 0:
+                metrics.api_throttled.inc(endpoint_class=self.name, reason="rate")
+            if await self.concurrency.acquire():
+                metrics.api_throttled.inc(endpoint_class=self.name, reason="concurrency")
+        finally:
+            self.queued -= 1
+            metrics.api_queue_seconds.observe(time.perf_counter() - started, endpoint_class=self.name)
+
+    def release(self):
+        self.concurrency.release()
+
+    def stats(self) -> Dict[str, float]:
+        return {"queued": self.queued, "in_flight": self.concurrency.in_flight,
+                "concurrency_limit": round(self.concurrency.limit, 2),
+                "rate": round(self.bucket.rate, 2) if self.bucket is not None else 0}
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """Response body that frees its concurrency slot once closed"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, release: Callable[[], None]):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._release is not None:
+                release, self._release = self._release, None
+                release()
+
+
+class ThrottledTransport(httpx.AsyncBaseTransport):
+    """Wraps a transport to rate limit, concurrency limit and retry requests"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, label: Callable[[httpx.Request], str]):
+        self._transport = transport
+        # Endpoint of a request, for its latency baseline
+        self._label = label
+        rates = {
+            "read": float(os.getenv("SKYSQL_API_RATE_READ", "20")),
+            "write": float(os.getenv("SKYSQL_API_RATE_WRITE", "5")),
+            "copilot": float(os.getenv("SKYSQL_API_RATE_COPILOT", "2")),
+        }
+        max_concurrency = int(os.getenv("SKYSQL_API_MAX_CONCURRENCY", "16"))
+        tolerance = float(os.getenv("SKYSQL_API_LATENCY_TOLERANCE", "2"))
+        self.limiters = {name: EndpointLimiter(name, rates[name], max_concurrency, tolerance)
+                         for name in ENDPOINT_CLASSES}
+        self.retries = int(os.getenv("SKYSQL_API_RETRIES", "3"))
+        self.max_retry_wait = float(os.getenv("SKYSQL_API_MAX_RETRY_WAIT", "30"))
+
+    def _retry_delay(self, request: httpx.Request, response: httpx.Response, attempt: int) -> Optional[float]:
+        """Seconds to wait before retrying, or None if the response should be returned"""
+        if response.status_code not in RETRY_STATUSES or attempt >= self.retries:
+            return None
+        if endpoint_class(request) == "copilot":
+            # copilot.chat retries these itself
+            return None
+        if response.status_code != 429 and request.method not in SAFE_METHODS:
+            return None
+        delay = retry_after(response)
+        if delay is None:
+            delay = 0.5 * 2 ** attempt * random.uniform(0.8, 1.2)
+        return delay if delay <= self.max_retry_wait else None
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        limiter = self.limiters[endpoint_class(request)]
+        attempt = 0
+        while True:
+            await limiter.admit()
+            started = time.monotonic()
+            try:
+                response = await self._transport.handle_async_request(request)
+            except BaseException:
+                limiter.release()
+                raise
+            throttled = response.status_code in (429, 503)
+            if limiter.concurrency.record(self._label(request), started, time.monotonic() - started, throttled):
+                logger.info(f"Lowered SkySQL API concurrency for {limiter.name} requests to "
+                            f"{int(limiter.concurrency.limit)}")
+            if throttled:
+                metrics.api_throttled.inc(endpoint_class=limiter.name, reason=str(response.status_code))
+            elif limiter.bucket is not None:
+                limiter.bucket.recover()
+
+            delay = self._retry_delay(request, response, attempt)
+            if response.status_code == 429 and limiter.bucket is not None:
+                # Holds back every request of the class; admit() waits it out
+                pause = delay if delay is not None else min(retry_after(response) or 0.0, self.max_retry_wait)
+                limiter.bucket.pause(pause, started)
+            if delay is None:
+                return httpx.Response(
+                    status_code=response.status_code,
+                    headers=response.headers,
+                    stream=_ReleasingStream(response.stream, limiter.release),
+                    extensions=response.extensions,
+                )
+            try:
+                await response.aclose()
+            finally:
+                limiter.release()
+            attempt += 1
+            metrics.api_retries.inc(endpoint_class=limiter.name, status=response.status_code)
+            logger.warning(f"SkySQL API answered {response.status_code} to {request.method} {request.url.path}, "
+                           f"retry {attempt}/{self.retries} in {delay:.1f} s")
+            if response.status_code != 429 or limiter.bucket is None:
+                await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {name: limiter.stats() for name, limiter in self.limiters.items()}
+
+    async def aclose(self):
+        await self._transport.aclose()